@@ -70,9 +70,12 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'swiftwind.core.middleware.ReadYourWritesMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'swiftwind.system_setup.middleware.CheckSetupDoneMiddleware',
+    # Uncomment to record request timings (viewable by staff at /core/performance/)
+    # 'swiftwind.core.middleware.PerformanceMiddleware',
 ]
 
 if 'test' in sys.argv:
@@ -112,6 +115,15 @@ DATABASES = {
     }
 }
 
+# Optionally send read-only views to a replica by setting the DATABASE_REPLICA_URL
+# environment variable (for testing this can be a second local database)
+if os.environ.get('DATABASE_REPLICA_URL'):
+    DATABASES['replica'] = dj_database_url.config('DATABASE_REPLICA_URL')
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+    SWIFTWIND_READ_REPLICA_ALIAS = 'replica'
+
+DATABASE_ROUTERS = ['swiftwind.utilities.routers.ReadReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/1.10/ref/settings/#auth-password-validators
@@ -163,6 +175,10 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 BROKER_URL = 'redis://localhost'
 
+if 'test' in sys.argv:
+    # Run tasks (such as sending the email outbox) synchronously during tests
+    CELERY_ALWAYS_EAGER = True
+
 # Django Bootstrap
 BOOTSTRAP3 = {
     'horizontal_label_class': 'col-sm-3 col-lg-2',
@@ -31,8 +31,8 @@ setup(
         'redis==2.10.5',
         'six',
         'python-dateutil',
+        'requests',
         'django-adminlte2>=0.1.5',
-        'schedule==0.5.0',
     ],
 )
 
@@ -0,0 +1,115 @@
+""" Streaming exports of the ledger and of housemate statements
+
+Rows are read using a server-side cursor, ``SWIFTWIND_EXPORT_CHUNK_SIZE``
+rows at a time, and written out as they arrive. Memory use therefore does
+not grow with the amount of history exported, and the first rows are sent
+before the query has been read in full.
+
+Each row is a single transaction leg. Amounts and running balances are
+signed for display (as per ``Account.sign``), and the running balance of
+each account is calculated by the database using a window function.
+"""
+import csv
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, router
+
+from hordak.models import Leg
+
+COLUMNS = (
+    'date',
+    'transaction_id',
+    'description',
+    'account_code',
+    'account',
+    'amount',
+    'currency',
+    'balance',
+)
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+# Account.sign
+SIGN = "CASE WHEN a.type IN ('AS', 'EX') THEN -1 ELSE 1 END"
+
+LEGS_SQL = """
+    SELECT
+        t.date,
+        t.id,
+        COALESCE(NULLIF(l.description, ''), t.description),
+        a.full_code,
+        a.name,
+        l.amount * {sign},
+        l.amount_currency,
+        SUM(l.amount) OVER (
+            PARTITION BY l.account_id, l.amount_currency
+            ORDER BY t.date, t.id, l.id
+        ) * {sign}
+    FROM hordak_leg l
+    INNER JOIN hordak_transaction t ON t.id = l.transaction_id
+    INNER JOIN hordak_account a ON a.id = l.account_id
+    {where}
+    ORDER BY t.date, t.id, l.id
+"""
+
+
+def _iterate(alias, sql, params):
+    chunk_size = settings.SWIFTWIND_EXPORT_CHUNK_SIZE
+    with connections[alias].chunked_cursor() as cursor:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                yield row
+
+
+def leg_rows(accounts=None):
+    """Iterate over the legs of the given accounts (or all accounts), in date order
+
+    Yields:
+        tuple: Values for each of ``COLUMNS``
+    """
+    # Pick the database now rather than once iteration starts, by which
+    # time we may no longer be within a replica_reads() block
+    alias = router.db_for_read(Leg)
+    if accounts is None:
+        return _iterate(alias, LEGS_SQL.format(sign=SIGN, where=''), [])
+    else:
+        account_ids = [account.pk for account in accounts]
+        return _iterate(alias, LEGS_SQL.format(sign=SIGN, where='WHERE l.account_id = ANY(%s)'), [account_ids])
+
+
+class Echo(object):
+    """A file-like object which returns what is written, for use with csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def as_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(COLUMNS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def as_jsonl(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(COLUMNS, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def render(rows, format):
+    """Render rows as lines of the given format ('csv' or 'jsonl')"""
+    if format == 'csv':
+        return as_csv(rows)
+    elif format == 'jsonl':
+        return as_jsonl(rows)
+    else:
+        raise ValueError('Unknown export format: {}'.format(format))
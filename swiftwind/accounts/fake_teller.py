@@ -0,0 +1,125 @@
+""" A local fake of the teller.io transactions API
+
+Serves ``/accounts/<uuid>/transactions`` (with teller.io's ``count`` and
+``from_id`` paging) from a list of transactions, which can be loaded from a
+recorded fixture or generated. Point ``SWIFTWIND_TELLERIO_API_URL`` at the
+server to run imports offline, such as when testing or load testing::
+
+    with FakeTellerServer(generate_transactions(10000)) as server:
+        with override_settings(SWIFTWIND_TELLERIO_API_URL=server.url):
+            tellerio.do_import(...)
+
+Also available as the ``fake_teller_server`` management command.
+"""
+import json
+import random
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+def load_fixture(path):
+    """Load recorded teller.io transactions from a JSON file"""
+    with open(path) as f:
+        return json.load(f)
+
+
+def generate_transactions(count, end_date=None, seed=1):
+    """Generate `count` transactions in teller.io's format, newest first
+
+    Transactions are spread over the days before `end_date`, a few per day.
+    """
+    rng = random.Random(seed)
+    end_date = end_date or date.today()
+    transactions = []
+    for n in range(count, 0, -1):
+        is_payment = rng.random() < 0.2
+        amount = rng.randint(500, 200000) if is_payment else -rng.randint(100, 20000)
+        transactions.append({
+            'id': '{:032x}'.format(rng.getrandbits(128)),
+            'date': str(end_date - timedelta(days=(count - n) // 3)),
+            'amount': '{:.2f}'.format(amount / 100),
+            'counterparty': 'Housemate {}'.format(rng.randint(1, 10)) if is_payment else 'Shop {}'.format(rng.randint(1, 100)),
+            'description': 'Bank transfer' if is_payment else 'Card payment {}'.format(rng.randint(1000, 9999)),
+            'type': 'transfer' if is_payment else 'card_payment',
+            'running_balance': None,
+        })
+    return transactions
+
+
+class FakeTellerServer(object):
+    """Serve transactions (newest first) as teller.io would, from a background thread
+
+    Args:
+        transactions (list): Transactions to serve, newest first
+        latency (float): Seconds to wait before responding to each request
+        port (int): Port to listen upon. By default any free port is used
+    """
+
+    def __init__(self, transactions, latency=0, host='127.0.0.1', port=0):
+        self.transactions = transactions
+        self.latency = latency
+        self.requests = []
+        self.server = HTTPServer((host, port), self.get_handler())
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def get_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                fake.requests.append(self.path)
+                parts = url.path.strip('/').split('/')
+                if len(parts) != 3 or parts[0] != 'accounts' or parts[2] != 'transactions':
+                    return self.send_json(404, {'error': 'Not found'})
+                if not self.headers.get('Authorization', '').startswith('Bearer '):
+                    return self.send_json(401, {'error': 'Missing token'})
+
+                params = parse_qs(url.query)
+                count = int(params.get('count', [len(fake.transactions)])[0])
+                start = 0
+                if 'from_id' in params:
+                    ids = [transaction['id'] for transaction in fake.transactions]
+                    start = ids.index(params['from_id'][0]) + 1
+
+                if fake.latency:
+                    time.sleep(fake.latency)
+                self.send_json(200, fake.transactions[start:start + count])
+
+            def send_json(self, status, data):
+                body = json.dumps(data).encode('utf8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
@@ -0,0 +1,92 @@
+""" Form fields for choosing accounts
+
+Hordak labels each account with its balance, which requires a query per
+account, and a ``ModelChoiceField`` queries its choices each time it is
+rendered. A page with many account fields (such as the costs formsets)
+would therefore query the whole chart of accounts, and every account's
+balance, for each field.
+
+:class:`AccountChoiceField` labels accounts by code & name only, and its
+choices can be calculated once and shared between many fields (see
+``AccountChoiceField.share_choices()``). When also given the id of a
+``<select>`` rendered elsewhere on the page, each field renders only its
+selected option, and its remaining options are copied from that
+``<select>`` by ``core/js/shared-choices.js``.
+"""
+from django import forms
+from django.utils.html import conditional_escape, mark_safe
+from mptt.forms import TreeNodeChoiceField
+
+from hordak.models import Account
+
+
+def account_label(account):
+    if account.full_code:
+        return '{} {}'.format(account.full_code, account.name)
+    else:
+        return account.name
+
+
+class SharedChoicesSelect(forms.Select):
+    """A select which copies its options from another ``<select>`` upon the page
+
+    Only the selected option is rendered, so the field keeps its current
+    value should javascript be unavailable.
+
+    Args:
+        source_id (str): The id of the ``<select>`` to copy options from
+    """
+
+    def __init__(self, source_id, attrs=None, choices=()):
+        attrs = dict(attrs or {})
+        attrs['data-choices-from'] = source_id
+        super(SharedChoicesSelect, self).__init__(attrs, choices)
+
+    def optgroups(self, name, value, attrs=None):
+        groups = []
+        for group_name, options, index in super(SharedChoicesSelect, self).optgroups(name, value, attrs):
+            options = [option for option in options if option['selected']]
+            if options:
+                groups.append((group_name, options, index))
+        return groups
+
+
+class AccountChoiceField(TreeNodeChoiceField):
+    """Choose an account, by uuid
+
+    Args:
+        queryset (QuerySet): Accounts to choose from. Defaults to all accounts
+    """
+
+    def __init__(self, queryset=None, *args, **kwargs):
+        kwargs.setdefault('to_field_name', 'uuid')
+        if queryset is None:
+            queryset = Account.objects.all()
+        super(AccountChoiceField, self).__init__(queryset, *args, **kwargs)
+
+    def label_from_instance(self, obj):
+        return mark_safe(self._get_level_indicator(obj) + ' ' + conditional_escape(account_label(obj)))
+
+    def get_choices(self):
+        """Calculate this field's choices, for use with share_choices()"""
+        # Not list(), which would call ModelChoiceIterator.__len__() and
+        # so query the accounts once for the length and again to iterate
+        return [choice for choice in self.choices]
+
+    def share_choices(self, choices, source_id=None):
+        """Use choices which have already been calculated, rather than querying them
+
+        Args:
+            choices (list): As returned by ``get_choices()``
+            source_id (str): If given, render using a :class:`SharedChoicesSelect`
+                             which copies its options from the ``<select>`` with this id
+        """
+        if source_id:
+            self.widget = SharedChoicesSelect(source_id, attrs=self.widget.attrs)
+        self.choices = choices
+
+    def render_source(self, source_id):
+        """Render the ``<select>`` which shared selects copy their options from"""
+        return forms.Select(choices=self.choices).render(
+            name='', value=None, attrs={'id': source_id, 'hidden': True, 'disabled': True},
+        )
@@ -0,0 +1,359 @@
+""" Bulk import of historical transactions, for households moving to swiftwind
+
+History is read from a CSV file with the columns ``date, description,
+from_account, to_account, amount, currency``. Each row becomes a single
+transaction, created as per ``Account.transfer_to(to_account, amount)``.
+Accounts may be given by their full account code, by a housemate's username,
+or by (an unambiguous) account name. The currency may be left blank, in which
+case the default currency is used. Only the date, accounts and amount are
+required.
+
+Rows are validated as they are read, and written to temporary files in
+``COPY`` format. Every ``SWIFTWIND_HISTORY_IMPORT_BATCH_SIZE`` rows the files
+are copied into temporary staging tables, from which the transactions and
+legs are inserted with one statement each.
+
+The per-row triggers upon hordak's leg table are disabled for the duration
+of the import. Their checks (that each transaction's legs sum to zero, and
+that each leg's currency is supported by its account) are instead made once
+per batch, as are their effects (the materialized balances, checkpoints and
+statement snapshots). Disabling the triggers locks the leg table against
+writes until the import completes.
+
+Postgres will not alter a table which has pending trigger events, such as
+the deferred foreign key checks queued by inserting legs. These are
+therefore flushed (with ``SET CONSTRAINTS ALL IMMEDIATE``) before the
+triggers are disabled or enabled.
+
+Any invalid row aborts the entire import, and nothing is written.
+"""
+import csv
+import tempfile
+import uuid
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from hordak.models import Account
+from swiftwind.housemates.models import Housemate
+
+COLUMNS = ('date', 'description', 'from_account', 'to_account', 'amount', 'currency')
+REQUIRED_COLUMNS = ('date', 'from_account', 'to_account', 'amount')
+
+# Triggers upon hordak_leg which are replaced by set-based equivalents during the import
+LEG_TRIGGERS = (
+    'check_leg_trigger',
+    'check_leg_and_account_currency_match_trigger',
+    'update_account_balance_trigger',
+    'update_account_balance_checkpoints_for_leg_trigger',
+    'invalidate_statement_snapshots_for_leg_trigger',
+)
+
+# Largest amount which fits within hordak's DECIMAL(13, 2)
+MAX_AMOUNT = Decimal('99999999999.99')
+
+
+class InvalidHistory(Exception):
+    """One or more rows could not be imported
+
+    Attributes:
+        errors (list): (line number, message) tuples
+    """
+
+    def __init__(self, errors):
+        self.errors = errors
+        super(InvalidHistory, self).__init__(
+            '\n'.join('Line {}: {}'.format(line_number, message) for line_number, message in errors)
+        )
+
+
+def transfer_direction(from_account, to_account):
+    """The direction used by ``from_account.transfer_to(to_account, ...)``"""
+    if to_account.sign == 1 and to_account.type != Account.TYPES.trading:
+        return -1
+    elif from_account.type == Account.TYPES.liability and to_account.type == Account.TYPES.expense:
+        return -1
+    else:
+        return 1
+
+
+class AccountResolver(object):
+    """Find accounts by full account code, housemate username, or name"""
+
+    def __init__(self):
+        self.by_code = {}
+        self.by_name = {}
+        for account in Account.objects.all():
+            if account.full_code:
+                self.by_code[account.full_code] = account
+            self.by_name.setdefault(account.name, []).append(account)
+        self.by_username = {
+            housemate.user.username: housemate.account
+            for housemate in Housemate.objects.filter(user__isnull=False).select_related('user', 'account')
+        }
+
+    def resolve(self, value):
+        if value in self.by_code:
+            return self.by_code[value]
+        if value in self.by_username:
+            return self.by_username[value]
+        accounts = self.by_name.get(value, [])
+        if len(accounts) > 1:
+            raise ValueError('More than one account is named "{}", use its account code instead'.format(value))
+        elif not accounts:
+            raise ValueError('No account or housemate "{}"'.format(value))
+        return accounts[0]
+
+
+def parse_row(row, resolver, default_currency):
+    """Validate a CSV row
+
+    Returns:
+        tuple: (date, description, from_account, to_account, amount, currency)
+
+    Raises:
+        ValueError: If the row is invalid
+    """
+    missing = [column for column in REQUIRED_COLUMNS if not (row.get(column) or '').strip()]
+    if missing:
+        raise ValueError('Missing {}'.format(', '.join(missing)))
+
+    try:
+        row_date = parse_date(row['date'].strip())
+    except ValueError:
+        row_date = None
+    if not row_date:
+        raise ValueError('Invalid date "{}", dates should be in the form YYYY-MM-DD'.format(row['date']))
+
+    try:
+        amount = Decimal(row['amount'].strip())
+    except InvalidOperation:
+        raise ValueError('Invalid amount "{}"'.format(row['amount']))
+    if not amount.is_finite() or amount <= 0:
+        raise ValueError('Amount must be greater than zero')
+    if amount > MAX_AMOUNT:
+        raise ValueError('Amount "{}" is too large'.format(row['amount']))
+    if amount.as_tuple().exponent < -2:
+        raise ValueError('Amount "{}" has more than two decimal places'.format(row['amount']))
+
+    from_account = resolver.resolve(row['from_account'].strip())
+    to_account = resolver.resolve(row['to_account'].strip())
+    if from_account == to_account:
+        raise ValueError('Cannot transfer from an account to itself')
+
+    currency = (row.get('currency') or '').strip().upper() or default_currency
+    for account in (from_account, to_account):
+        if currency not in account.currencies:
+            raise ValueError('Account "{}" does not support currency {}'.format(account.name, currency))
+
+    return row_date, (row.get('description') or '').strip(), from_account, to_account, amount, currency
+
+
+class Batch(object):
+    """Rows waiting to be copied into the staging tables"""
+
+    def __init__(self):
+        self.size = 0
+        self.transactions = tempfile.SpooledTemporaryFile(mode='w+', newline='')
+        self.legs = tempfile.SpooledTemporaryFile(mode='w+', newline='')
+        self.transaction_writer = csv.writer(self.transactions)
+        self.leg_writer = csv.writer(self.legs)
+
+    def add(self, line_number, row_date, description, from_account, to_account, amount, currency):
+        amount = amount * transfer_direction(from_account, to_account)
+        self.transaction_writer.writerow((line_number, uuid.uuid4(), row_date.isoformat(), description))
+        # As per Account.transfer_to()
+        self.leg_writer.writerow((line_number, uuid.uuid4(), from_account.pk, amount, currency))
+        self.leg_writer.writerow((line_number, uuid.uuid4(), to_account.pk, -amount, currency))
+        self.size += 1
+
+    def close(self):
+        self.transactions.close()
+        self.legs.close()
+
+
+def create_staging_tables(cursor):
+    cursor.execute("""
+        CREATE TEMPORARY TABLE IF NOT EXISTS swiftwind_staging_transaction (
+            line_number INTEGER PRIMARY KEY,
+            uuid UUID NOT NULL,
+            date DATE NOT NULL,
+            description TEXT NOT NULL
+        ) ON COMMIT DROP
+    """)
+    cursor.execute("""
+        CREATE TEMPORARY TABLE IF NOT EXISTS swiftwind_staging_leg (
+            line_number INTEGER NOT NULL,
+            uuid UUID NOT NULL,
+            account_id INTEGER NOT NULL,
+            amount DECIMAL(13, 2) NOT NULL,
+            currency VARCHAR(3) NOT NULL
+        ) ON COMMIT DROP
+    """)
+
+
+def set_leg_triggers(cursor, enabled):
+    """Enable or disable the LEG_TRIGGERS"""
+    # Flush any pending trigger events, then defer constraints again for the remainder of the
+    # transaction. Django's foreign keys & hordak's check triggers are all INITIALLY DEFERRED
+    cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+    for trigger in LEG_TRIGGERS:
+        cursor.execute('ALTER TABLE hordak_leg {} TRIGGER {}'.format('ENABLE' if enabled else 'DISABLE', trigger))
+    cursor.execute('SET CONSTRAINTS ALL DEFERRED')
+
+
+def check_batch(cursor):
+    """Make the checks of hordak's leg triggers, for the legs of this batch"""
+    errors = []
+    cursor.execute("""
+        SELECT line_number FROM swiftwind_staging_leg
+        GROUP BY line_number
+        HAVING SUM(amount) != 0
+        ORDER BY line_number
+    """)
+    errors.extend((line_number, 'Sum of transaction amounts must be 0') for line_number, in cursor.fetchall())
+
+    cursor.execute("""
+        SELECT L.line_number, L.currency FROM swiftwind_staging_leg L
+        INNER JOIN hordak_account A ON A.id = L.account_id
+        WHERE NOT L.currency = ANY(A.currencies)
+        ORDER BY L.line_number
+    """)
+    errors.extend(
+        (line_number, 'Account does not support currency {}'.format(currency))
+        for line_number, currency in cursor.fetchall()
+    )
+    if errors:
+        raise InvalidHistory(errors)
+
+
+def insert_batch(cursor, batch, timestamp):
+    """Copy the batch into the staging tables, and from there into hordak's tables"""
+    cursor.execute('TRUNCATE swiftwind_staging_transaction, swiftwind_staging_leg')
+    batch.transactions.seek(0)
+    batch.legs.seek(0)
+    # Blank descriptions would otherwise be read as NULL
+    cursor.copy_expert(
+        'COPY swiftwind_staging_transaction FROM STDIN WITH (FORMAT csv, FORCE_NOT_NULL (description))',
+        batch.transactions,
+    )
+    cursor.copy_expert('COPY swiftwind_staging_leg FROM STDIN WITH (FORMAT csv)', batch.legs)
+    check_batch(cursor)
+
+    cursor.execute("""
+        INSERT INTO hordak_transaction (uuid, timestamp, date, description)
+        SELECT uuid, %s, date, description FROM swiftwind_staging_transaction
+        ORDER BY line_number
+    """, [timestamp])
+    cursor.execute("""
+        INSERT INTO hordak_leg (uuid, transaction_id, account_id, amount, amount_currency, description)
+        SELECT L.uuid, T.id, L.account_id, L.amount, L.currency, ''
+        FROM swiftwind_staging_leg L
+        INNER JOIN swiftwind_staging_transaction ST ON ST.line_number = L.line_number
+        INNER JOIN hordak_transaction T ON T.uuid = ST.uuid
+        ORDER BY L.line_number
+    """)
+
+    # The effects of update_account_balance_trigger (migration 0008)
+    cursor.execute("""
+        INSERT INTO accounts_accountbalance (account_id, currency, amount, version)
+        SELECT account_id, currency, SUM(amount), 1
+        FROM swiftwind_staging_leg
+        GROUP BY account_id, currency
+        ON CONFLICT (account_id, currency)
+        DO UPDATE SET
+            amount = accounts_accountbalance.amount + EXCLUDED.amount,
+            version = accounts_accountbalance.version + 1
+    """)
+    # ...of update_account_balance_checkpoints_for_leg_trigger (migration 0004)
+    cursor.execute("""
+        INSERT INTO accounts_accountbalancecheckpoint (account_id, billing_cycle_id, currency, amount)
+        SELECT L.account_id, BC.id, L.currency, SUM(L.amount)
+        FROM swiftwind_staging_leg L
+        INNER JOIN swiftwind_staging_transaction T ON T.line_number = L.line_number
+        INNER JOIN billing_cycle_billingcycle BC ON BC.balances_checkpointed AND upper(BC.date_range) > T.date
+        GROUP BY L.account_id, BC.id, L.currency
+        ON CONFLICT (account_id, billing_cycle_id, currency)
+        DO UPDATE SET amount = accounts_accountbalancecheckpoint.amount + EXCLUDED.amount
+    """)
+    # ...and of invalidate_statement_snapshots_for_leg_trigger (migration 0007)
+    cursor.execute("""
+        DELETE FROM accounts_statementsnapshot S
+            USING housemates_housemate H, billing_cycle_billingcycle BC, (
+                SELECT L.account_id, MIN(T.date) AS date
+                FROM swiftwind_staging_leg L
+                INNER JOIN swiftwind_staging_transaction T ON T.line_number = L.line_number
+                GROUP BY L.account_id
+            ) A
+            WHERE S.housemate_id = H.id
+            AND S.billing_cycle_id = BC.id
+            AND H.account_id = A.account_id
+            AND upper(BC.date_range) > A.date
+    """)
+
+
+@transaction.atomic()
+def import_history(lines, default_currency, batch_size=None, dry_run=False):
+    """Import historical transactions from CSV
+
+    Args:
+        lines (iterable): Lines of CSV, including the header row
+        default_currency (str): Currency for rows which do not specify one
+        batch_size (int): Rows per batch. Defaults to ``SWIFTWIND_HISTORY_IMPORT_BATCH_SIZE``
+        dry_run (bool): Only validate the rows
+
+    Returns:
+        int: The number of transactions imported (or which would have been imported)
+
+    Raises:
+        InvalidHistory: If any row is invalid. Nothing will have been imported.
+    """
+    batch_size = batch_size or settings.SWIFTWIND_HISTORY_IMPORT_BATCH_SIZE
+    reader = csv.DictReader(lines)
+    missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or [])]
+    if missing:
+        raise InvalidHistory([(1, 'Missing column(s): {}'.format(', '.join(missing)))])
+
+    resolver = AccountResolver()
+    timestamp = timezone.now()
+    errors = []
+    imported = 0
+
+    with connection.cursor() as cursor:
+        if not dry_run:
+            create_staging_tables(cursor)
+            set_leg_triggers(cursor, enabled=False)
+
+        batch = Batch()
+        try:
+            for row in reader:
+                try:
+                    parsed = parse_row(row, resolver, default_currency)
+                except ValueError as e:
+                    errors.append((reader.line_num, str(e)))
+                    continue
+                imported += 1
+                if dry_run or errors:
+                    # Keep validating so that all errors are reported, but there is no point writing anything
+                    continue
+
+                batch.add(reader.line_num, *parsed)
+                if batch.size >= batch_size:
+                    insert_batch(cursor, batch, timestamp)
+                    batch.close()
+                    batch = Batch()
+
+            if errors:
+                raise InvalidHistory(errors)
+            if batch.size and not dry_run:
+                insert_batch(cursor, batch, timestamp)
+        finally:
+            batch.close()
+
+        if not dry_run:
+            set_leg_triggers(cursor, enabled=True)
+
+    return imported
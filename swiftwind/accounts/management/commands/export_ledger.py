@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from swiftwind.accounts import exports
+from swiftwind.housemates.models import Housemate
+
+
+class Command(BaseCommand):
+    help = 'Export every transaction leg, with running balances. Rows are streamed, ' \
+           'so exports of any size use little memory.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', dest='format', choices=sorted(exports.FORMATS), default='csv')
+        parser.add_argument('--housemate', dest='housemate',
+                            help='Only export the statement history of the housemate with this username.')
+        parser.add_argument('--output', dest='output', help='Write to this file rather than stdout.')
+
+    def handle(self, *args, **options):
+        accounts = None
+        if options['housemate']:
+            try:
+                housemate = Housemate.objects.select_related('account').get(user__username=options['housemate'])
+            except Housemate.DoesNotExist:
+                raise CommandError('No housemate with username {}'.format(options['housemate']))
+            accounts = [housemate.account]
+
+        lines = exports.render(exports.leg_rows(accounts), options['format'])
+        if options['output']:
+            with open(options['output'], 'w', newline='') as f:
+                f.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
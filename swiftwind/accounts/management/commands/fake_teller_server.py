@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from swiftwind.accounts.fake_teller import FakeTellerServer, generate_transactions, load_fixture
+
+
+class Command(BaseCommand):
+    help = 'Serve a fake teller.io API locally, for testing imports offline. ' \
+           'Set SWIFTWIND_TELLERIO_API_URL to the URL shown.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', dest='port', type=int, default=8001)
+        parser.add_argument('--fixture', dest='fixture',
+                            help='JSON file of recorded teller.io transactions to serve (newest first).')
+        parser.add_argument('--transactions', dest='transactions', type=int, default=1000,
+                            help='Number of transactions to generate, if no fixture is given.')
+        parser.add_argument('--seed', dest='seed', type=int, default=1)
+        parser.add_argument('--latency', dest='latency', type=float, default=0,
+                            help='Seconds to wait before responding to each request.')
+
+    def handle(self, *args, **options):
+        if options['fixture']:
+            transactions = load_fixture(options['fixture'])
+        else:
+            transactions = generate_transactions(options['transactions'], seed=options['seed'])
+
+        server = FakeTellerServer(transactions, latency=options['latency'], port=options['port'])
+        self.stdout.write('Serving {} transactions at {}'.format(len(transactions), server.url))
+        try:
+            server.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server.server_close()
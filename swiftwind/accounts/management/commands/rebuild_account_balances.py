@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from swiftwind.accounts.models import AccountBalance
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the stored account balances from the transaction legs, or verify them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', dest='verify', default=False, action='store_true',
+            help='Only check the stored balances against the transaction legs. Exits with an error '
+                 'if any discrepancies are found.',
+        )
+
+    def handle(self, *args, **options):
+        if not options.get('verify'):
+            AccountBalance.objects.rebuild()
+            self.stdout.write('Account balances rebuilt')
+
+        discrepancies = AccountBalance.objects.verify()
+        for account_id, currency, stored, actual in discrepancies:
+            self.stderr.write(
+                'Account {} ({}): stored balance is {}, should be {}'.format(account_id, currency, stored, actual)
+            )
+
+        if discrepancies:
+            raise CommandError('{} account balances are incorrect'.format(len(discrepancies)))
+        self.stdout.write('Account balances verified')
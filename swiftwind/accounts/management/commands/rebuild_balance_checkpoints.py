@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from swiftwind.accounts.models import AccountBalanceCheckpoint
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the account balance checkpoints for all completed billing cycles, or verify them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', dest='verify', default=False, action='store_true',
+            help='Only check the stored checkpoints against the transaction legs. Exits with an error '
+                 'if any discrepancies are found.',
+        )
+
+    def handle(self, *args, **options):
+        if not options.get('verify'):
+            AccountBalanceCheckpoint.objects.rebuild()
+            self.stdout.write('Balance checkpoints rebuilt')
+
+        discrepancies = AccountBalanceCheckpoint.objects.verify()
+        for billing_cycle_id, account_id, currency, stored, actual in discrepancies:
+            self.stderr.write(
+                'Billing cycle {}, account {} ({}): stored balance is {}, should be {}'.format(
+                    billing_cycle_id, account_id, currency, stored, actual
+                )
+            )
+
+        if discrepancies:
+            raise CommandError('{} balance checkpoints are incorrect'.format(len(discrepancies)))
+        self.stdout.write('Balance checkpoints verified')
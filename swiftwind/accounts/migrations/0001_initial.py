@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('hordak', '0020_auto_20171205_1424'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountBalance',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(max_length=3)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=13)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cached_balances', to='hordak.Account')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='accountbalance',
+            unique_together=set([('account', 'currency')]),
+        ),
+    ]
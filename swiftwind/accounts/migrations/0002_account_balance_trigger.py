@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            """
+            CREATE OR REPLACE FUNCTION update_account_balance()
+                RETURNS trigger AS
+            $$
+            BEGIN
+                IF TG_OP = 'DELETE' OR TG_OP = 'UPDATE' THEN
+                    UPDATE accounts_accountbalance
+                        SET amount = amount - OLD.amount
+                        WHERE account_id = OLD.account_id AND currency = OLD.amount_currency;
+                END IF;
+
+                IF TG_OP = 'INSERT' OR TG_OP = 'UPDATE' THEN
+                    INSERT INTO accounts_accountbalance (account_id, currency, amount)
+                        VALUES (NEW.account_id, NEW.amount_currency, NEW.amount)
+                        ON CONFLICT (account_id, currency)
+                        DO UPDATE SET amount = accounts_accountbalance.amount + EXCLUDED.amount;
+                END IF;
+
+                RETURN NULL;
+            END;
+            $$
+            LANGUAGE plpgsql;
+            """,
+            "DROP FUNCTION update_account_balance()"
+        ),
+        migrations.RunSQL(
+            """
+            CREATE TRIGGER update_account_balance_trigger
+            AFTER INSERT OR UPDATE OF amount, amount_currency, account_id OR DELETE ON hordak_leg
+            FOR EACH ROW EXECUTE PROCEDURE update_account_balance()
+            """,
+            "DROP TRIGGER update_account_balance_trigger ON hordak_leg"
+        ),
+        migrations.RunSQL(
+            # Populate balances for any existing data
+            """
+            INSERT INTO accounts_accountbalance (account_id, currency, amount)
+            SELECT account_id, amount_currency, SUM(amount)
+            FROM hordak_leg
+            GROUP BY account_id, amount_currency
+            """,
+            "DELETE FROM accounts_accountbalance"
+        ),
+    ]
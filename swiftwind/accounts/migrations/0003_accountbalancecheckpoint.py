@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hordak', '0020_auto_20171205_1424'),
+        ('billing_cycle', '0007_billingcycle_balances_checkpointed'),
+        ('accounts', '0002_account_balance_trigger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountBalanceCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(max_length=3)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=13)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_checkpoints', to='hordak.Account')),
+                ('billing_cycle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_checkpoints', to='billing_cycle.BillingCycle')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='accountbalancecheckpoint',
+            unique_together=set([('account', 'billing_cycle', 'currency')]),
+        ),
+    ]
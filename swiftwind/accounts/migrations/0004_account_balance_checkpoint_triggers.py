@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_accountbalancecheckpoint'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            """
+            CREATE OR REPLACE FUNCTION update_account_balance_checkpoints_for_leg()
+                RETURNS trigger AS
+            $$
+            DECLARE
+                transaction_date DATE;
+            BEGIN
+                IF TG_OP = 'DELETE' OR TG_OP = 'UPDATE' THEN
+                    SELECT date INTO transaction_date FROM hordak_transaction WHERE id = OLD.transaction_id;
+
+                    UPDATE accounts_accountbalancecheckpoint C
+                        SET amount = C.amount - OLD.amount
+                        FROM billing_cycle_billingcycle BC
+                        WHERE C.billing_cycle_id = BC.id
+                        AND C.account_id = OLD.account_id
+                        AND C.currency = OLD.amount_currency
+                        AND upper(BC.date_range) > transaction_date;
+                END IF;
+
+                IF TG_OP = 'INSERT' OR TG_OP = 'UPDATE' THEN
+                    SELECT date INTO transaction_date FROM hordak_transaction WHERE id = NEW.transaction_id;
+
+                    INSERT INTO accounts_accountbalancecheckpoint (account_id, billing_cycle_id, currency, amount)
+                        SELECT NEW.account_id, BC.id, NEW.amount_currency, NEW.amount
+                        FROM billing_cycle_billingcycle BC
+                        WHERE BC.balances_checkpointed AND upper(BC.date_range) > transaction_date
+                        ON CONFLICT (account_id, billing_cycle_id, currency)
+                        DO UPDATE SET amount = accounts_accountbalancecheckpoint.amount + EXCLUDED.amount;
+                END IF;
+
+                RETURN NULL;
+            END;
+            $$
+            LANGUAGE plpgsql;
+            """,
+            "DROP FUNCTION update_account_balance_checkpoints_for_leg()"
+        ),
+        migrations.RunSQL(
+            """
+            CREATE TRIGGER update_account_balance_checkpoints_for_leg_trigger
+            AFTER INSERT OR UPDATE OF amount, amount_currency, account_id, transaction_id OR DELETE ON hordak_leg
+            FOR EACH ROW EXECUTE PROCEDURE update_account_balance_checkpoints_for_leg()
+            """,
+            "DROP TRIGGER update_account_balance_checkpoints_for_leg_trigger ON hordak_leg"
+        ),
+        migrations.RunSQL(
+            # Moving a transaction to another date moves its legs into or out of
+            # the checkpoints of any billing cycles which end between the two dates
+            """
+            CREATE OR REPLACE FUNCTION update_account_balance_checkpoints_for_transaction()
+                RETURNS trigger AS
+            $$
+            BEGIN
+                INSERT INTO accounts_accountbalancecheckpoint (account_id, billing_cycle_id, currency, amount)
+                    SELECT
+                        L.account_id,
+                        BC.id,
+                        L.amount_currency,
+                        SUM(L.amount) * (CASE WHEN NEW.date > OLD.date THEN -1 ELSE 1 END)
+                    FROM hordak_leg L
+                    INNER JOIN billing_cycle_billingcycle BC
+                        ON BC.balances_checkpointed
+                        AND upper(BC.date_range) > LEAST(OLD.date, NEW.date)
+                        AND upper(BC.date_range) <= GREATEST(OLD.date, NEW.date)
+                    WHERE L.transaction_id = NEW.id
+                    GROUP BY L.account_id, BC.id, L.amount_currency
+                    ON CONFLICT (account_id, billing_cycle_id, currency)
+                    DO UPDATE SET amount = accounts_accountbalancecheckpoint.amount + EXCLUDED.amount;
+
+                RETURN NULL;
+            END;
+            $$
+            LANGUAGE plpgsql;
+            """,
+            "DROP FUNCTION update_account_balance_checkpoints_for_transaction()"
+        ),
+        migrations.RunSQL(
+            """
+            CREATE TRIGGER update_account_balance_checkpoints_for_transaction_trigger
+            AFTER UPDATE OF date ON hordak_transaction
+            FOR EACH ROW
+            WHEN (OLD.date IS DISTINCT FROM NEW.date)
+            EXECUTE PROCEDURE update_account_balance_checkpoints_for_transaction()
+            """,
+            "DROP TRIGGER update_account_balance_checkpoints_for_transaction_trigger ON hordak_transaction"
+        ),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_account_balance_checkpoint_triggers'),
+    ]
+
+    operations = [
+        # Supports per-account aggregation over legs & their transaction dates
+        # (i.e. the accounts overview). Postgres cannot index across the two
+        # tables, so the leg index finds an account's transactions and the
+        # transaction index provides their dates without visiting the table.
+        migrations.RunSQL(
+            "CREATE INDEX IF NOT EXISTS accounts_leg_account_transaction_idx "
+            "ON hordak_leg (account_id, transaction_id)",
+            "DROP INDEX IF EXISTS accounts_leg_account_transaction_idx"
+        ),
+        migrations.RunSQL(
+            "CREATE INDEX IF NOT EXISTS accounts_transaction_id_date_idx "
+            "ON hordak_transaction (id, date)",
+            "DROP INDEX IF EXISTS accounts_transaction_id_date_idx"
+        ),
+    ]
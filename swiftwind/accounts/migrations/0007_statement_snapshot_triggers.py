@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_statementsnapshot'),
+    ]
+
+    operations = [
+        # A leg affects the statements of its account's housemate for any billing
+        # cycle ending after the leg's transaction date (via either the line items
+        # or the opening/closing balances). If the transaction no longer
+        # exists we cannot know its date, so remove all the housemate's snapshots.
+        migrations.RunSQL(
+            """
+            CREATE OR REPLACE FUNCTION invalidate_statement_snapshots_for_leg()
+                RETURNS trigger AS
+            $$
+            BEGIN
+                IF TG_OP = 'DELETE' OR TG_OP = 'UPDATE' THEN
+                    DELETE FROM accounts_statementsnapshot S
+                        USING housemates_housemate H, billing_cycle_billingcycle BC
+                        WHERE S.housemate_id = H.id
+                        AND S.billing_cycle_id = BC.id
+                        AND H.account_id = OLD.account_id
+                        AND upper(BC.date_range) > COALESCE(
+                            (SELECT date FROM hordak_transaction WHERE id = OLD.transaction_id),
+                            '-infinity'::date
+                        );
+                END IF;
+
+                IF TG_OP = 'INSERT' OR TG_OP = 'UPDATE' THEN
+                    DELETE FROM accounts_statementsnapshot S
+                        USING housemates_housemate H, billing_cycle_billingcycle BC
+                        WHERE S.housemate_id = H.id
+                        AND S.billing_cycle_id = BC.id
+                        AND H.account_id = NEW.account_id
+                        AND upper(BC.date_range) > COALESCE(
+                            (SELECT date FROM hordak_transaction WHERE id = NEW.transaction_id),
+                            '-infinity'::date
+                        );
+                END IF;
+
+                RETURN NULL;
+            END;
+            $$
+            LANGUAGE plpgsql;
+            """,
+            "DROP FUNCTION invalidate_statement_snapshots_for_leg()"
+        ),
+        migrations.RunSQL(
+            """
+            CREATE TRIGGER invalidate_statement_snapshots_for_leg_trigger
+            AFTER INSERT OR UPDATE OR DELETE ON hordak_leg
+            FOR EACH ROW EXECUTE PROCEDURE invalidate_statement_snapshots_for_leg()
+            """,
+            "DROP TRIGGER invalidate_statement_snapshots_for_leg_trigger ON hordak_leg"
+        ),
+        migrations.RunSQL(
+            """
+            CREATE OR REPLACE FUNCTION invalidate_statement_snapshots_for_transaction()
+                RETURNS trigger AS
+            $$
+            BEGIN
+                DELETE FROM accounts_statementsnapshot S
+                    USING housemates_housemate H, billing_cycle_billingcycle BC
+                    WHERE S.housemate_id = H.id
+                    AND S.billing_cycle_id = BC.id
+                    AND H.account_id IN (SELECT account_id FROM hordak_leg WHERE transaction_id = NEW.id)
+                    AND upper(BC.date_range) > LEAST(OLD.date, NEW.date);
+
+                RETURN NULL;
+            END;
+            $$
+            LANGUAGE plpgsql;
+            """,
+            "DROP FUNCTION invalidate_statement_snapshots_for_transaction()"
+        ),
+        migrations.RunSQL(
+            """
+            CREATE TRIGGER invalidate_statement_snapshots_for_transaction_trigger
+            AFTER UPDATE OF date, description ON hordak_transaction
+            FOR EACH ROW
+            EXECUTE PROCEDURE invalidate_statement_snapshots_for_transaction()
+            """,
+            "DROP TRIGGER invalidate_statement_snapshots_for_transaction_trigger ON hordak_transaction"
+        ),
+    ]
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+UPDATE_ACCOUNT_BALANCE = """
+    CREATE OR REPLACE FUNCTION update_account_balance()
+        RETURNS trigger AS
+    $$
+    BEGIN
+        IF TG_OP = 'DELETE' OR TG_OP = 'UPDATE' THEN
+            UPDATE accounts_accountbalance
+                SET amount = amount - OLD.amount{old_version}
+                WHERE account_id = OLD.account_id AND currency = OLD.amount_currency;
+        END IF;
+
+        IF TG_OP = 'INSERT' OR TG_OP = 'UPDATE' THEN
+            INSERT INTO accounts_accountbalance (account_id, currency, amount{insert_columns})
+                VALUES (NEW.account_id, NEW.amount_currency, NEW.amount{insert_values})
+                ON CONFLICT (account_id, currency)
+                DO UPDATE SET amount = accounts_accountbalance.amount + EXCLUDED.amount{new_version};
+        END IF;
+
+        RETURN NULL;
+    END;
+    $$
+    LANGUAGE plpgsql;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_statement_snapshot_triggers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accountbalance',
+            name='version',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunSQL(
+            "ALTER TABLE accounts_accountbalance ALTER COLUMN version SET DEFAULT 0",
+            "ALTER TABLE accounts_accountbalance ALTER COLUMN version DROP DEFAULT",
+        ),
+        # Bump the version of an account's balance upon any change to its legs
+        migrations.RunSQL(
+            UPDATE_ACCOUNT_BALANCE.format(
+                old_version=', version = version + 1',
+                insert_columns=', version',
+                insert_values=', 1',
+                new_version=', version = accounts_accountbalance.version + 1',
+            ),
+            UPDATE_ACCOUNT_BALANCE.format(old_version='', insert_columns='', insert_values='', new_version=''),
+        ),
+        # Changing a transaction's date or description changes how its legs are
+        # displayed, so bump the version of every account the transaction touches
+        migrations.RunSQL(
+            """
+            CREATE OR REPLACE FUNCTION bump_account_balance_version()
+                RETURNS trigger AS
+            $$
+            BEGIN
+                UPDATE accounts_accountbalance
+                    SET version = version + 1
+                    WHERE account_id IN (SELECT account_id FROM hordak_leg WHERE transaction_id = NEW.id);
+                RETURN NULL;
+            END;
+            $$
+            LANGUAGE plpgsql;
+            """,
+            "DROP FUNCTION bump_account_balance_version()"
+        ),
+        migrations.RunSQL(
+            """
+            CREATE TRIGGER bump_account_balance_version_trigger
+            AFTER UPDATE OF date, description ON hordak_transaction
+            FOR EACH ROW EXECUTE PROCEDURE bump_account_balance_version()
+            """,
+            "DROP TRIGGER bump_account_balance_version_trigger ON hordak_transaction"
+        ),
+    ]
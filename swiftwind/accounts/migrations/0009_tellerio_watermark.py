@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_accountbalance_version'),
+        ('hordak', '0020_auto_20171205_1424'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TellerioWatermark',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('account_uuid', models.CharField(max_length=100, unique=True)),
+                ('last_date', models.DateField()),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        # Allows imports to skip lines which have already been imported
+        # using ON CONFLICT, rather than checking for each line in turn
+        migrations.RunSQL(
+            "CREATE UNIQUE INDEX IF NOT EXISTS accounts_statementline_uuid_uniq "
+            "ON hordak_statementline (uuid)",
+            "DROP INDEX IF EXISTS accounts_statementline_uuid_uniq"
+        ),
+    ]
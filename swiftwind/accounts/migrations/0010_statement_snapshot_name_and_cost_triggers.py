@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_tellerio_watermark'),
+        ('costs', '0017_recurringcost_archived'),
+    ]
+
+    operations = [
+        # Statements show the names of the accounts on the other side of each of the
+        # housemate's transactions. So renaming an account affects the statements of any
+        # housemate sharing a transaction with it, for the billing cycle containing that transaction.
+        migrations.RunSQL(
+            """
+            CREATE OR REPLACE FUNCTION invalidate_statement_snapshots_for_account()
+                RETURNS trigger AS
+            $$
+            BEGIN
+                DELETE FROM accounts_statementsnapshot S
+                    USING housemates_housemate H, billing_cycle_billingcycle BC,
+                          hordak_leg L, hordak_leg HL, hordak_transaction T
+                    WHERE S.housemate_id = H.id
+                    AND S.billing_cycle_id = BC.id
+                    AND L.account_id = NEW.id
+                    AND HL.transaction_id = L.transaction_id
+                    AND HL.account_id = H.account_id
+                    AND T.id = L.transaction_id
+                    AND BC.date_range @> T.date;
+
+                RETURN NULL;
+            END;
+            $$
+            LANGUAGE plpgsql;
+            """,
+            "DROP FUNCTION invalidate_statement_snapshots_for_account()"
+        ),
+        migrations.RunSQL(
+            """
+            CREATE TRIGGER invalidate_statement_snapshots_for_account_trigger
+            AFTER UPDATE OF name ON hordak_account
+            FOR EACH ROW
+            WHEN (OLD.name IS DISTINCT FROM NEW.name)
+            EXECUTE PROCEDURE invalidate_statement_snapshots_for_account()
+            """,
+            "DROP TRIGGER invalidate_statement_snapshots_for_account_trigger ON hordak_account"
+        ),
+        # A cost's type & total_billing_cycles determine how its legs are categorised
+        # on the statements of the billing cycles it was enacted for
+        migrations.RunSQL(
+            """
+            CREATE OR REPLACE FUNCTION invalidate_statement_snapshots_for_recurring_cost()
+                RETURNS trigger AS
+            $$
+            BEGIN
+                DELETE FROM accounts_statementsnapshot S
+                    USING housemates_housemate H, costs_recurredcost RC, hordak_leg L
+                    WHERE S.housemate_id = H.id
+                    AND S.billing_cycle_id = RC.billing_cycle_id
+                    AND RC.recurring_cost_id = NEW.id
+                    AND L.transaction_id = RC.transaction_id
+                    AND L.account_id = H.account_id;
+
+                RETURN NULL;
+            END;
+            $$
+            LANGUAGE plpgsql;
+            """,
+            "DROP FUNCTION invalidate_statement_snapshots_for_recurring_cost()"
+        ),
+        migrations.RunSQL(
+            """
+            CREATE TRIGGER invalidate_statement_snapshots_for_recurring_cost_trigger
+            AFTER UPDATE OF type, total_billing_cycles ON costs_recurringcost
+            FOR EACH ROW
+            WHEN (OLD.type IS DISTINCT FROM NEW.type
+                  OR OLD.total_billing_cycles IS DISTINCT FROM NEW.total_billing_cycles)
+            EXECUTE PROCEDURE invalidate_statement_snapshots_for_recurring_cost()
+            """,
+            "DROP TRIGGER invalidate_statement_snapshots_for_recurring_cost_trigger ON costs_recurringcost"
+        ),
+    ]
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_statement_snapshot_name_and_cost_triggers'),
+    ]
+
+    operations = [
+        # Counts the unreconciled statement lines for get_data_version() upon every
+        # request (see swiftwind.utilities.conditional), and finds those within a billing
+        # cycle for BillingCycle.is_reconciled(). Only a small fraction of lines are ever
+        # unreconciled, so the index stays small.
+        migrations.RunSQL(
+            "CREATE INDEX IF NOT EXISTS accounts_statementline_unreconciled_idx "
+            "ON hordak_statementline (date) WHERE transaction_id IS NULL",
+            "DROP INDEX IF EXISTS accounts_statementline_unreconciled_idx"
+        ),
+    ]
@@ -1,6 +1,432 @@
-from uuid import uuid4
-from django.conf import settings
-from django.db import models
+from datetime import date
 
-# Create your models here.
-from model_utils.models import TimeStampedModel
+from django.contrib.postgres.fields import JSONField
+from django.db import models, connection, connections, router
+from django.db import transaction as db_transaction
+from django.db.models import Sum
+from django.utils import timezone
+from moneyed import Money
+
+from hordak.models import Account, Leg, Transaction
+from hordak.utilities.currency import Balance
+
+
+def _zero_balance(account):
+    """Get a balance for the account with all its currencies set to zero"""
+    return Balance([Money('0', currency) for currency in account.currencies])
+
+
+class AccountBalanceManager(models.Manager):
+
+    def balance_of(self, account, before=None, raw=False):
+        """Get the balance of `account`, including its child accounts
+
+        This is equivalent to hordak's ``Account.balance()``, but is read from
+        the materialized balances rather than aggregating the account's entire
+        transaction history.
+
+        When `before` is given the balance is calculated from the nearest
+        billing cycle checkpoint (see :class:`AccountBalanceCheckpoint`).
+
+        Args:
+            account (Account):
+            before (date): Only include transactions dated before this date
+            raw (bool): If true the returned balance will not have its sign
+                        adjusted for display purposes.
+
+        Returns:
+            Balance
+        """
+        descendants = dict(
+            account__tree_id=account.tree_id,
+            account__lft__gte=account.lft,
+            account__rght__lte=account.rght,
+        )
+        checkpoint_cycle = None
+        if before:
+            checkpoint_cycle = AccountBalanceCheckpoint.objects.nearest_cycle(before)
+
+        if checkpoint_cycle:
+            # Start from the closing balance of the nearest billing cycle, and
+            # add anything which happened between then and `before`
+            rows = AccountBalanceCheckpoint.objects.filter(billing_cycle=checkpoint_cycle, **descendants)
+            rows = rows.values('currency').annotate(total=Sum('amount'))
+            balance = Balance([Money(row['total'], row['currency']) for row in rows])
+            balance += Leg.objects.filter(
+                transaction__date__gte=checkpoint_cycle.date_range.upper,
+                transaction__date__lt=before,
+                **descendants
+            ).sum_to_balance()
+        else:
+            rows = self.filter(**descendants).values('currency').annotate(total=Sum('amount'))
+            balance = Balance([Money(row['total'], row['currency']) for row in rows])
+
+            if before:
+                # Remove anything which happened on or after `before`. This
+                # will normally only be a small number of recent legs
+                balance -= Leg.objects.filter(transaction__date__gte=before, **descendants).sum_to_balance()
+
+        return balance * (1 if raw else account.sign) + _zero_balance(account)
+
+    def balances(self, accounts, include_children=True, raw=False):
+        """Get the balances of many accounts in a single query
+
+        Args:
+            accounts (list[Account]):
+            include_children (bool): Should the balance of each account include
+                                     the balances of its child accounts?
+            raw (bool): If true the returned balances will not have their sign
+                        adjusted for display purposes.
+
+        Returns:
+            dict: Mapping of account primary keys to Balance instances
+        """
+        accounts = list(accounts)
+        if not accounts:
+            return {}
+
+        if include_children:
+            sql = """
+                SELECT parent.id, b.currency, SUM(b.amount)
+                FROM {account_table} parent
+                INNER JOIN {account_table} child
+                    ON child.tree_id = parent.tree_id
+                    AND child.lft BETWEEN parent.lft AND parent.rght
+                INNER JOIN {balance_table} b ON b.account_id = child.id
+                WHERE parent.id = ANY(%s)
+                GROUP BY parent.id, b.currency
+            """
+        else:
+            sql = """
+                SELECT b.account_id, b.currency, b.amount
+                FROM {balance_table} b
+                WHERE b.account_id = ANY(%s)
+            """
+        sql = sql.format(account_table=Account._meta.db_table, balance_table=self.model._meta.db_table)
+
+        monies = {}
+        with connections[router.db_for_read(self.model)].cursor() as cursor:
+            cursor.execute(sql, [[account.pk for account in accounts]])
+            for account_id, currency, amount in cursor.fetchall():
+                monies.setdefault(account_id, []).append(Money(amount, currency))
+
+        return {
+            account.pk: Balance(monies.get(account.pk, [])) * (1 if raw else account.sign) + _zero_balance(account)
+            for account in accounts
+        }
+
+    def attach(self, accounts, include_children=True, attr='current_balance'):
+        """Set the balance of each account as an attribute upon the account
+
+        Intended for use in views & template tags, where ``account.balance``
+        would otherwise result in one or more queries per account.
+
+        Returns:
+            list[Account]: The accounts, each with `attr` set
+        """
+        accounts = list(accounts)
+        balances = self.balances(accounts, include_children=include_children)
+        for account in accounts:
+            setattr(account, attr, balances[account.pk])
+        return accounts
+
+    def rebuild(self):
+        """Recalculate all balances from the transaction legs"""
+        with db_transaction.atomic(), connection.cursor() as cursor:
+            # Block writes to the legs while we rebuild
+            cursor.execute('LOCK TABLE {} IN SHARE MODE'.format(Leg._meta.db_table))
+            cursor.execute('DELETE FROM {}'.format(self.model._meta.db_table))
+            cursor.execute("""
+                INSERT INTO {balance_table} (account_id, currency, amount)
+                SELECT account_id, amount_currency, SUM(amount)
+                FROM {leg_table}
+                GROUP BY account_id, amount_currency
+            """.format(balance_table=self.model._meta.db_table, leg_table=Leg._meta.db_table))
+
+    def verify(self):
+        """Compare the stored balances against a full recalculation
+
+        Returns:
+            list[tuple]: Any discrepancies, in the form (account_id, currency, stored amount, actual amount)
+        """
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT
+                    COALESCE(b.account_id, l.account_id),
+                    COALESCE(b.currency, l.currency),
+                    b.amount,
+                    l.total
+                FROM {balance_table} b
+                FULL OUTER JOIN (
+                    SELECT account_id, amount_currency AS currency, SUM(amount) AS total
+                    FROM {leg_table}
+                    GROUP BY account_id, amount_currency
+                ) l ON l.account_id = b.account_id AND l.currency = b.currency
+                WHERE COALESCE(b.amount, 0) != COALESCE(l.total, 0)
+                ORDER BY 1, 2
+            """.format(balance_table=self.model._meta.db_table, leg_table=Leg._meta.db_table))
+            return cursor.fetchall()
+
+
+class AccountBalance(models.Model):
+    """The current balance of an account in a single currency
+
+    Rows are maintained by a database trigger upon hordak's leg table (see
+    migration 0002), so this is always consistent with the transaction legs.
+    The stored amount is the raw sum of the account's legs, and does not
+    include child accounts.
+
+    The version is incremented by the triggers whenever any of the account's
+    legs (or their transactions) change, and is used to validate cached pages
+    (see :class:`swiftwind.utilities.conditional.ConditionalGetMixin`).
+    """
+    account = models.ForeignKey('hordak.Account', related_name='cached_balances', on_delete=models.CASCADE)
+    currency = models.CharField(max_length=3)
+    amount = models.DecimalField(max_digits=13, decimal_places=2, default=0)
+    version = models.BigIntegerField(default=0)
+
+    objects = AccountBalanceManager()
+
+    class Meta:
+        unique_together = (
+            ('account', 'currency'),
+        )
+
+    def __str__(self):
+        return '{}: {} {}'.format(self.account_id, self.amount, self.currency)
+
+
+class AccountBalanceCheckpointManager(models.Manager):
+
+    def nearest_cycle(self, before):
+        """Get the latest checkpointed billing cycle which ends on or before `before`
+
+        May return None
+        """
+        from swiftwind.billing_cycle.models import BillingCycle
+        return BillingCycle.objects.filter(
+            balances_checkpointed=True,
+            end_date__lte=before,
+        ).order_by('date_range').last()
+
+    def create_for(self, billing_cycle):
+        """Record the closing balance of every account for `billing_cycle`
+
+        The checkpoint is built from the previous checkpoint (if any) plus the
+        legs dated since, rather than from the entire transaction history.
+        Once created, checkpoints are kept up to date by database triggers
+        (see migration 0004).
+        """
+        from swiftwind.billing_cycle.models import BillingCycle
+
+        with db_transaction.atomic(), connection.cursor() as cursor:
+            # Block writes to the legs & transactions while we create the checkpoint
+            cursor.execute('LOCK TABLE {}, {} IN SHARE MODE'.format(
+                Leg._meta.db_table, Transaction._meta.db_table
+            ))
+            self.filter(billing_cycle=billing_cycle).delete()
+
+            base_cycle = self.nearest_cycle(billing_cycle.date_range.lower)
+            cursor.execute("""
+                INSERT INTO {checkpoint_table} (account_id, billing_cycle_id, currency, amount)
+                SELECT account_id, %(billing_cycle)s, currency, SUM(amount)
+                FROM (
+                    SELECT account_id, currency, amount
+                    FROM {checkpoint_table}
+                    WHERE billing_cycle_id = %(base_cycle)s
+                    UNION ALL
+                    SELECT L.account_id, L.amount_currency, L.amount
+                    FROM {leg_table} L
+                    INNER JOIN {transaction_table} T ON T.id = L.transaction_id
+                    WHERE (%(since)s::date IS NULL OR T.date >= %(since)s::date) AND T.date < %(until)s
+                ) AS balances
+                GROUP BY account_id, currency
+            """.format(
+                checkpoint_table=self.model._meta.db_table,
+                leg_table=Leg._meta.db_table,
+                transaction_table=Transaction._meta.db_table,
+            ), dict(
+                billing_cycle=billing_cycle.pk,
+                base_cycle=base_cycle.pk if base_cycle else None,
+                since=base_cycle.date_range.upper if base_cycle else None,
+                until=billing_cycle.date_range.upper,
+            ))
+
+            BillingCycle.objects.filter(pk=billing_cycle.pk).update(balances_checkpointed=True)
+            billing_cycle.balances_checkpointed = True
+
+    def rebuild(self, as_of=None):
+        """Recreate the checkpoints for all billing cycles which ended on or before `as_of`"""
+        from swiftwind.billing_cycle.models import BillingCycle
+
+        with db_transaction.atomic():
+            BillingCycle.objects.update(balances_checkpointed=False)
+            self.all().delete()
+            for billing_cycle in BillingCycle.objects.filter(end_date__lte=as_of or date.today()):
+                self.create_for(billing_cycle)
+
+    def verify(self):
+        """Compare the stored checkpoints against a full recalculation
+
+        Returns:
+            list[tuple]: Any discrepancies, in the form
+                         (billing_cycle_id, account_id, currency, stored amount, actual amount)
+        """
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                WITH actual AS (
+                    SELECT BC.id AS billing_cycle_id, L.account_id, L.amount_currency AS currency, SUM(L.amount) AS total
+                    FROM {billing_cycle_table} BC
+                    INNER JOIN {transaction_table} T ON T.date < upper(BC.date_range)
+                    INNER JOIN {leg_table} L ON L.transaction_id = T.id
+                    WHERE BC.balances_checkpointed
+                    GROUP BY BC.id, L.account_id, L.amount_currency
+                )
+                SELECT
+                    COALESCE(C.billing_cycle_id, A.billing_cycle_id),
+                    COALESCE(C.account_id, A.account_id),
+                    COALESCE(C.currency, A.currency),
+                    C.amount,
+                    A.total
+                FROM {checkpoint_table} C
+                FULL OUTER JOIN actual A
+                    ON A.billing_cycle_id = C.billing_cycle_id
+                    AND A.account_id = C.account_id
+                    AND A.currency = C.currency
+                WHERE COALESCE(C.amount, 0) != COALESCE(A.total, 0)
+                ORDER BY 1, 2, 3
+            """.format(
+                checkpoint_table=self.model._meta.db_table,
+                billing_cycle_table=self.model._meta.get_field('billing_cycle').related_model._meta.db_table,
+                leg_table=Leg._meta.db_table,
+                transaction_table=Transaction._meta.db_table,
+            ))
+            return cursor.fetchall()
+
+
+class AccountBalanceCheckpoint(models.Model):
+    """The balance of an account at the end of a billing cycle, in a single currency
+
+    As with :class:`AccountBalance`, the amount is the raw sum of the account's
+    legs (dated before the end of the billing cycle), and does not include
+    child accounts. Historical balances can then be calculated from the nearest
+    checkpoint rather than from the account's entire history.
+
+    Checkpoints are created when the following billing cycle is enacted, after
+    which database triggers keep them correct should any earlier transactions
+    be created, changed or deleted.
+    """
+    account = models.ForeignKey('hordak.Account', related_name='balance_checkpoints', on_delete=models.CASCADE)
+    billing_cycle = models.ForeignKey('billing_cycle.BillingCycle', related_name='balance_checkpoints',
+                                      on_delete=models.CASCADE)
+    currency = models.CharField(max_length=3)
+    amount = models.DecimalField(max_digits=13, decimal_places=2, default=0)
+
+    objects = AccountBalanceCheckpointManager()
+
+    class Meta:
+        unique_together = (
+            ('account', 'billing_cycle', 'currency'),
+        )
+
+    def __str__(self):
+        return '{} at end of cycle {}: {} {}'.format(self.account_id, self.billing_cycle_id, self.amount, self.currency)
+
+
+class StatementSnapshotManager(models.Manager):
+
+    def is_closed(self, billing_cycle):
+        """Only closed billing cycles are snapshotted, the current cycle's statements are always calculated"""
+        return billing_cycle.date_range.upper <= date.today()
+
+    def get_statement(self, housemate, billing_cycle):
+        """Get the statement for `housemate` for the given billing cycle
+
+        For closed billing cycles, the statement will be read from the housemate's
+        snapshot if one exists, otherwise it will be calculated and a snapshot created.
+
+        Returns:
+            dict: See :func:`swiftwind.accounts.statements.build_statement()`
+        """
+        from swiftwind.accounts.statements import build_statement, serialize_statement, deserialize_statement
+        from swiftwind.utilities.routers import primary_reads
+
+        if not self.is_closed(billing_cycle):
+            return build_statement(housemate, billing_cycle)
+
+        try:
+            snapshot = self.get(housemate=housemate, billing_cycle=billing_cycle)
+        except self.model.DoesNotExist:
+            # Build from the primary, as a lagging replica would give us a stale snapshot
+            with primary_reads():
+                statement = build_statement(housemate, billing_cycle)
+            self.get_or_create(
+                housemate=housemate,
+                billing_cycle=billing_cycle,
+                defaults=dict(data=serialize_statement(statement)),
+            )
+            return statement
+        else:
+            return deserialize_statement(snapshot.data)
+
+    def create_for_cycle(self, billing_cycle):
+        """(Re)create the snapshots of all housemates' statements for the given billing cycle
+
+        Does nothing if the billing cycle has not yet closed.
+        """
+        from swiftwind.accounts.statements import build_statement, serialize_statement
+        from swiftwind.housemates.models import Housemate
+
+        with db_transaction.atomic():
+            self.filter(billing_cycle=billing_cycle).delete()
+            if not self.is_closed(billing_cycle):
+                return
+            self.bulk_create([
+                self.model(
+                    housemate=housemate,
+                    billing_cycle=billing_cycle,
+                    data=serialize_statement(build_statement(housemate, billing_cycle)),
+                )
+                for housemate in Housemate.objects.select_related('account')
+            ])
+
+
+class StatementSnapshot(models.Model):
+    """A housemate's statement for a billing cycle, as calculated at the time it was created
+
+    Snapshots are only kept for billing cycles which have closed. They are
+    created in bulk when the following billing cycle is enacted (see
+    :meth:`BillingCycle.enact_all_costs()`), and otherwise when a statement
+    is first viewed. Database triggers delete any snapshots which a change
+    to the ledger, an account's name, or a cost's type would affect (see
+    migrations 0007 & 0010), so a snapshot can always be displayed as-is.
+    """
+    housemate = models.ForeignKey('housemates.Housemate', related_name='statement_snapshots', on_delete=models.CASCADE)
+    billing_cycle = models.ForeignKey('billing_cycle.BillingCycle', related_name='statement_snapshots',
+                                      on_delete=models.CASCADE)
+    created = models.DateTimeField(default=timezone.now, editable=False)
+    data = JSONField()
+
+    objects = StatementSnapshotManager()
+
+    class Meta:
+        unique_together = (
+            ('housemate', 'billing_cycle'),
+        )
+
+    def __str__(self):
+        return 'Statement for housemate {} for cycle {}'.format(self.housemate_id, self.billing_cycle_id)
+
+
+class TellerioWatermark(models.Model):
+    """The date of the most recent transaction imported from a teller.io account
+
+    Pages of transactions are requested newest first, so this date (rather than
+    the transaction's ID) is what limits an import. See :mod:`swiftwind.accounts.tellerio`.
+    """
+    account_uuid = models.CharField(max_length=100, unique=True)
+    last_date = models.DateField()
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return 'teller.io account {} imported up to {}'.format(self.account_uuid, self.last_date)
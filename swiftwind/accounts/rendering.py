@@ -0,0 +1,93 @@
+""" Rendering of housemate statement emails
+
+Rendering is done directly from the templates, rather than by dispatching
+the email views. Anything which is the same for every housemate is
+calculated once per billing cycle.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.template.loader import render_to_string
+
+from swiftwind.accounts.models import AccountBalance, StatementSnapshot
+from swiftwind.settings.models import Settings
+from swiftwind.utilities.site import get_site_root
+from swiftwind.utilities.tracing import traced
+
+
+def render_reconciliation_required():
+    """Render the reconciliation required email, which is the same for all housemates"""
+    return render_to_string('accounts/reconciliation_required_email.html', dict(
+        site_root=get_site_root(),
+    ))
+
+
+class StatementRenderer(object):
+    """Render statement emails for a billing cycle
+
+    Example:
+
+        renderer = StatementRenderer(billing_cycle)
+        for housemate, html in renderer.render_all(housemates):
+            ...
+    """
+    template_name = 'accounts/statement_email.html'
+
+    def __init__(self, billing_cycle):
+        self.billing_cycle = billing_cycle
+        self.shared_context = self.get_shared_context()
+
+    def get_shared_context(self):
+        """Get the context which is common to all housemates' statements"""
+        return dict(
+            billing_cycle=self.billing_cycle,
+            previous_billing_cycle=self.billing_cycle.get_previous(),
+            next_billing_cycle=self.billing_cycle.get_next(),
+            start_date=self.billing_cycle.date_range.lower,
+            end_date=self.billing_cycle.date_range.upper - timedelta(days=1),
+            payment_information=Settings.objects.get().payment_information,
+            site_root=get_site_root(),
+        )
+
+    def get_context(self, housemate):
+        context = dict(self.shared_context)
+        context.update(StatementSnapshot.objects.get_statement(housemate, self.billing_cycle))
+        context.update(
+            housemate=housemate,
+            account_balance=AccountBalance.objects.balance_of(housemate.account),
+        )
+        return context
+
+    def render(self, housemate):
+        return self.render_context(self.get_context(housemate))
+
+    def render_context(self, context):
+        return render_to_string(self.template_name, context)
+
+    @traced('statement_renderer.render_all', tags=lambda self, housemates, **kwargs: dict(billing_cycle=self.billing_cycle.pk))
+    def render_all(self, housemates, threads=None):
+        """Render the statements of all the given housemates
+
+        Args:
+            housemates (list[Housemate]): Should have their `user` and `account` loaded
+            threads (int): Render the templates using a pool of this many threads.
+                           Defaults to the SWIFTWIND_EMAIL_RENDER_THREADS setting.
+                           The contexts are always built upon the calling thread, so
+                           that they see (and any snapshots created are part of) the
+                           caller's transaction.
+
+        Returns:
+            list[tuple]: In the form (housemate, html)
+        """
+        housemates = list(housemates)
+        threads = threads or settings.SWIFTWIND_EMAIL_RENDER_THREADS
+        contexts = [self.get_context(housemate) for housemate in housemates]
+
+        if threads and threads > 1 and len(housemates) > 1:
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                rendered = list(executor.map(self.render_context, contexts))
+        else:
+            rendered = [self.render_context(context) for context in contexts]
+
+        return list(zip(housemates, rendered))
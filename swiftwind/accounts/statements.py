@@ -0,0 +1,248 @@
+""" Queries used to build housemate statements
+
+These avoid loading an account's entire history into Python, and avoid
+running queries for each row displayed.
+"""
+from collections import defaultdict
+from datetime import date
+
+from django.db import models
+from django.db.models import Q, Case, When, Value, Sum
+from django.http.response import Http404
+from moneyed import Money
+
+from hordak.models import Leg, Transaction
+from hordak.utilities.currency import Balance
+from swiftwind.accounts.models import AccountBalance, _zero_balance
+
+# Largest value of a postgres integer (and therefore of a leg or transaction id)
+MAX_ID = 2147483647
+
+
+def parse_cursor(cursor):
+    """Parse a payment history cursor in the form 'date.transaction_id.leg_id'
+
+    Returns None if no cursor was given, raises Http404 if the cursor is invalid.
+    """
+    if not cursor:
+        return None
+    try:
+        date_string, transaction_id, leg_id = cursor.split('.')
+        year, month, day = map(int, date_string.split('-'))
+        cursor_date = date(year, month, day)
+        transaction_id, leg_id = int(transaction_id), int(leg_id)
+    except (TypeError, ValueError, OverflowError):
+        raise Http404('Invalid cursor')
+    if not (0 < transaction_id <= MAX_ID and 0 < leg_id <= MAX_ID):
+        raise Http404('Invalid cursor')
+    return cursor_date, transaction_id, leg_id
+
+
+def make_cursor(leg):
+    return '{}.{}.{}'.format(leg.transaction_date, leg.transaction_id, leg.pk)
+
+
+def get_payment_history(account, before=None, limit=50):
+    """Get a page of the legs of `account`, most recent first
+
+    Each leg will have the following additional attributes:
+
+        * `transaction_date`, `transaction_description`
+        * `balance_after`: The balance of the account following the leg's transaction
+        * `counterparties`: The legs on the other side of the leg's transaction
+
+    The running balance is calculated by a window function, so the page
+    requires two queries in total regardless of its size or position.
+
+    Args:
+        account (Account):
+        before (str): Cursor, as returned by a previous call. Only legs prior to the
+                      cursor will be returned.
+        limit (int): Maximum number of legs to return
+
+    Returns:
+        tuple: (list of legs, cursor for the next page or None)
+    """
+    before = parse_cursor(before)
+
+    # The window runs over the account's entire history (so that the balances
+    # are correct), but the page is then selected using the keyset. Legs
+    # within the same transaction are peers in the window, which matches
+    # the behaviour of hordak's Leg.account_balance_after()
+    legs = list(Leg.objects.raw("""
+        SELECT * FROM (
+            SELECT
+                L.*,
+                T.date AS transaction_date,
+                T.description AS transaction_description,
+                SUM(L.amount) OVER (
+                    PARTITION BY L.amount_currency
+                    ORDER BY T.date, L.transaction_id
+                ) AS raw_balance_after
+            FROM {leg_table} L
+            INNER JOIN {transaction_table} T ON T.id = L.transaction_id
+            WHERE L.account_id = %(account)s
+        ) AS history
+        WHERE %(before_date)s::date IS NULL
+            OR (transaction_date, transaction_id, id) < (%(before_date)s::date, %(before_transaction)s, %(before_leg)s)
+        ORDER BY transaction_date DESC, transaction_id DESC, id DESC
+        LIMIT %(limit)s
+    """.format(leg_table=Leg._meta.db_table, transaction_table=Transaction._meta.db_table), dict(
+        account=account.pk,
+        before_date=before[0] if before else None,
+        before_transaction=before[1] if before else None,
+        before_leg=before[2] if before else None,
+        limit=limit + 1,
+    )))
+
+    next_cursor = make_cursor(legs[limit - 1]) if len(legs) > limit else None
+    legs = legs[:limit]
+
+    # Load the other legs of all these transactions in one query
+    transaction_legs = defaultdict(list)
+    other_legs = Leg.objects.filter(
+        transaction_id__in={leg.transaction_id for leg in legs}
+    ).exclude(pk__in=[leg.pk for leg in legs]).select_related('account').order_by('pk')
+    for other_leg in other_legs:
+        transaction_legs[other_leg.transaction_id].append(other_leg)
+
+    for leg in legs:
+        leg.balance_after = Balance([Money(leg.raw_balance_after * account.sign, leg.amount.currency)])
+        leg.counterparties = [
+            other_leg for other_leg in transaction_legs[leg.transaction_id]
+            if (other_leg.amount.amount > 0) != (leg.amount.amount > 0)
+        ]
+
+    return legs, next_cursor
+
+
+def get_cycle_legs(account, billing_cycle):
+    """Get the legs of `account` relevant to `billing_cycle`, categorised & totalled
+
+    Legs are categorised as either:
+
+        * `recurring`: Created when a recurring cost was enacted for this billing cycle
+        * `one_off`: Created when a one-off cost was enacted for this billing cycle
+        * `other`: Any other leg dated within this billing cycle
+
+    The categorisation and totals are calculated by the database, so this
+    requires a fixed number of queries regardless of the number of legs
+    (one for the totals, one for the legs, and two to prefetch the other
+    legs of each transaction for display).
+
+    Returns:
+        dict: Containing `{category}_legs` and `{category}_total` for each category,
+              plus `total` (the sum of the recurring and one-off costs)
+    """
+    is_cycle_cost = Q(transaction__recurred_cost__billing_cycle=billing_cycle)
+    legs = Leg.objects.filter(
+        is_cycle_cost | Q(
+            transaction__date__gte=billing_cycle.date_range.lower,
+            transaction__date__lt=billing_cycle.date_range.upper,
+        ),
+        account=account,
+    ).annotate(
+        category=Case(
+            When(
+                is_cycle_cost & Q(transaction__recurred_cost__recurring_cost__total_billing_cycles__isnull=True),
+                then=Value('recurring'),
+            ),
+            When(is_cycle_cost, then=Value('one_off')),
+            default=Value('other'),
+            output_field=models.CharField(),
+        )
+    )
+
+    context = {}
+    totals = defaultdict(list)
+    for row in legs.order_by().values_list('category', 'amount_currency').annotate(total=Sum('amount')):
+        category, currency, total = row
+        totals[category].append(Money(total, currency))
+
+    categorised_legs = defaultdict(list)
+    for leg in legs.order_by('-transaction__date', '-pk').select_related(
+                'transaction',
+                'transaction__recurred_cost__recurring_cost__to_account',
+            ).prefetch_related('transaction__legs__account'):
+        categorised_legs[leg.category].append(leg)
+
+    for category in ('recurring', 'one_off', 'other'):
+        context['{}_legs'.format(category)] = categorised_legs[category]
+        context['{}_total'.format(category)] = Balance(totals[category]) + _zero_balance(account)
+    context['total'] = context['recurring_total'] + context['one_off_total']
+    return context
+
+
+def build_statement(housemate, billing_cycle):
+    """Calculate the statement for `housemate` for the given billing cycle
+
+    The result contains only plain values (rather than model instances) so
+    that it can be stored in a :class:`StatementSnapshot`.
+
+    Returns:
+        dict: Containing the `recurring_legs`, `one_off_legs` and `other_legs`
+              line items, their totals, and the account's `opening_balance`
+              and `closing_balance` for the cycle.
+    """
+    account = housemate.account
+    cycle_legs = get_cycle_legs(account, billing_cycle)
+    statement = {}
+
+    for category in ('recurring', 'one_off'):
+        statement['{}_legs'.format(category)] = [
+            dict(
+                name=leg.transaction.recurred_cost.recurring_cost.to_account.name,
+                amount=leg.amount,
+            )
+            for leg in cycle_legs['{}_legs'.format(category)]
+        ]
+
+    statement['other_legs'] = [
+        dict(
+            counterparties=[
+                other_leg.account.name
+                for other_leg in leg.transaction.legs.all()
+                if other_leg.pk != leg.pk
+            ],
+            description=leg.transaction.description,
+            amount=leg.amount,
+        )
+        for leg in cycle_legs['other_legs']
+    ]
+
+    for key in ('recurring_total', 'one_off_total', 'other_total', 'total'):
+        statement[key] = cycle_legs[key]
+
+    statement['opening_balance'] = AccountBalance.objects.balance_of(account, before=billing_cycle.date_range.lower)
+    statement['closing_balance'] = AccountBalance.objects.balance_of(account, before=billing_cycle.date_range.upper)
+    return statement
+
+
+def _serialize_money(money):
+    return [str(money.amount), money.currency.code]
+
+
+def _serialize_balance(balance):
+    return [_serialize_money(money) for money in balance.monies()]
+
+
+def serialize_statement(statement):
+    """Convert a statement (as returned by build_statement()) into JSON-compatible data"""
+    data = {}
+    for key, value in statement.items():
+        if isinstance(value, Balance):
+            data[key] = _serialize_balance(value)
+        else:
+            data[key] = [dict(item, amount=_serialize_money(item['amount'])) for item in value]
+    return data
+
+
+def deserialize_statement(data):
+    """Convert data created by serialize_statement() back into a statement"""
+    statement = {}
+    for key, value in data.items():
+        if key.endswith('_legs'):
+            statement[key] = [dict(item, amount=Money(*item['amount'])) for item in value]
+        else:
+            statement[key] = Balance([Money(*money) for money in value])
+    return statement
@@ -1,22 +1,39 @@
+import logging
+
 from celery import shared_task
 from django.db import transaction
 
-from hordak.data_sources import tellerio
 from hordak.models.core import Account
+from swiftwind.accounts import tellerio
 from swiftwind.billing_cycle.models import BillingCycle
 from swiftwind.settings.models import Settings
+from swiftwind.transactions.categorisation import categorise
+from swiftwind.transactions.matching import match_payments
+from swiftwind.utilities.tracing import trace
+
+logger = logging.getLogger(__name__)
 
 
 @shared_task
 @transaction.atomic()
 def notify_housemates():
-    for billing_cycle in BillingCycle.objects.filter(transactions_created=True, statements_sent=False):
-        billing_cycle.notify_housemates()
+    with trace() as summary:
+        for billing_cycle in BillingCycle.objects.filter(transactions_created=True, statements_sent=False):
+            billing_cycle.notify_housemates()
+    if summary:
+        logger.info('Notified housemates\n%s', summary)
 
 
 @shared_task
-@transaction.atomic()
 def import_tellerio():
+    """Import new bank statement lines from teller.io, if enabled
+
+    Any housemate payments are then reconciled automatically, followed
+    by any lines matching the categorisation rules.
+
+    Not run within a transaction, as the import only opens one once
+    the transactions have been fetched (see swiftwind.accounts.tellerio).
+    """
     settings = Settings.objects.get()
 
     if settings.tellerio_enable:
@@ -27,6 +44,8 @@ def import_tellerio():
             bank_account=Account.objects.filter(is_bank_account=True)[0],
             since=first_billing_cycle.date_range.lower,
         )
+        match_payments()
+        categorise()
         return True
     else:
         return False
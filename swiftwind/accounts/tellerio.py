@@ -0,0 +1,165 @@
+""" Incremental import of bank statement lines from teller.io
+
+Hordak's importer fetches (and checks) the account's entire history upon
+every run. Instead, a :class:`TellerioWatermark` records the most recent
+transaction imported from each teller.io account, and only transactions
+dated since then are fetched. Transactions may be posted late, so the
+import starts ``SWIFTWIND_TELLERIO_OVERLAP_DAYS`` before the watermark.
+
+Lines within this overlap will already have been imported. Rather than
+checking each in turn, lines are inserted with ``ON CONFLICT DO NOTHING``
+against the unique index upon the statement line's uuid (see migration 0009).
+
+The import happens in two stages. Transactions are first fetched from
+teller.io into memory, outside of any database transaction, so that no
+locks are held while waiting upon the network. The statement lines are then
+written within a single short transaction. See
+:mod:`swiftwind.accounts.fake_teller` for running imports against a local
+fake of the teller.io API.
+"""
+import datetime
+from datetime import timedelta
+from uuid import UUID
+
+import requests
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from psycopg2.extras import Json
+
+from hordak.models.core import StatementImport
+from swiftwind.accounts.models import TellerioWatermark
+
+# Maximum statement lines per INSERT statement
+INSERT_BATCH_SIZE = 1000
+
+
+def parse_date(value):
+    return datetime.date(*map(int, value.split('-')))
+
+
+def fetch_transactions(token, account_uuid, since=None):
+    """Fetch transactions from teller.io, newest first
+
+    Transactions are requested one page at a time, stopping at the first
+    transaction dated before `since`.
+    """
+    page_size = settings.SWIFTWIND_TELLERIO_PAGE_SIZE
+    params = {'count': page_size}
+    while True:
+        response = requests.get(
+            url='{}/accounts/{}/transactions'.format(settings.SWIFTWIND_TELLERIO_API_URL.rstrip('/'), account_uuid),
+            params=params,
+            headers={'Authorization': 'Bearer {}'.format(token)},
+            timeout=settings.SWIFTWIND_TELLERIO_TIMEOUT,
+        )
+        response.raise_for_status()
+        page = response.json()
+
+        for line_data in page:
+            if since and parse_date(line_data['date']) < since:
+                return
+            yield line_data
+
+        if len(page) < page_size:
+            return
+        params['from_id'] = page[-1]['id']
+
+
+def insert_lines(statement_import, transactions):
+    """Create a statement line for each teller.io transaction, unless it has already been imported
+
+    Returns:
+        int: The number of statement lines created
+    """
+    if not transactions:
+        return 0
+
+    now = timezone.now()
+    rows = []
+    for line_data in transactions:
+        rows.append((
+            str(UUID(hex=line_data['id'])),
+            now,
+            parse_date(line_data['date']),
+            statement_import.pk,
+            line_data['amount'],
+            ', '.join(filter(bool, [line_data['counterparty'], line_data['description']])),
+            line_data['type'],
+            Json(line_data),
+        ))
+
+    created = 0
+    with connection.cursor() as cursor:
+        for i in range(0, len(rows), INSERT_BATCH_SIZE):
+            batch = rows[i:i + INSERT_BATCH_SIZE]
+            cursor.execute(
+                "INSERT INTO hordak_statementline "
+                "(uuid, timestamp, date, statement_import_id, amount, description, type, source_data) "
+                "VALUES {} "
+                "ON CONFLICT (uuid) DO NOTHING".format(', '.join(['(%s, %s, %s, %s, %s, %s, %s, %s)'] * len(batch))),
+                [value for row in batch for value in row]
+            )
+            created += cursor.rowcount
+    return created
+
+
+def do_import(token, account_uuid, bank_account, since=None):
+    """Import any new transactions from teller.io
+
+    This should not be called within a database transaction, as the
+    transaction would then be held open while fetching from teller.io.
+
+    Args:
+        token (str): teller.io API token
+        account_uuid (str): The teller.io account to import from
+        bank_account (Account): The account to import the statement lines into
+        since (date): Never import transactions dated before this
+
+    Returns:
+        StatementImport: The import, or None if there were no new transactions
+    """
+    watermark = TellerioWatermark.objects.filter(account_uuid=account_uuid).first()
+    fetch_since = since
+    if watermark:
+        overlap_start = watermark.last_date - timedelta(days=settings.SWIFTWIND_TELLERIO_OVERLAP_DAYS)
+        fetch_since = max(since, overlap_start) if since else overlap_start
+
+    transactions = list(fetch_transactions(token, account_uuid, since=fetch_since))
+    if not transactions:
+        return None
+    return persist(account_uuid, bank_account, transactions)
+
+
+@transaction.atomic()
+def persist(account_uuid, bank_account, transactions):
+    """Write fetched transactions as statement lines, and advance the watermark
+
+    Args:
+        transactions (list): teller.io transactions, newest first
+
+    Returns:
+        StatementImport: The import, or None if all the transactions had already been imported
+    """
+    statement_import = StatementImport.objects.create(
+        source='teller.io',
+        extra={'account_uuid': account_uuid},
+        bank_account=bank_account,
+    )
+    created = insert_lines(statement_import, transactions)
+
+    # Newest first, so this is the most recent transaction
+    newest = transactions[0]
+    watermark, _ = TellerioWatermark.objects.select_for_update().get_or_create(
+        account_uuid=account_uuid,
+        defaults=dict(last_date=parse_date(newest['date'])),
+    )
+    if parse_date(newest['date']) > watermark.last_date:
+        watermark.last_date = parse_date(newest['date'])
+        watermark.save()
+
+    if not created:
+        # Everything was within the overlap, so don't leave an empty import lying around
+        statement_import.delete()
+        return None
+    return statement_import
@@ -1,7 +1,37 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import tempfile
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
 
+import requests
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.http.response import Http404
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from freezegun import freeze_time
+from hordak.models import Account, Transaction, Leg, StatementLine
+from hordak.tests.utils import BalanceUtils
+from moneyed import Money
+
+from swiftwind.accounts import tellerio
+from swiftwind.accounts.fake_teller import FakeTellerServer, load_fixture
+from swiftwind.accounts.forms import AccountChoiceField
+from swiftwind.accounts.history import InvalidHistory, import_history
+from swiftwind.accounts.models import AccountBalance, AccountBalanceCheckpoint, StatementSnapshot, TellerioWatermark
+from swiftwind.accounts.rendering import StatementRenderer, render_reconciliation_required
+from swiftwind.accounts.statements import get_payment_history, get_cycle_legs, deserialize_statement
 from swiftwind.accounts.views import StatementEmailView
 from swiftwind.billing_cycle.models import BillingCycle
+from swiftwind.core.management.commands.swiftwind_create_accounts import Command as CreateAccountsCommand
+from swiftwind.costs.models import RecurringCost, RecurringCostSplit
+from swiftwind.settings.models import Settings
 from swiftwind.utilities.testing import DataProvider
 
 
@@ -18,3 +48,784 @@ class StatementEmailViewTestCase(DataProvider, TestCase):
         billing_cycle.refresh_from_db()
         html = StatementEmailView.get_html(uuid=housemate.uuid, date='2000-01-01')
         self.assertIn('<html>', html)
+
+
+class AccountBalanceTestCase(DataProvider, BalanceUtils, TestCase):
+
+    def setUp(self):
+        self.bank = self.account(type=Account.TYPES.asset, name='Bank')
+        self.income = self.account(type=Account.TYPES.income)
+        self.parent = self.account(type=Account.TYPES.expense)
+        self.expense1 = self.account(parent=self.parent)
+        self.expense2 = self.account(parent=self.parent)
+
+    def test_transfer_updates_balances(self):
+        self.bank.transfer_to(self.income, Money(100, 'EUR'))
+        self.bank.transfer_to(self.expense1, Money(30, 'EUR'))
+
+        for account in (self.bank, self.income, self.expense1, self.expense2, self.parent):
+            self.assertEqual(AccountBalance.objects.balance_of(account), account.balance())
+
+    def test_delete_transaction(self):
+        self.bank.transfer_to(self.income, Money(100, 'EUR'))
+        self.bank.transfer_to(self.income, Money(50, 'EUR'))
+        Transaction.objects.order_by('pk').last().delete()
+
+        self.assertBalanceEqual(AccountBalance.objects.balance_of(self.income), 100)
+        self.assertEqual(AccountBalance.objects.verify(), [])
+
+    def test_update_leg_account(self):
+        self.bank.transfer_to(self.expense1, Money(30, 'EUR'))
+        self.expense1.legs.update(account=self.expense2)
+
+        self.assertBalanceEqual(AccountBalance.objects.balance_of(self.expense1), 0)
+        self.assertBalanceEqual(AccountBalance.objects.balance_of(self.expense2), 30)
+        self.assertBalanceEqual(AccountBalance.objects.balance_of(self.parent), 30)
+
+    def test_balance_of_before(self):
+        self.bank.transfer_to(self.income, Money(100, 'EUR'), date=date(2000, 1, 1))
+        self.bank.transfer_to(self.income, Money(50, 'EUR'), date=date(2000, 2, 1))
+
+        self.assertBalanceEqual(AccountBalance.objects.balance_of(self.income, before=date(2000, 1, 1)), 0)
+        self.assertBalanceEqual(AccountBalance.objects.balance_of(self.income, before=date(2000, 2, 1)), 100)
+        self.assertBalanceEqual(AccountBalance.objects.balance_of(self.income, before=date(2000, 3, 1)), 150)
+
+    def test_balances(self):
+        self.bank.transfer_to(self.expense1, Money(30, 'EUR'))
+        self.bank.transfer_to(self.expense2, Money(20, 'EUR'))
+
+        with self.assertNumQueries(1):
+            balances = AccountBalance.objects.balances([self.bank, self.parent, self.expense1])
+        self.assertBalanceEqual(balances[self.bank.pk], -50)
+        self.assertBalanceEqual(balances[self.parent.pk], 50)
+        self.assertBalanceEqual(balances[self.expense1.pk], 30)
+
+    def test_balances_exclude_children(self):
+        self.bank.transfer_to(self.expense1, Money(30, 'EUR'))
+        balances = AccountBalance.objects.balances([self.parent, self.expense1], include_children=False)
+        self.assertBalanceEqual(balances[self.parent.pk], 0)
+        self.assertBalanceEqual(balances[self.expense1.pk], 30)
+
+    def test_rebuild(self):
+        self.bank.transfer_to(self.income, Money(100, 'EUR'))
+        with connection.cursor() as cursor:
+            cursor.execute('UPDATE accounts_accountbalance SET amount = 0')
+
+        self.assertEqual(len(AccountBalance.objects.verify()), 2)
+        AccountBalance.objects.rebuild()
+        self.assertEqual(AccountBalance.objects.verify(), [])
+        self.assertBalanceEqual(AccountBalance.objects.balance_of(self.income), 100)
+
+    def test_command_verify(self):
+        self.bank.transfer_to(self.income, Money(100, 'EUR'))
+        call_command('rebuild_account_balances', verify=True, stdout=StringIO())
+
+        AccountBalance.objects.all().delete()
+        with self.assertRaises(CommandError):
+            call_command('rebuild_account_balances', verify=True, stdout=StringIO(),
+                         stderr=StringIO())
+
+        call_command('rebuild_account_balances', stdout=StringIO())
+        self.assertEqual(AccountBalance.objects.verify(), [])
+
+
+class AccountBalanceCheckpointTestCase(DataProvider, BalanceUtils, TestCase):
+
+    def setUp(self):
+        self.bank = self.account(type=Account.TYPES.asset, name='Bank')
+        self.income = self.account(type=Account.TYPES.income)
+        self.cycle1 = BillingCycle.objects.create(date_range=(date(2000, 1, 1), date(2000, 2, 1)))
+        self.cycle2 = BillingCycle.objects.create(date_range=(date(2000, 2, 1), date(2000, 3, 1)))
+        self.cycle3 = BillingCycle.objects.create(date_range=(date(2000, 3, 1), date(2000, 4, 1)))
+        for billing_cycle in (self.cycle1, self.cycle2, self.cycle3):
+            billing_cycle.refresh_from_db()
+
+    def checkpoint_amount(self, billing_cycle, account):
+        return AccountBalanceCheckpoint.objects.get(billing_cycle=billing_cycle, account=account).amount
+
+    def test_create_for(self):
+        self.bank.transfer_to(self.income, Money(100, 'EUR'), date=date(2000, 1, 15))
+        self.bank.transfer_to(self.income, Money(50, 'EUR'), date=date(2000, 2, 15))
+
+        AccountBalanceCheckpoint.objects.create_for(self.cycle1)
+        AccountBalanceCheckpoint.objects.create_for(self.cycle2)
+
+        self.cycle1.refresh_from_db()
+        self.assertTrue(self.cycle1.balances_checkpointed)
+        self.assertEqual(self.checkpoint_amount(self.cycle1, self.income), 100)
+        self.assertEqual(self.checkpoint_amount(self.cycle2, self.income), 150)
+        self.assertEqual(AccountBalanceCheckpoint.objects.verify(), [])
+
+    def test_earlier_transaction_updates_checkpoint(self):
+        AccountBalanceCheckpoint.objects.create_for(self.cycle1)
+        self.bank.transfer_to(self.income, Money(100, 'EUR'), date=date(2000, 1, 15))
+        self.bank.transfer_to(self.income, Money(50, 'EUR'), date=date(2000, 2, 15))
+
+        self.assertEqual(self.checkpoint_amount(self.cycle1, self.income), 100)
+        self.assertEqual(AccountBalanceCheckpoint.objects.verify(), [])
+
+    def test_transaction_date_change_updates_checkpoint(self):
+        self.bank.transfer_to(self.income, Money(100, 'EUR'), date=date(2000, 1, 15))
+        AccountBalanceCheckpoint.objects.create_for(self.cycle1)
+        AccountBalanceCheckpoint.objects.create_for(self.cycle2)
+
+        Transaction.objects.update(date=date(2000, 2, 15))
+        self.assertEqual(self.checkpoint_amount(self.cycle1, self.income), 0)
+        self.assertEqual(self.checkpoint_amount(self.cycle2, self.income), 100)
+
+        Transaction.objects.update(date=date(2000, 1, 10))
+        self.assertEqual(self.checkpoint_amount(self.cycle1, self.income), 100)
+        self.assertEqual(AccountBalanceCheckpoint.objects.verify(), [])
+
+    def test_delete_transaction_updates_checkpoint(self):
+        self.bank.transfer_to(self.income, Money(100, 'EUR'), date=date(2000, 1, 15))
+        AccountBalanceCheckpoint.objects.create_for(self.cycle1)
+        Transaction.objects.all().delete()
+
+        self.assertEqual(self.checkpoint_amount(self.cycle1, self.income), 0)
+        self.assertEqual(AccountBalanceCheckpoint.objects.verify(), [])
+
+    def test_balance_of_uses_checkpoint(self):
+        self.bank.transfer_to(self.income, Money(100, 'EUR'), date=date(2000, 1, 15))
+        self.bank.transfer_to(self.income, Money(50, 'EUR'), date=date(2000, 2, 15))
+        self.bank.transfer_to(self.income, Money(25, 'EUR'), date=date(2000, 3, 15))
+        AccountBalanceCheckpoint.objects.create_for(self.cycle1)
+
+        self.assertBalanceEqual(AccountBalance.objects.balance_of(self.income, before=date(2000, 1, 20)), 100)
+        self.assertBalanceEqual(AccountBalance.objects.balance_of(self.income, before=date(2000, 2, 1)), 100)
+        self.assertBalanceEqual(AccountBalance.objects.balance_of(self.income, before=date(2000, 3, 1)), 150)
+        self.assertBalanceEqual(AccountBalance.objects.balance_of(self.income, before=date(2000, 4, 1)), 175)
+
+    def test_enact_creates_checkpoint(self):
+        self.cycle2.enact_all_costs()
+        self.cycle1.refresh_from_db()
+        self.assertTrue(self.cycle1.balances_checkpointed)
+
+    def test_rebuild_and_verify(self):
+        self.bank.transfer_to(self.income, Money(100, 'EUR'), date=date(2000, 1, 15))
+        AccountBalanceCheckpoint.objects.create_for(self.cycle1)
+        AccountBalanceCheckpoint.objects.update(amount=0)
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_balance_checkpoints', verify=True, stdout=StringIO(), stderr=StringIO())
+
+        call_command('rebuild_balance_checkpoints', stdout=StringIO())
+        self.assertEqual(AccountBalanceCheckpoint.objects.verify(), [])
+        self.assertEqual(AccountBalanceCheckpoint.objects.filter(billing_cycle__balances_checkpointed=True).count(), 6)
+
+
+class OverviewViewTestCase(DataProvider, TestCase):
+
+    def setUp(self):
+        self.login()
+        CreateAccountsCommand().handle(currency='GBP')
+        BillingCycle.objects.create(date_range=(date(2000, 1, 1), date(2000, 2, 1)))
+        self.bank = Account.objects.get(name='Bank')
+        self.rent = Account.objects.get(name='Rent')
+        self.housemate1 = self.housemate(account_kwargs=dict(currencies=['GBP']))
+        self.housemate2 = self.housemate(account_kwargs=dict(currencies=['GBP']))
+
+    def get_accounts(self):
+        with freeze_time('2000-01-15'):
+            response = self.client.get(reverse('accounts:overview'))
+        self.assertEqual(response.status_code, 200)
+        return {account.pk: account for account in response.context['accounts']}
+
+    def test_get(self):
+        self.bank.transfer_to(self.housemate1.account, Money(100, 'GBP'), date=date(1999, 12, 20))
+        self.bank.transfer_to(self.housemate2.account, Money(100, 'GBP'), date=date(2000, 1, 10))
+        self.bank.transfer_to(self.rent, Money(50, 'GBP'), date=date(2000, 1, 5))
+
+        accounts = self.get_accounts()
+        housemate1 = accounts[self.housemate1.account.pk]
+        housemate2 = accounts[self.housemate2.account.pk]
+        rent = accounts[self.rent.pk]
+
+        self.assertEqual(housemate1.display_type, 'housemate')
+        self.assertEqual(rent.display_type, 'expense')
+        self.assertEqual(housemate1.latest_transaction_date, date(1999, 12, 20))
+        self.assertEqual(housemate2.latest_transaction_date, date(2000, 1, 10))
+        self.assertFalse(housemate1.payment_since_last_bill)
+        self.assertTrue(housemate2.payment_since_last_bill)
+        self.assertEqual(housemate1.current_balance, housemate1.simple_balance())
+        self.assertEqual(rent.current_balance, rent.simple_balance())
+
+    def test_query_count_independent_of_transactions(self):
+        self.get_accounts()
+        with CaptureQueriesContext(connection) as initial_queries:
+            self.get_accounts()
+
+        for day in range(1, 10):
+            self.bank.transfer_to(self.housemate1.account, Money(10, 'GBP'), date=date(2000, 1, day))
+            self.bank.transfer_to(self.rent, Money(10, 'GBP'), date=date(2000, 1, day))
+        self.housemate(account_kwargs=dict(currencies=['GBP']))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.get_accounts()
+        self.assertEqual(len(queries), len(initial_queries))
+
+
+class HousemateStatementViewTestCase(DataProvider, TestCase):
+
+    def setUp(self):
+        self.login()
+        # Create the settings now, rather than upon the first request (which would change the ETag)
+        Settings.objects.get()
+        BillingCycle.objects.create(date_range=(date(2000, 1, 1), date(2000, 2, 1)))
+        housemate = self.housemate()
+        self.housemate_account = housemate.account
+        self.url = reverse('accounts:housemate_statement', args=[housemate.uuid])
+
+    def get(self, **kwargs):
+        with freeze_time('2000-01-15'):
+            return self.client.get(self.url, **kwargs)
+
+    def test_not_modified(self):
+        etag = self.get()['ETag']
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_modified_after_transaction(self):
+        etag = self.get()['ETag']
+        self.account(type=Account.TYPES.asset).transfer_to(self.housemate_account, Money(100, 'EUR'), date=date(2000, 1, 10))
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_not_modified_by_other_housemates(self):
+        etag = self.get()['ETag']
+        other_housemate = self.housemate()
+        self.account(type=Account.TYPES.asset).transfer_to(other_housemate.account, Money(100, 'EUR'))
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_modified_after_settings_change(self):
+        etag = self.get()['ETag']
+        settings = Settings.objects.get()
+        settings.payment_information = 'Pay me'
+        settings.save()
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class PaymentHistoryTestCase(DataProvider, TestCase):
+
+    def setUp(self):
+        self.bank = self.account(type=Account.TYPES.asset, name='Bank')
+        self.housemate_account = self.account(type=Account.TYPES.income)
+        self.expense = self.account(type=Account.TYPES.expense)
+
+        for day in range(1, 6):
+            self.bank.transfer_to(self.housemate_account, Money(100, 'EUR'), date=date(2000, 1, day))
+            self.housemate_account.transfer_to(self.expense, Money(30, 'EUR'), date=date(2000, 1, day))
+
+    def test_balances_match_hordak(self):
+        legs, next_cursor = get_payment_history(self.housemate_account)
+
+        self.assertEqual(len(legs), 10)
+        self.assertIsNone(next_cursor)
+        for leg in legs:
+            self.assertEqual(leg.balance_after, Leg.objects.get(pk=leg.pk).account_balance_after())
+
+    def test_counterparties(self):
+        legs, next_cursor = get_payment_history(self.housemate_account)
+        for leg in legs:
+            self.assertEqual(len(leg.counterparties), 1)
+            self.assertIn(leg.counterparties[0].account, [self.bank, self.expense])
+            self.assertNotEqual(leg.counterparties[0].amount.amount > 0, leg.amount.amount > 0)
+
+    def test_pagination(self):
+        all_legs, _ = get_payment_history(self.housemate_account)
+
+        page1, cursor = get_payment_history(self.housemate_account, limit=4)
+        page2, cursor = get_payment_history(self.housemate_account, before=cursor, limit=4)
+        page3, cursor = get_payment_history(self.housemate_account, before=cursor, limit=4)
+
+        self.assertIsNone(cursor)
+        self.assertEqual([l.pk for l in page1 + page2 + page3], [l.pk for l in all_legs])
+        self.assertEqual([l.balance_after for l in page3], [l.balance_after for l in all_legs[8:]])
+
+    def test_query_count(self):
+        with self.assertNumQueries(2):
+            get_payment_history(self.housemate_account)
+
+    def test_invalid_cursor(self):
+        for cursor in ('foo', '2000.1.1', '2000-13-01.1.1', '99999999999-01-01.1.1', '2000-01-01.99999999999.1'):
+            with self.assertRaises(Http404):
+                get_payment_history(self.housemate_account, before=cursor)
+
+
+class CycleLegsTestCase(DataProvider, BalanceUtils, TestCase):
+
+    def setUp(self):
+        self.bank = self.account(type=Account.TYPES.asset, name='Bank')
+        self.expense = self.account(type=Account.TYPES.expense)
+        self.housemate_account = self.account(type=Account.TYPES.income)
+        self.billing_cycle = BillingCycle.objects.create(date_range=('2000-01-01', '2000-02-01'))
+        self.billing_cycle.refresh_from_db()
+
+    def create_cost(self, amount, total_billing_cycles=None):
+        recurring_cost = RecurringCost.objects.create(
+            to_account=self.expense,
+            fixed_amount=amount,
+            type=RecurringCost.TYPES.normal,
+            initial_billing_cycle=self.billing_cycle,
+            total_billing_cycles=total_billing_cycles,
+        )
+        RecurringCostSplit.objects.create(
+            recurring_cost=recurring_cost,
+            from_account=self.housemate_account,
+            portion=Decimal('1'),
+        )
+        recurring_cost.enact(self.billing_cycle)
+        return recurring_cost
+
+    def test_categories_and_totals(self):
+        self.create_cost(100)
+        self.create_cost(20, total_billing_cycles=1)
+        self.bank.transfer_to(self.housemate_account, Money(50, 'EUR'), date=date(2000, 1, 10))
+        self.bank.transfer_to(self.housemate_account, Money(50, 'EUR'), date=date(2000, 2, 10))
+
+        with self.assertNumQueries(4):
+            cycle_legs = get_cycle_legs(self.housemate_account, self.billing_cycle)
+
+        self.assertEqual(len(cycle_legs['recurring_legs']), 1)
+        self.assertEqual(len(cycle_legs['one_off_legs']), 1)
+        self.assertEqual(len(cycle_legs['other_legs']), 1)
+        self.assertBalanceEqual(cycle_legs['recurring_total'], -100)
+        self.assertBalanceEqual(cycle_legs['one_off_total'], -20)
+        self.assertBalanceEqual(cycle_legs['other_total'], 50)
+        self.assertBalanceEqual(cycle_legs['total'], -120)
+
+    def test_no_legs(self):
+        cycle_legs = get_cycle_legs(self.housemate_account, self.billing_cycle)
+        self.assertEqual(cycle_legs['recurring_legs'], [])
+        self.assertBalanceEqual(cycle_legs['total'], 0)
+
+
+class StatementSnapshotTestCase(DataProvider, BalanceUtils, TestCase):
+
+    def setUp(self):
+        self.bank = self.account(type=Account.TYPES.asset, name='Bank')
+        self.expense = self.account(type=Account.TYPES.expense)
+        self.housemate = self.housemate()
+        self.billing_cycle = BillingCycle.objects.create(date_range=('2000-01-01', '2000-02-01'))
+        self.billing_cycle.refresh_from_db()
+
+        recurring_cost = RecurringCost.objects.create(
+            to_account=self.expense,
+            fixed_amount=100,
+            type=RecurringCost.TYPES.normal,
+            initial_billing_cycle=self.billing_cycle,
+        )
+        RecurringCostSplit.objects.create(
+            recurring_cost=recurring_cost,
+            from_account=self.housemate.account,
+            portion=Decimal('1'),
+        )
+
+    def test_created_on_enact(self):
+        self.billing_cycle.enact_all_costs()
+        snapshot = StatementSnapshot.objects.get(housemate=self.housemate, billing_cycle=self.billing_cycle)
+
+        statement = deserialize_statement(snapshot.data)
+        self.assertEqual(statement['recurring_legs'], [dict(name=self.expense.name, amount=Money(-100, 'EUR'))])
+        self.assertBalanceEqual(statement['recurring_total'], -100)
+        self.assertBalanceEqual(statement['opening_balance'], 0)
+        self.assertBalanceEqual(statement['closing_balance'], -100)
+
+    def test_get_statement_uses_snapshot(self):
+        self.billing_cycle.enact_all_costs()
+        with self.assertNumQueries(1):
+            statement = StatementSnapshot.objects.get_statement(self.housemate, self.billing_cycle)
+        self.assertBalanceEqual(statement['total'], -100)
+
+    def test_get_statement_creates_snapshot(self):
+        statement = StatementSnapshot.objects.get_statement(self.housemate, self.billing_cycle)
+        self.assertEqual(statement['recurring_legs'], [])
+        self.assertTrue(StatementSnapshot.objects.filter(housemate=self.housemate).exists())
+
+    def test_invalidated_by_new_leg(self):
+        self.billing_cycle.enact_all_costs()
+        self.bank.transfer_to(self.housemate.account, Money(100, 'EUR'), date=date(2000, 1, 10))
+        self.assertFalse(StatementSnapshot.objects.filter(billing_cycle=self.billing_cycle).exists())
+
+        statement = StatementSnapshot.objects.get_statement(self.housemate, self.billing_cycle)
+        self.assertBalanceEqual(statement['other_total'], 100)
+        self.assertEqual(statement['other_legs'][0]['counterparties'], ['Bank'])
+
+    def test_not_invalidated_by_later_leg(self):
+        self.billing_cycle.enact_all_costs()
+        self.bank.transfer_to(self.housemate.account, Money(100, 'EUR'), date=date(2000, 2, 10))
+        self.assertTrue(StatementSnapshot.objects.filter(billing_cycle=self.billing_cycle).exists())
+
+    def test_invalidated_by_transaction_date_change(self):
+        self.bank.transfer_to(self.housemate.account, Money(100, 'EUR'), date=date(2000, 2, 10))
+        self.billing_cycle.enact_all_costs()
+        Transaction.objects.filter(date=date(2000, 2, 10)).update(date=date(2000, 1, 10))
+        self.assertFalse(StatementSnapshot.objects.filter(billing_cycle=self.billing_cycle).exists())
+
+    def test_current_cycle_not_snapshotted(self):
+        with freeze_time('2000-01-15'):
+            statement = StatementSnapshot.objects.get_statement(self.housemate, self.billing_cycle)
+            StatementSnapshot.objects.create_for_cycle(self.billing_cycle)
+        self.assertEqual(statement['recurring_legs'], [])
+        self.assertFalse(StatementSnapshot.objects.exists())
+
+    def test_invalidated_by_account_rename(self):
+        self.billing_cycle.enact_all_costs()
+        self.expense.name = 'Electricity'
+        self.expense.save()
+        self.assertFalse(StatementSnapshot.objects.filter(billing_cycle=self.billing_cycle).exists())
+
+        statement = StatementSnapshot.objects.get_statement(self.housemate, self.billing_cycle)
+        self.assertEqual(statement['recurring_legs'][0]['name'], 'Electricity')
+
+    def test_not_invalidated_by_unrelated_account_rename(self):
+        self.billing_cycle.enact_all_costs()
+        self.bank.name = 'Savings'
+        self.bank.save()
+        self.assertTrue(StatementSnapshot.objects.filter(billing_cycle=self.billing_cycle).exists())
+
+    def test_invalidated_by_cost_becoming_one_off(self):
+        self.billing_cycle.enact_all_costs()
+        RecurringCost.objects.update(total_billing_cycles=1)
+        self.assertFalse(StatementSnapshot.objects.filter(billing_cycle=self.billing_cycle).exists())
+
+        statement = StatementSnapshot.objects.get_statement(self.housemate, self.billing_cycle)
+        self.assertEqual(statement['recurring_legs'], [])
+        self.assertEqual(len(statement['one_off_legs']), 1)
+
+    def test_unenact_recreates_snapshot(self):
+        self.billing_cycle.enact_all_costs()
+        self.billing_cycle.unenact_all_costs()
+
+        snapshot = StatementSnapshot.objects.get(housemate=self.housemate, billing_cycle=self.billing_cycle)
+        self.assertEqual(deserialize_statement(snapshot.data)['recurring_legs'], [])
+
+
+class StatementRendererTestCase(DataProvider, TestCase):
+
+    def setUp(self):
+        self.billing_cycle = BillingCycle.objects.create(date_range=('2000-01-01', '2000-02-01'))
+        self.billing_cycle.refresh_from_db()
+
+    def test_render(self):
+        housemate = self.housemate(user_kwargs=dict(username='bob'))
+        html = StatementRenderer(self.billing_cycle).render(housemate)
+        self.assertIn('<html', html)
+        self.assertIn('Statement for bob', html)
+        self.assertIn(str(housemate.uuid), html)
+
+    def test_render_all_shares_context(self):
+        StatementRenderer(self.billing_cycle).render_all([self.housemate()])
+
+        housemates = [self.housemate() for _ in range(3)]
+        renderer = StatementRenderer(self.billing_cycle)
+        with CaptureQueriesContext(connection) as queries:
+            renderer.render_all(housemates[:1])
+        per_housemate = len(queries)
+
+        with self.assertNumQueries(per_housemate * 2):
+            rendered = renderer.render_all(housemates[1:])
+        self.assertEqual([h for h, _ in rendered], housemates[1:])
+
+    def test_render_all_threaded(self):
+        # The housemates are uncommitted, so would be invisible to the threads' own connections
+        housemates = [self.housemate(user_kwargs=dict(username='user{}'.format(i))) for i in range(3)]
+        rendered = StatementRenderer(self.billing_cycle).render_all(housemates, threads=2)
+
+        for housemate, html in rendered:
+            self.assertIn('Statement for {}'.format(housemate.user.username), html)
+        self.assertEqual(StatementSnapshot.objects.filter(billing_cycle=self.billing_cycle).count(), 3)
+
+    def test_render_reconciliation_required(self):
+        self.assertIn('<html', render_reconciliation_required())
+
+
+def teller_transaction(n, date):
+    return {
+        'id': '{:032x}'.format(n),
+        'date': date,
+        'amount': '-{}.00'.format(n),
+        'counterparty': 'Shop {}'.format(n),
+        'description': 'Card payment',
+        'type': 'card_payment',
+    }
+
+
+@override_settings(SWIFTWIND_TELLERIO_PAGE_SIZE=2, SWIFTWIND_TELLERIO_OVERLAP_DAYS=2)
+class TellerioImportTestCase(DataProvider, TestCase):
+
+    def setUp(self):
+        self.bank = self.account(is_bank_account=True, type=Account.TYPES.asset)
+        # Newest first, as returned by teller.io
+        self.transactions = [
+            teller_transaction(4, '2000-01-20'),
+            teller_transaction(3, '2000-01-10'),
+            teller_transaction(2, '2000-01-05'),
+            teller_transaction(1, '2000-01-01'),
+        ]
+
+        self.server = FakeTellerServer(self.transactions).start()
+        self.addCleanup(self.server.stop)
+        settings_override = override_settings(SWIFTWIND_TELLERIO_API_URL=self.server.url)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def do_import(self, since=None):
+        return tellerio.do_import('token', 'account-uuid', self.bank, since=since)
+
+    def test_first_import(self):
+        statement_import = self.do_import()
+        self.assertEqual(statement_import.lines.count(), 4)
+        self.assertEqual(len(self.server.requests), 3)  # Two full pages, then an empty page
+
+        line = StatementLine.objects.get(date=date(2000, 1, 20))
+        self.assertEqual(line.amount, Decimal('-4'))
+        self.assertEqual(line.description, 'Shop 4, Card payment')
+
+        watermark = TellerioWatermark.objects.get()
+        self.assertEqual(watermark.last_date, date(2000, 1, 20))
+
+    @override_settings(SWIFTWIND_TELLERIO_TIMEOUT=5)
+    def test_timeout(self):
+        with patch('swiftwind.accounts.tellerio.requests.get', wraps=requests.get) as get:
+            self.do_import()
+        self.assertEqual(get.call_args[1]['timeout'], 5)
+
+    def test_since(self):
+        self.do_import(since=date(2000, 1, 5))
+        self.assertEqual(StatementLine.objects.count(), 3)
+
+    def test_incremental_import(self):
+        self.do_import()
+        self.transactions.insert(0, teller_transaction(5, '2000-01-21'))
+        self.server.requests.clear()
+
+        statement_import = self.do_import()
+        self.assertEqual(statement_import.lines.count(), 1)
+        self.assertEqual(StatementLine.objects.count(), 5)
+        # Older pages are not fetched once the overlap has been passed
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(TellerioWatermark.objects.get().last_date, date(2000, 1, 21))
+
+    def test_nothing_new(self):
+        self.do_import()
+        self.assertIsNone(self.do_import())
+        self.assertEqual(StatementLine.objects.count(), 4)
+        self.assertEqual(self.bank.imports.count(), 1)
+
+    def test_recorded_fixture(self):
+        self.transactions[:] = load_fixture(
+            os.path.join(os.path.dirname(__file__), 'fixtures', 'tellerio-transactions.json')
+        )
+        statement_import = self.do_import()
+        self.assertEqual(statement_import.lines.count(), len(self.transactions))
+        self.assertEqual(
+            sum(line.amount for line in statement_import.lines.all()),
+            sum(Decimal(transaction['amount']) for transaction in self.transactions),
+        )
+
+
+@override_settings(SWIFTWIND_EXPORT_CHUNK_SIZE=2)
+class ExportTestCase(DataProvider, TestCase):
+
+    def setUp(self):
+        self.login()
+        self.bank = self.account(name='Bank', type=Account.TYPES.asset, currencies=['GBP'])
+        self.rent = self.account(name='Rent', type=Account.TYPES.liability, currencies=['GBP'])
+        self.alice = self.housemate(
+            user_kwargs=dict(username='alice'), account_kwargs=dict(name='Alice', currencies=['GBP'])
+        )
+        account = self.alice.account
+        account.transfer_to(self.rent, Money(100, 'GBP'), date=date(2000, 1, 1), description='January rent')
+        account.transfer_to(self.rent, Money(50, 'GBP'), date=date(2000, 2, 1), description='February rent')
+        account.transfer_to(self.bank, Money(150, 'GBP'), date=date(2000, 2, 15), description='Payment')
+
+    def get_content(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf8')
+
+    def test_ledger_csv(self):
+        response = self.client.get(reverse('accounts:export_ledger', args=['csv']))
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(self.get_content(response).splitlines()))
+        self.assertEqual(len(rows), 6)
+
+        bank_rows = [row for row in rows if row['account'] == 'Bank']
+        self.assertEqual([(row['amount'], row['balance']) for row in bank_rows], [('150.00', '150.00')])
+        rent_rows = [row for row in rows if row['account'] == 'Rent']
+        self.assertEqual([row['balance'] for row in rent_rows], ['100.00', '150.00'])
+
+    def test_housemate_jsonl(self):
+        response = self.client.get(reverse('accounts:housemate_export', args=[self.alice.uuid, 'jsonl']))
+        rows = [json.loads(line) for line in self.get_content(response).splitlines()]
+        self.assertEqual(
+            [(row['date'], row['description'], row['amount'], row['balance']) for row in rows],
+            [
+                ('2000-01-01', 'January rent', '-100.00', '-100.00'),
+                ('2000-02-01', 'February rent', '-50.00', '-150.00'),
+                ('2000-02-15', 'Payment', '150.00', '0.00'),
+            ]
+        )
+
+    def test_command(self):
+        out = StringIO()
+        call_command('export_ledger', format='csv', housemate='alice', stdout=out)
+        rows = list(csv.DictReader(out.getvalue().splitlines()))
+        self.assertEqual([row['balance'] for row in rows], ['-100.00', '-150.00', '0.00'])
+
+    def test_command_unknown_housemate(self):
+        with self.assertRaises(CommandError):
+            call_command('export_ledger', housemate='bob', stdout=StringIO())
+
+
+class HistoryImportTestCase(DataProvider, BalanceUtils, TestCase):
+
+    def setUp(self):
+        self.bank = self.account(name='Bank', code='1', type=Account.TYPES.asset, currencies=['GBP', 'EUR'])
+        self.rent = self.account(name='Rent', code='2', type=Account.TYPES.liability, currencies=['GBP'])
+        self.alice = self.housemate(
+            user_kwargs=dict(username='alice'), account_kwargs=dict(name='Alice', code='3', currencies=['GBP'])
+        )
+
+    def csv(self, *rows):
+        return ['date,description,from_account,to_account,amount,currency'] + list(rows)
+
+    def test_import(self):
+        imported = import_history(self.csv(
+            '2000-01-01,January rent,alice,Rent,100,',
+            '2000-01-10,Payment,alice,1,100.00,GBP',
+            '2000-02-01,"Rent, February",alice,2,50.50,',
+        ), 'GBP')
+        self.assertEqual(imported, 3)
+        self.assertEqual(Transaction.objects.count(), 3)
+        self.assertEqual(Leg.objects.count(), 6)
+        self.assertEqual(Transaction.objects.get(date=date(2000, 2, 1)).description, 'Rent, February')
+
+        # As per transfer_to()
+        self.assertBalanceEqual(self.alice.account.balance(), Decimal('-50.50'))
+        self.assertBalanceEqual(self.rent.balance(), Decimal('150.50'))
+        self.assertBalanceEqual(self.bank.balance(), 100)
+        self.assertEqual(AccountBalance.objects.verify(), [])
+
+        # Triggers are enabled again
+        self.alice.account.transfer_to(self.bank, Money('50.50', 'GBP'))
+        self.assertBalanceEqual(AccountBalance.objects.balance_of(self.alice.account), 0)
+        self.assertEqual(AccountBalance.objects.verify(), [])
+
+    def test_import_after_pending_leg_writes(self):
+        # The deferred checks queued by these legs must be flushed before the triggers can be disabled
+        self.alice.account.transfer_to(self.rent, Money(10, 'GBP'))
+        import_history(self.csv('2000-01-01,,alice,Rent,100,'), 'GBP')
+        self.alice.account.transfer_to(self.rent, Money(10, 'GBP'))
+
+        self.assertBalanceEqual(self.rent.balance(), 120)
+        self.assertEqual(AccountBalance.objects.verify(), [])
+
+    def test_batches(self):
+        rows = ['2000-01-{:02d},,alice,Rent,1,'.format(day) for day in range(1, 29)]
+        self.assertEqual(import_history(self.csv(*rows), 'GBP', batch_size=5), 28)
+        self.assertBalanceEqual(self.rent.balance(), 28)
+        self.assertEqual(AccountBalance.objects.verify(), [])
+
+    def test_updates_checkpoints_and_snapshots(self):
+        billing_cycle = BillingCycle.objects.create(date_range=(date(2000, 1, 1), date(2000, 2, 1)))
+        billing_cycle.refresh_from_db()
+        AccountBalanceCheckpoint.objects.create_for(billing_cycle)
+        StatementSnapshot.objects.get_statement(self.alice, billing_cycle)
+
+        import_history(self.csv('2000-01-15,,alice,Rent,100,', '2000-03-01,,alice,Rent,10,'), 'GBP')
+        self.assertEqual(AccountBalanceCheckpoint.objects.verify(), [])
+        self.assertFalse(StatementSnapshot.objects.filter(housemate=self.alice).exists())
+
+    def test_invalid_rows(self):
+        with self.assertRaises(InvalidHistory) as cm:
+            import_history(self.csv(
+                '2000-01-01,,alice,Rent,100,',
+                '2000-13-01,,alice,Rent,100,',
+                '2000-01-01,,alice,Nowhere,100,',
+                '2000-01-01,,alice,Rent,-1,',
+                '2000-01-01,,alice,Rent,1.001,',
+                '2000-01-01,,alice,Rent,1,EUR',
+                '2000-01-01,,alice,alice,1,',
+                ',,alice,Rent,1,',
+            ), 'GBP')
+        self.assertEqual([line_number for line_number, message in cm.exception.errors], [3, 4, 5, 6, 7, 8, 9])
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_ambiguous_name(self):
+        self.account(name='Rent', code='4', type=Account.TYPES.expense, currencies=['GBP'])
+        with self.assertRaises(InvalidHistory):
+            import_history(self.csv('2000-01-01,,alice,Rent,100,'), 'GBP')
+        self.assertEqual(import_history(self.csv('2000-01-01,,alice,2,100,'), 'GBP'), 1)
+
+    def test_missing_column(self):
+        with self.assertRaises(InvalidHistory):
+            import_history(['date,from_account,amount', '2000-01-01,alice,100'], 'GBP')
+
+    def test_dry_run(self):
+        self.assertEqual(import_history(self.csv('2000-01-01,,alice,Rent,100,'), 'GBP', dry_run=True), 1)
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_command(self):
+        path = os.path.join(tempfile.mkdtemp(), 'history.csv')
+        with open(path, 'w') as f:
+            f.write('\n'.join(self.csv('2000-01-01,,alice,Rent,100,')))
+
+        out = StringIO()
+        call_command('swiftwind_import_history', path, currency='GBP', stdout=out)
+        self.assertIn('Imported 1 transactions', out.getvalue())
+        self.assertBalanceEqual(self.rent.balance(), 100)
+
+        with open(path, 'w') as f:
+            f.write('\n'.join(self.csv('2000-01-01,,alice,Nowhere,100,')))
+        with self.assertRaises(CommandError):
+            call_command('swiftwind_import_history', path, currency='GBP', stdout=out)
+
+
+class AccountChoiceFieldTestCase(DataProvider, TestCase):
+
+    def setUp(self):
+        self.expenses = self.account(name='Expenses', code='5', type=Account.TYPES.expense)
+        self.rent = self.account(name='Rent', code='1', parent=self.expenses)
+        self.expenses.refresh_from_db()
+        self.rent.refresh_from_db()
+
+    def test_labels(self):
+        # No queries for each account's balance
+        with self.assertNumQueries(1):
+            choices = AccountChoiceField().get_choices()
+        self.assertEqual(
+            [(str(value), label) for value, label in choices[1:]],
+            [(str(self.expenses.uuid), ' 5 Expenses'), (str(self.rent.uuid), '--- 51 Rent')],
+        )
+
+    def test_share_choices(self):
+        choices = AccountChoiceField().get_choices()
+        field = AccountChoiceField()
+        field.share_choices(choices)
+        with self.assertNumQueries(0):
+            html = field.widget.render('account', str(self.rent.uuid))
+        self.assertIn('51 Rent', html)
+        self.assertIn('5 Expenses', html)
+
+    def test_share_choices_with_source(self):
+        choices = AccountChoiceField().get_choices()
+        field = AccountChoiceField()
+        field.share_choices(choices, source_id='id_accounts')
+        with self.assertNumQueries(0):
+            html = field.widget.render('account', str(self.rent.uuid))
+            source = field.render_source('id_accounts')
+        self.assertIn('data-choices-from="id_accounts"', html)
+        self.assertIn('51 Rent', html)
+        self.assertNotIn('5 Expenses', html)
+        self.assertIn('id="id_accounts"', source)
+        self.assertIn('5 Expenses', source)
+
+    def test_clean(self):
+        field = AccountChoiceField()
+        field.share_choices(AccountChoiceField().get_choices())
+        self.assertEqual(field.clean(str(self.rent.uuid)), self.rent)
@@ -7,5 +7,7 @@ urlpatterns = [
     url(r'^housemate/(?P<uuid>[^/]*)/$', views.HousemateStatementView.as_view(), name='housemate_statement'),
     url(r'^housemate/(?P<uuid>.*)/(?P<date>\d{4}-\d{2}-\d{2})/$', views.HousemateStatementView.as_view(), name='housemate_statement_historical'),
     url(r'^email/statement/(?P<uuid>.*)/(?P<date>\d{4}-\d{2}-\d{2})/$', views.StatementEmailView.as_view(), name='housemate_statement_email'),
+    url(r'^housemate/(?P<uuid>[^/]*)/export\.(?P<format>csv|jsonl)$', views.HousemateExportView.as_view(), name='housemate_export'),
+    url(r'^export/ledger\.(?P<format>csv|jsonl)$', views.ExportView.as_view(), name='export_ledger'),
     url(r'^email/reminder/$', views.ReconciliationRequiredEmailView.as_view(), name='housemate_reconciliation_required_email'),
 ]
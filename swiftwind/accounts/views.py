@@ -4,10 +4,13 @@ from datetime import timedelta
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.sites.models import Site
 from django.db import models
-from django.db.models import Q, Sum, When, Case, Value, Subquery, OuterRef, Exists
+from django.db.models import Q, Sum, When, Case, Value, Max, Count
 from django.db.models.functions import Cast
+from django.http.response import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from django.test import RequestFactory
 from django.urls.base import reverse
+from django.utils.text import slugify
 from django.views import View
 from django.views.generic.base import TemplateView
 from django.views.generic.detail import DetailView
@@ -15,15 +18,20 @@ from django.views.generic.list import ListView
 from djmoney.models.fields import MoneyField
 
 from hordak.models.core import Account, Transaction, Leg
+from swiftwind.accounts import exports
+from swiftwind.accounts.models import AccountBalance, StatementSnapshot
+from swiftwind.accounts.statements import get_payment_history
 from swiftwind.billing_cycle.models import BillingCycle
 from swiftwind.settings.models import Settings
 from swiftwind.costs.models import RecurringCostSplit
 from swiftwind.housemates.models import Housemate
+from swiftwind.utilities.conditional import ConditionalGetMixin
 from swiftwind.utilities.emails import EmailViewMixin
+from swiftwind.utilities.routers import ReplicaReadMixin
 from swiftwind.utilities.site import get_site_root
 
 
-class OverviewView(LoginRequiredMixin, ListView):
+class OverviewView(LoginRequiredMixin, ReplicaReadMixin, ConditionalGetMixin, ListView):
     template_name = 'accounts/overview.html'
     context_object_name = 'accounts'
 
@@ -32,7 +40,7 @@ class OverviewView(LoginRequiredMixin, ListView):
         expenses = Account.objects.get(name='Expenses')
         current_billing_cycle = BillingCycle.objects.as_of(datetime.date.today())
 
-        return Account.objects.filter(
+        accounts = Account.objects.filter(
 
             # We want any account under 'Housemate Income' or 'Expenses'
             Q(lft__gt=housemate_income.lft, rght__lt=housemate_income.rght, tree_id=housemate_income.tree_id)
@@ -52,25 +60,25 @@ class OverviewView(LoginRequiredMixin, ListView):
             )
 
         ).annotate(
-            # When was the last transaction
-            latest_transaction_date=Subquery(
-                Transaction.objects.filter(legs__account=OuterRef('pk')).order_by('-date').values('date')[:1]
-            )
-
-        ).annotate(
-            # Has there been a payment during this billing cycle
-            payment_since_last_bill=Exists(
-                Transaction.objects.filter(
+            # When was the last transaction, and has there been a payment during
+            # this billing cycle. Both are calculated in a single pass over the
+            # account's legs, rather than a correlated subquery for each
+            latest_transaction_date=Max('legs__transaction__date'),
+            payment_since_last_bill=Count(Case(
+                When(
                     legs__amount__gt=0,
-                    legs__account=OuterRef('pk'),
-                    date__gte=current_billing_cycle.date_range.lower
-                )
-            )
+                    legs__transaction__date__gte=current_billing_cycle.date_range.lower,
+                    then=Value(1),
+                ),
+                output_field=models.IntegerField(),
+            )),
 
         )\
             .order_by('-display_type')\
             .select_related('housemate')
 
+        return AccountBalance.objects.attach(accounts, include_children=False)
+
 
 class AbstractHousemateStatementView(DetailView):
     template_name = 'accounts/housemate_statement.html'
@@ -78,34 +86,25 @@ class AbstractHousemateStatementView(DetailView):
     slug_field = 'uuid'
     context_object_name = 'housemate'
     queryset = Housemate.objects.all().select_related('account', 'user')
+    payment_history_page_size = 50
+
+    def get_date(self):
+        """The date within the billing cycle to display"""
+        date = self.kwargs.get('date')
+        return datetime.date(*map(int, date.split('-'))) if date else datetime.date.today()
 
     def get_context_data(self, **kwargs):
         housemate = self.object
-        date = self.kwargs.get('date')
+        billing_cycle = BillingCycle.objects.as_of(date=self.get_date())
 
-        billing_cycle = BillingCycle.objects.as_of(
-            date=datetime.date(*map(int, date.split('-'))) if date else datetime.date.today()
-        )
+        # Recurring, one-off & other line items, along with their totals
+        kwargs.update(StatementSnapshot.objects.get_statement(housemate, billing_cycle))
 
-        legs = Leg.objects.filter(
-            transaction__recurred_cost__billing_cycle=billing_cycle,
-            account=housemate.account,
-        ).order_by('-transaction__date', '-pk').select_related(
-            'transaction',
-            'transaction__recurred_cost__recurring_cost__to_account',
+        payment_history, payment_history_next = get_payment_history(
+            housemate.account,
+            before=self.request.GET.get('before'),
+            limit=self.payment_history_page_size,
         )
-        recurring_legs = [l for l in legs if not l.transaction.recurred_cost.recurring_cost.is_one_off()]
-        one_off_legs = [l for l in legs if l.transaction.recurred_cost.recurring_cost.is_one_off()]
-        other_legs = Leg.objects.filter(
-            transaction__date__gte=billing_cycle.date_range.lower,
-            transaction__date__lt=billing_cycle.date_range.upper,
-            account=housemate.account,
-        ).exclude(
-            pk__in=[l.pk for l in legs]
-        ).order_by('-transaction__date', '-pk').select_related('transaction')
-
-        recurring_total = sum(l.amount for l in recurring_legs)
-        one_off_total = sum(l.amount for l in one_off_legs)
 
         # Previous & next URLs
         # Not a pretty way to generate URLs, but parsing the date to reverse the
@@ -125,15 +124,11 @@ class AbstractHousemateStatementView(DetailView):
 
         return super().get_context_data(
             billing_cycle=billing_cycle,
+            account_balance=AccountBalance.objects.balance_of(housemate.account),
             start_date=billing_cycle.date_range.lower,
             end_date=billing_cycle.date_range.upper - timedelta(days=1),
-            recurring_legs=recurring_legs,
-            one_off_legs=one_off_legs,
-            other_legs=other_legs,
-            recurring_total=recurring_total,
-            one_off_total=one_off_total,
-            total=recurring_total + one_off_total,
-            payment_history=housemate.account.legs.all().order_by('-transaction__date', '-transaction__pk'),
+            payment_history=payment_history,
+            payment_history_next=payment_history_next,
             payment_information=Settings.objects.get().payment_information,
             next_url=next_url,
             previous_url=previous_url,
@@ -141,8 +136,43 @@ class AbstractHousemateStatementView(DetailView):
         )
 
 
-class HousemateStatementView(LoginRequiredMixin, AbstractHousemateStatementView):
-    pass
+class HousemateStatementView(LoginRequiredMixin, ReplicaReadMixin, ConditionalGetMixin,
+                             AbstractHousemateStatementView):
+
+    def get_data_version(self):
+        """The housemate's balance versions, the billing cycle, and the settings
+
+        The versions change along with any of the housemate's legs, or their transactions
+        (see accounts migration 0008). Fetched in a single query.
+        """
+        date = self.get_date()
+        balances = AccountBalance.objects.filter(
+            account=models.OuterRef('account'),
+        ).order_by().values('account')
+        billing_cycle = BillingCycle.objects.filter(start_date__lte=date, end_date__gt=date)
+
+        return Housemate.objects.filter(uuid=self.kwargs['uuid']).annotate(
+            balance_version=models.Subquery(
+                balances.annotate(version=Sum('version')).values('version'),
+                output_field=models.BigIntegerField(),
+            ),
+            balance_max_id=models.Subquery(
+                balances.annotate(max_id=Max('id')).values('max_id'),
+                output_field=models.IntegerField(),
+            ),
+            billing_cycle_id=models.Subquery(billing_cycle.values('pk')[:1], output_field=models.IntegerField()),
+            billing_cycle_transactions_created=models.Subquery(
+                billing_cycle.values('transactions_created')[:1],
+                output_field=models.BooleanField(),
+            ),
+            settings_modified=models.Subquery(
+                Settings.objects.values('modified')[:1],
+                output_field=models.DateTimeField(),
+            ),
+        ).values_list(
+            'balance_version', 'balance_max_id', 'billing_cycle_id',
+            'billing_cycle_transactions_created', 'settings_modified',
+        ).first()
 
 
 class StatementEmailView(EmailViewMixin, AbstractHousemateStatementView):
@@ -151,3 +181,29 @@ class StatementEmailView(EmailViewMixin, AbstractHousemateStatementView):
 
 class ReconciliationRequiredEmailView(EmailViewMixin, TemplateView):
     template_name = 'accounts/reconciliation_required_email.html'
+
+
+class ExportView(LoginRequiredMixin, View):
+    """Stream the legs of every account as CSV or JSON lines (see swiftwind.accounts.exports)"""
+
+    filename = 'ledger'
+
+    def get_accounts(self):
+        return None
+
+    def get(self, request, format, **kwargs):
+        response = StreamingHttpResponse(
+            exports.render(exports.leg_rows(self.get_accounts()), format),
+            content_type=exports.FORMATS[format],
+        )
+        response['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(self.filename, format)
+        return response
+
+
+class HousemateExportView(ExportView):
+    """Stream a housemate's entire statement history"""
+
+    def get_accounts(self):
+        housemate = get_object_or_404(Housemate.objects.select_related('account'), uuid=self.kwargs['uuid'])
+        self.filename = 'statement-{}'.format(slugify(housemate.account.name))
+        return [housemate.account]
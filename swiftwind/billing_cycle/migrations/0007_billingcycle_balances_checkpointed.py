@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing_cycle', '0006_billingcycle_statements_sent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='billingcycle',
+            name='balances_checkpointed',
+            field=models.BooleanField(default=False, help_text='Have account balances been recorded for the end of this billing cycle?'),
+        ),
+    ]
@@ -1,8 +1,8 @@
 from dateutil.relativedelta import relativedelta
 from django.contrib.postgres.fields import DateRangeField
-from django.core.mail import send_mail
 from django.db import models, transaction
 from django.db import transaction as db_transaction
+from django.db.models import Exists, OuterRef
 from django.db.models.functions import Lower, Upper
 from django.urls.base import reverse
 from django.utils import formats
@@ -11,13 +11,17 @@ from django_smalluuid.models import uuid_default, SmallUUIDField
 from django.conf import settings
 from pytz import UTC
 
-from hordak.models import Transaction
+from hordak.models import StatementImport, StatementLine, Transaction
+from swiftwind.accounts.models import AccountBalanceCheckpoint, StatementSnapshot
+from swiftwind.core.models import OutboxEmail
+from swiftwind.core.tasks import send_outbox_emails_on_commit
 from swiftwind.billing_cycle.exceptions import CannotPopulateForDateOutsideExistingCycles
 from swiftwind.costs.exceptions import CannotEnactUnenactableRecurringCostError, \
     RecurringCostAlreadyEnactedForBillingCycle
 from swiftwind.settings.models import Settings
 from swiftwind.housemates.models import Housemate
 from swiftwind.utilities.site import get_site_root
+from swiftwind.utilities.tracing import traced
 
 from .cycles import get_billing_cycle
 
@@ -44,6 +48,24 @@ class BillingCycleManager(models.Manager):
     def as_of(self, date):
         return self.get(start_date__lte=date, end_date__gt=date)
 
+    def with_reconciliation(self):
+        """Annotate the reconciliation status of each billing cycle
+
+        The status is annotated as ``has_import`` & ``has_unreconciled_lines``, and
+        is then used by ``is_reconciled()``. See ``is_reconciled()`` for details.
+        """
+        # Dates compare with import timestamps as midnight UTC, as the connection uses UTC
+        imports = StatementImport.objects.filter(timestamp__gte=OuterRef('start_date'))
+        unreconciled_lines = StatementLine.objects.filter(
+            transaction__isnull=True,
+            date__gte=OuterRef('start_date'),
+            date__lt=OuterRef('end_date'),
+        )
+        return self.get_queryset().annotate(
+            has_import=Exists(imports),
+            has_unreconciled_lines=Exists(unreconciled_lines),
+        )
+
 
 class BillingCycle(models.Model):
     # TODO: Currently does not support changing of billing-cycle type (i.e. monthly/weekly)
@@ -62,6 +84,10 @@ class BillingCycle(models.Model):
         default=False,
         help_text='Have we sent housemates their statements for this billing cycle?'
     )
+    balances_checkpointed = models.BooleanField(
+        default=False,
+        help_text='Have account balances been recorded for the end of this billing cycle?'
+    )
 
     objects = BillingCycleManager()
 
@@ -151,11 +177,17 @@ class BillingCycle(models.Model):
 
     def get_previous(self):
         """Get the billing cycle prior to this one. May return None"""
+        if hasattr(self, 'previous'):
+            # Set by BillingCycleListView, which has already fetched it
+            return self.previous
         return BillingCycle.objects.filter(date_range__lt=self.date_range).order_by('date_range').last()
 
     def is_reconciled(self):
         """Have transactions been imported and reconciled for this billing cycle?"""
-        from hordak.models import StatementImport, StatementLine
+        if hasattr(self, 'has_import'):
+            # Annotated by BillingCycleManager.with_reconciliation()
+            return self.has_import and not self.has_unreconciled_lines
+
         since = datetime(
             self.date_range.lower.year,
             self.date_range.lower.month,
@@ -188,21 +220,23 @@ class BillingCycle(models.Model):
         else:
             self.send_reconciliation_required()
 
+    @transaction.atomic()
     def send_reconciliation_required(self):
-        from swiftwind.accounts.views import ReconciliationRequiredEmailView
-
-        for housemate in Housemate.objects.filter(user__is_active=True):
-            html = ReconciliationRequiredEmailView.get_html()
-            send_mail(
+        from swiftwind.accounts.rendering import render_reconciliation_required
+
+        # The email is the same for everyone, so only render it once
+        html = render_reconciliation_required()
+        message = 'See {}{}'.format(get_site_root(), reverse('accounts:housemate_reconciliation_required_email'))
+        from_email = Settings.objects.get().email_from_address
+        for housemate in Housemate.objects.filter(user__is_active=True).select_related('user'):
+            OutboxEmail.objects.queue(
                 subject='Reconciliation required'.format(),
-                message='See {}{}'.format(
-                    get_site_root(),
-                    reverse('accounts:housemate_reconciliation_required_email')
-                ),
-                from_email=Settings.objects.get().email_from_address,
+                message=message,
+                from_email=from_email,
                 recipient_list=[housemate.user.email],
                 html_message=html,
             )
+        send_outbox_emails_on_commit()
 
     def can_create_transactions(self):
         """Can we create the transactions
@@ -216,40 +250,67 @@ class BillingCycle(models.Model):
     def can_send_statements(self):
         return self.can_create_transactions() and self.transactions_created
 
+    @traced('billing_cycle.send_statements', tags=lambda self, *args, **kwargs: dict(billing_cycle=self.pk))
     @transaction.atomic()
     def send_statements(self, force=False):
-        from swiftwind.accounts.views import StatementEmailView
+        from swiftwind.accounts.rendering import StatementRenderer
 
         should_send = force or (not self.statements_sent and self.transactions_created)
         if not should_send:
             return False
 
-        for housemate in Housemate.objects.filter(user__is_active=True):
-            html = StatementEmailView.get_html(
-                uuid=housemate.uuid,
-                date=str(self.date_range.lower)
-            )
-            send_mail(
+        from_email = Settings.objects.get().email_from_address
+        site_root = get_site_root()
+        housemates = Housemate.objects.filter(user__is_active=True).select_related('user', 'account')
+        for housemate, html in StatementRenderer(self).render_all(housemates):
+            OutboxEmail.objects.queue(
                 subject='{}, your house statement for {}'.format(
                     housemate.user.first_name or housemate.user.username,
                     # TODO: Assumes monthly billing cycles
                     self.date_range.lower.strftime('%B %Y'),
                 ),
                 message='See {}{}'.format(
-                    get_site_root(),
+                    site_root,
                     reverse('accounts:housemate_statement_email',
                             args=[housemate.uuid, str(self.date_range.lower)]
                             )
                 ),
-                from_email=Settings.objects.get().email_from_address,
+                from_email=from_email,
                 recipient_list=[housemate.user.email],
                 html_message=html,
             )
 
+        self.statements_sent = True
+        self.save()
+        send_outbox_emails_on_commit()
+        return True
+
+    @traced('billing_cycle.checkpoint_previous_balances', tags=lambda self, *args, **kwargs: dict(billing_cycle=self.pk))
+    def checkpoint_previous_balances(self):
+        """Record the closing account balances of the previous billing cycle
+
+        This is done before any costs are enacted, as arrears costs
+        will read their amounts from these balances.
+        """
+        previous = self.get_previous()
+        if previous and not previous.balances_checkpointed:
+            AccountBalanceCheckpoint.objects.create_for(previous)
+
+    @traced('billing_cycle.create_statement_snapshots', tags=lambda self, *args, **kwargs: dict(billing_cycle=self.pk))
+    def create_statement_snapshots(self):
+        """Snapshot all housemates' statements for this and the previous billing cycle"""
+        previous = self.get_previous()
+        if previous:
+            StatementSnapshot.objects.create_for_cycle(previous)
+        StatementSnapshot.objects.create_for_cycle(self)
+
+    @traced('billing_cycle.enact_all_costs', tags=lambda self, *args, **kwargs: dict(billing_cycle=self.pk))
     def enact_all_costs(self):
         from swiftwind.costs.models import RecurringCost
 
         with transaction.atomic():
+            self.checkpoint_previous_balances()
+
             for recurring_cost in RecurringCost.objects.all():
                 try:
                     recurring_cost.enact(self)
@@ -262,6 +323,9 @@ class BillingCycle(models.Model):
         for recurring_cost in RecurringCost.objects.all():
             recurring_cost.disable_if_done()
 
+        self.create_statement_snapshots()
+
+    @traced('billing_cycle.unenact_all_costs', tags=lambda self, *args, **kwargs: dict(billing_cycle=self.pk))
     def unenact_all_costs(self):
         from swiftwind.costs.models import RecurringCost, RecurredCost
 
@@ -277,6 +341,9 @@ class BillingCycle(models.Model):
                 recurring_cost.disable_if_done()
             self.save()
 
+        self.create_statement_snapshots()
+
+    @traced('billing_cycle.reenact_all_costs', tags=lambda self, *args, **kwargs: dict(billing_cycle=self.pk))
     def reenact_all_costs(self):
         from swiftwind.costs.models import RecurringCost, RecurredCost
 
@@ -291,6 +358,8 @@ class BillingCycle(models.Model):
             self.transactions_created = False
             self.save()
 
+            self.checkpoint_previous_balances()
+
             for recurring_cost in RecurringCost.objects.all():
                 recurring_cost.disabled = False
                 if not recurring_cost.is_enactable(self.start_date):
@@ -304,3 +373,5 @@ class BillingCycle(models.Model):
 
         for recurring_cost in RecurringCost.objects.all():
             recurring_cost.disable_if_done()
+
+        self.create_statement_snapshots()
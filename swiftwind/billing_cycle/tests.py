@@ -180,6 +180,37 @@ class BillingCycleTestCase(DataProvider, TransactionTestCase):
 
         self.assertFalse(billing_cycle.is_reconciled())
 
+    def test_with_reconciliation(self):
+        bank = self.account(name='Bank', type=Account.TYPES.asset)
+        other_account = self.account()
+        cycle1 = BillingCycle.objects.create(date_range=(date(2016, 4, 1), date(2016, 5, 1)))
+        cycle2 = BillingCycle.objects.create(date_range=(date(2016, 5, 1), date(2016, 6, 1)))
+        cycle3 = BillingCycle.objects.create(date_range=(date(2016, 6, 1), date(2016, 7, 1)))
+        statement_import = StatementImport.objects.create(
+            timestamp=datetime(2016, 5, 1, 9, 30, 00, tzinfo=UTC),
+            bank_account=bank,
+            source='csv',
+        )
+        StatementLine.objects.create(
+            date=date(2016, 4, 10),
+            statement_import=statement_import,
+            amount=10,
+        ).create_transaction(to_account=other_account)
+        StatementLine.objects.create(
+            date=date(2016, 5, 10),
+            statement_import=statement_import,
+            amount=10,
+        )
+
+        with self.assertNumQueries(1):
+            billing_cycles = list(BillingCycle.objects.with_reconciliation().order_by('date_range'))
+            reconciled = [billing_cycle.is_reconciled() for billing_cycle in billing_cycles]
+        # Reconciled, has an unreconciled line, and no import since it started
+        self.assertEqual(reconciled, [True, False, False])
+        for billing_cycle in (cycle1, cycle2, cycle3):
+            billing_cycle.refresh_from_db()
+        self.assertEqual([cycle1.is_reconciled(), cycle2.is_reconciled(), cycle3.is_reconciled()], reconciled)
+
     def test_send_reconciliation_required(self):
         billing_cycle = BillingCycle.objects.create(date_range=(date(2016, 4, 1), date(2016, 5, 1)))
         billing_cycle.refresh_from_db()
@@ -430,3 +461,39 @@ class SendNotificationsViewTestCase(DataProvider, TestCase):
         self.assertEqual(response.status_code, 302)
         assert mock.called
 
+
+
+class TracingTestCase(DataProvider, TestCase):
+
+    def test_enact_all_costs_traced(self):
+        from swiftwind.utilities.tracing import trace
+
+        housemate = self.housemate(account_kwargs=dict(currencies=['GBP']))
+        billing_cycle = BillingCycle.objects.create(date_range=(date(2016, 4, 1), date(2016, 5, 1)))
+        billing_cycle.refresh_from_db()
+        with transaction.atomic():
+            recurring_cost = RecurringCost.objects.create(
+                to_account=self.account(currencies=['GBP']),
+                fixed_amount=100,
+                type=RecurringCost.TYPES.normal,
+                initial_billing_cycle=billing_cycle,
+            )
+            RecurringCostSplit.objects.create(recurring_cost=recurring_cost, from_account=housemate.account)
+
+        with trace() as summary:
+            billing_cycle.enact_all_costs()
+
+        totals = summary.as_dict()
+        self.assertEqual(totals['billing_cycle.enact_all_costs']['count'], 1)
+        self.assertEqual(totals['recurring_cost.enact[normal]']['count'], 1)
+        self.assertGreater(totals['billing_cycle.enact_all_costs']['queries'], 0)
+        self.assertIn('recurring_cost.enact[normal]', str(summary))
+
+    def test_no_trace(self):
+        from swiftwind.utilities.tracing import span, trace
+
+        with trace() as summary:
+            pass
+        with span('untraced'):
+            pass
+        self.assertFalse(summary)
@@ -15,10 +15,20 @@ class BillingCycleListView(LoginRequiredMixin, ListView):
     context_object_name = 'billing_cycles'
 
     def get_queryset(self):
-        return BillingCycle.objects.filter(
+        return BillingCycle.objects.with_reconciliation().filter(
             start_date__lte=date.today()
         ).order_by('-date_range')
 
+    def get_context_data(self, **kwargs):
+        context = super(BillingCycleListView, self).get_context_data(**kwargs)
+        # Newest first, and only future cycles are excluded, so each cycle's previous cycle is the one
+        # following it. This saves querying for it in can_create_transactions()
+        billing_cycles = list(context['billing_cycles'])
+        for billing_cycle, previous in zip(billing_cycles, billing_cycles[1:] + [None]):
+            billing_cycle.previous = previous
+        context['billing_cycles'] = billing_cycles
+        return context
+
 
 class CreateTransactionsView(LoginRequiredMixin, View):
 
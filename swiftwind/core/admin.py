@@ -8,3 +8,15 @@ from . import models
 @admin.register(swiftwind.settings.models.Settings)
 class SettingsAdmin(admin.ModelAdmin):
     pass
+
+
+@admin.register(models.OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'created', 'status', 'attempts', 'sent')
+    list_filter = ('status',)
+
+
+@admin.register(models.ScheduledJob)
+class ScheduledJobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'last_started', 'last_duration', 'last_succeeded', 'runs')
+    readonly_fields = ('last_started', 'last_finished', 'last_duration', 'last_succeeded', 'last_error', 'runs')
@@ -1,9 +1,8 @@
 import logging
-import schedule
-import time
+
 from django.core.management.base import BaseCommand
 
-from swiftwind.accounts.tasks import import_tellerio
+from swiftwind.core.scheduler import Scheduler, jobs, run_job
 
 logger = logging.getLogger(__name__)
 
@@ -11,10 +10,18 @@ logger = logging.getLogger(__name__)
 class Command(BaseCommand):
     help = 'Run the scheduler which executes periodic tasks'
 
-    def handle(self, *args, **options):
+    def add_arguments(self, parser):
+        parser.add_argument('--dispatch', dest='dispatch', choices=['threads', 'celery'],
+                            help='Run jobs in this process, or send them to Celery. '
+                                 'Defaults to the SWIFTWIND_SCHEDULER_DISPATCH setting.')
+        parser.add_argument('--workers', dest='workers', type=int,
+                            help='Number of threads with which to run jobs.')
+        parser.add_argument('--run', dest='run', choices=list(jobs),
+                            help='Run a single job now and exit, rather than running the scheduler.')
 
-        schedule.every().hour.do(import_tellerio)
+    def handle(self, *args, **options):
+        if options.get('run'):
+            run_job(options['run'])
+            return
 
-        while True:
-            schedule.run_pending()
-            time.sleep(1)
+        Scheduler(dispatch=options.get('dispatch'), workers=options.get('workers')).run_forever()
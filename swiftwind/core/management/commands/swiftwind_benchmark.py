@@ -0,0 +1,218 @@
+import json
+import time
+import tracemalloc
+from collections import OrderedDict
+from datetime import timedelta
+from decimal import Decimal
+from statistics import median
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.datetime_safe import date
+
+from hordak.models import Account, Leg, StatementImport, StatementLine, Transaction
+from swiftwind.accounts.history import import_history
+from swiftwind.accounts.models import AccountBalance
+from swiftwind.accounts.rendering import StatementRenderer
+from swiftwind.billing_cycle.models import BillingCycle
+from swiftwind.costs.models import RecurringCost
+from swiftwind.housemates.models import Housemate
+from swiftwind.transactions.matching import match_payments
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Time the expensive operations against the current data (see swiftwind_generate_data). ' \
+           'Results are output as JSON. Any changes made while benchmarking are rolled back.'
+
+    scenarios = (
+        'enact',
+        'reenact',
+        'render_statements',
+        'dashboard',
+        'overview',
+        'statement',
+        'recurring_costs',
+        'one_off_costs',
+        'match_payments',
+        'import_history',
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', dest='repeat', type=int, default=3,
+                            help='Number of times to run each scenario. The median is reported.')
+        parser.add_argument('--scenario', dest='scenario', action='append', choices=self.scenarios,
+                            help='Only run the given scenario. May be specified multiple times.')
+        parser.add_argument('--output', dest='output', help='Write the results to this file rather than stdout.')
+        parser.add_argument('--match-lines', dest='match_lines', type=int, default=10000,
+                            help='Number of unreconciled statement lines to create for the match_payments scenario.')
+        parser.add_argument('--import-rows', dest='import_rows', type=int, default=100000,
+                            help='Number of CSV rows to import for the import_history scenario.')
+
+    def handle(self, *args, **options):
+        self.billing_cycle = BillingCycle.objects.filter(
+            transactions_created=True, start_date__lte=date.today()
+        ).last()
+        self.housemate = Housemate.objects.select_related('account').first()
+        if not self.billing_cycle or not self.housemate:
+            raise CommandError('No data to benchmark. Run swiftwind_generate_data first.')
+
+        results = OrderedDict()
+        results['dataset'] = OrderedDict([
+            ('housemates', Housemate.objects.count()),
+            ('recurring_costs', RecurringCost.objects.count()),
+            ('billing_cycles', BillingCycle.objects.count()),
+            ('transactions', Transaction.objects.count()),
+            ('legs', Leg.objects.count()),
+        ])
+        self.match_lines = options['match_lines']
+        self.import_rows = options['import_rows']
+        results['scenarios'] = OrderedDict()
+        for scenario in options.get('scenario') or self.scenarios:
+            results['scenarios'][scenario] = self.measure(
+                getattr(self, 'run_{}'.format(scenario)),
+                options['repeat'],
+                setup=getattr(self, 'setup_{}'.format(scenario), None),
+            )
+
+        output = json.dumps(results, indent=2)
+        if options.get('output'):
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+
+    def measure(self, fn, repeat, setup=None):
+        """Run `fn` `repeat` times, returning its median wall time, query count & peak memory
+
+        Each run happens within a transaction which is then rolled back, so
+        every run starts from the same data. If given, `setup` is run (untimed)
+        before each run.
+        """
+        timings, query_counts, peak_memory = [], [], []
+        for _ in range(repeat):
+            try:
+                with transaction.atomic():
+                    self.client = self.get_client()
+                    if setup:
+                        setup()
+                    tracemalloc.start()
+                    try:
+                        with CaptureQueriesContext(connection) as queries:
+                            start = time.perf_counter()
+                            fn()
+                            timings.append(time.perf_counter() - start)
+                        query_counts.append(len(queries))
+                        peak_memory.append(tracemalloc.get_traced_memory()[1])
+                    finally:
+                        tracemalloc.stop()
+                    raise Rollback()
+            except Rollback:
+                pass
+
+        return OrderedDict([
+            ('wall_time', round(median(timings), 4)),
+            ('queries', int(median(query_counts))),
+            ('peak_memory', int(median(peak_memory))),
+        ])
+
+    def get_client(self):
+        user = get_user_model().objects.filter(is_superuser=True).first()
+        if not user:
+            user = get_user_model().objects.create_superuser('benchmark', 'benchmark@example.com', 'benchmark')
+        client = Client()
+        client.force_login(user)
+        return client
+
+    def get(self, url):
+        response = self.client.get(url)
+        if response.status_code != 200:
+            raise CommandError('Got status {} for {}'.format(response.status_code, url))
+
+    def run_enact(self):
+        billing_cycle = self.billing_cycle.get_next() or self.billing_cycle
+        billing_cycle.enact_all_costs()
+
+    def run_reenact(self):
+        self.billing_cycle.reenact_all_costs()
+
+    def run_render_statements(self):
+        housemates = Housemate.objects.filter(user__is_active=True).select_related('user', 'account')
+        StatementRenderer(self.billing_cycle).render_all(housemates)
+
+    def run_dashboard(self):
+        self.get(reverse('dashboard:dashboard'))
+
+    def run_overview(self):
+        self.get(reverse('accounts:overview'))
+
+    def run_statement(self):
+        self.get(reverse('accounts:housemate_statement', args=[self.housemate.uuid]))
+
+    def run_recurring_costs(self):
+        self.get(reverse('costs:recurring'))
+
+    def run_one_off_costs(self):
+        self.get(reverse('costs:one_off'))
+
+    def setup_match_payments(self):
+        """Import unreconciled statement lines, of which a quarter are housemate payments
+
+        Half the payments are of the amount the housemate owes, and the rest
+        are of other amounts. The remaining lines pay in money from elsewhere.
+        """
+        housemates = list(Housemate.objects.select_related('user', 'account'))
+        balances = AccountBalance.objects.balances(housemate.account for housemate in housemates)
+        bank = Account.objects.filter(is_bank_account=True).first()
+        statement_import = StatementImport.objects.create(bank_account=bank)
+        start_date = self.billing_cycle.date_range.lower
+        length = (self.billing_cycle.date_range.upper - start_date).days
+
+        lines = []
+        for n in range(self.match_lines):
+            housemate = housemates[n % len(housemates)]
+            owed = -balances[housemate.account_id].monies()[0].amount
+            if n % 8 == 0 and owed > 0:
+                amount, description = owed, 'Payment from {}'.format(housemate.user.get_full_name())
+            elif n % 4 == 0:
+                amount, description = Decimal(10 + n % 90), 'BGC {}'.format(housemate.user.get_full_name())
+            else:
+                amount, description = 1 + n % 500, 'Refund {}'.format(n)
+            lines.append(StatementLine(
+                statement_import=statement_import,
+                date=start_date + timedelta(days=n % length),
+                amount=amount,
+                description=description,
+            ))
+        StatementLine.objects.bulk_create(lines)
+
+    def run_match_payments(self):
+        match_payments()
+
+    def setup_import_history(self):
+        """Build a CSV of housemate payments into the bank, dated over the preceding year"""
+        housemates = list(Housemate.objects.select_related('account'))
+        bank = Account.objects.filter(is_bank_account=True).first()
+        self.import_currency = bank.currencies[0]
+        end_date = self.billing_cycle.date_range.lower
+
+        self.import_lines = ['date,description,from_account,to_account,amount,currency']
+        for n in range(self.import_rows):
+            self.import_lines.append('{},Payment {},{},{},{}.{:02d},'.format(
+                end_date - timedelta(days=1 + n % 365),
+                n,
+                housemates[n % len(housemates)].account.full_code,
+                bank.full_code,
+                1 + n % 200,
+                n % 100,
+            ))
+
+    def run_import_history(self):
+        import_history(self.import_lines, self.import_currency)
@@ -0,0 +1,200 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.datetime_safe import date
+from moneyed import Money
+
+from hordak.models import Account, StatementImport, StatementLine
+from swiftwind.accounts.models import AccountBalance
+from swiftwind.billing_cycle.cycles import get_billing_cycle
+from swiftwind.billing_cycle.models import BillingCycle
+from swiftwind.core.management.commands.swiftwind_create_accounts import Command as CreateAccountsCommand
+from swiftwind.costs.models import RecurringCost, RecurringCostSplit
+from swiftwind.housemates.models import Housemate
+from swiftwind.settings.models import Settings
+
+
+class Command(BaseCommand):
+    help = 'Generate a realistic set of synthetic data for development and benchmarking. ' \
+           'The same seed will always produce the same data.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', dest='seed', type=int, default=1)
+        parser.add_argument('--housemates', dest='housemates', type=int, default=5)
+        parser.add_argument('--recurring-costs', dest='recurring_costs', type=int, default=10,
+                            help='Number of recurring costs, spread evenly across the recurring cost types.')
+        parser.add_argument('--one-off-costs', dest='one_off_costs', type=int, default=5)
+        parser.add_argument('--years', dest='years', type=int, default=2,
+                            help='Years of billing cycles to generate transactions for.')
+        parser.add_argument('--statement-lines', dest='statement_lines', type=int, default=20,
+                            help='Number of imported bank statement lines per billing cycle.')
+        parser.add_argument('--currency', dest='currency', default='GBP')
+        parser.add_argument('--as-of', dest='as_of', default=None,
+                            help='Generate data up until this date (YYYY-MM-DD). Defaults to today.')
+
+    def handle(self, *args, **options):
+        if Account.objects.exists():
+            raise CommandError('Data can only be generated into an empty database')
+
+        self.random = random.Random(options['seed'])
+        self.currency = options['currency']
+        as_of = date(*map(int, options['as_of'].split('-'))) if options['as_of'] else date.today()
+
+        with transaction.atomic():
+            self.create_settings()
+            CreateAccountsCommand().handle(currency=[self.currency])
+            self.bank = Account.objects.get(name='Bank')
+            billing_cycles = self.create_billing_cycles(as_of - relativedelta(years=options['years']), as_of)
+            self.housemates = self.create_housemates(options['housemates'])
+            self.create_recurring_costs(options['recurring_costs'], billing_cycles[0])
+            self.create_one_off_costs(options['one_off_costs'], billing_cycles)
+
+        self.spend_accounts = list(
+            Account.objects.filter(parent__name__in=['Expenses', 'Utilities'], children__isnull=True)
+        )
+
+        for billing_cycle in billing_cycles:
+            if billing_cycle.date_range.lower > as_of:
+                break
+            with transaction.atomic():
+                billing_cycle.enact_all_costs()
+                self.create_statement_lines(
+                    billing_cycle,
+                    count=options['statement_lines'],
+                    stop_date=min(as_of, billing_cycle.date_range.upper - timedelta(days=1)),
+                    reconcile=billing_cycle.date_range.upper <= as_of,
+                )
+
+        self.stdout.write(
+            'Generated {} housemates, {} costs and {} billing cycles'.format(
+                Housemate.objects.count(), RecurringCost.objects.count(), len(billing_cycles)
+            )
+        )
+
+    def money(self, low, high):
+        return Money(Decimal(self.random.randint(low * 100, high * 100)) / 100, self.currency)
+
+    def create_settings(self):
+        swiftwind_settings = Settings.objects.get()
+        swiftwind_settings.default_currency = self.currency
+        swiftwind_settings.payment_information = 'Please pay into the house account'
+        swiftwind_settings.save()
+
+    def create_billing_cycles(self, start_date, as_of):
+        stop_date = as_of + relativedelta(years=settings.SWIFTWIND_BILLING_CYCLE_YEARS)
+        date_ranges = get_billing_cycle().generate_date_ranges(start_date, stop_date=stop_date)
+        for date_range in date_ranges:
+            BillingCycle.objects.create(date_range=date_range)
+        return list(BillingCycle.objects.all())
+
+    def create_housemates(self, count):
+        housemate_income = Account.objects.get(name='Housemate Income')
+        housemates = []
+        for n in range(1, count + 1):
+            user = get_user_model().objects.create_user(
+                username='housemate{}'.format(n),
+                email='housemate{}@example.com'.format(n),
+                first_name='Housemate',
+                last_name=str(n),
+            )
+            account = Account.objects.create(
+                name='Housemate {}'.format(n),
+                code=str(n),
+                parent=housemate_income,
+                currencies=[self.currency],
+            )
+            housemates.append(Housemate.objects.create(user=user, account=account))
+        return housemates
+
+    def create_splits(self, recurring_cost):
+        housemates = self.random.sample(self.housemates, self.random.randint(1, len(self.housemates)))
+        for housemate in housemates:
+            RecurringCostSplit.objects.create(recurring_cost=recurring_cost, from_account=housemate.account)
+
+    def create_recurring_costs(self, count, initial_billing_cycle):
+        parents = {
+            RecurringCost.TYPES.normal: Account.objects.get(name='Current Liabilities'),
+            RecurringCost.TYPES.arrears_balance: Account.objects.get(name='Expenses'),
+            RecurringCost.TYPES.arrears_transactions: Account.objects.get(name='Expenses'),
+        }
+        types = [type_ for type_, _ in RecurringCost.TYPES]
+        for n in range(count):
+            type_ = types[n % len(types)]
+            to_account = Account.objects.create(
+                name='Recurring cost {}'.format(n + 1),
+                code='1{}'.format(n + 1),
+                parent=parents[type_],
+                currencies=[self.currency],
+            )
+            recurring_cost = RecurringCost.objects.create(
+                to_account=to_account,
+                type=type_,
+                fixed_amount=self.money(20, 500).amount if type_ == RecurringCost.TYPES.normal else None,
+                initial_billing_cycle=initial_billing_cycle,
+            )
+            self.create_splits(recurring_cost)
+
+    def create_one_off_costs(self, count, billing_cycles):
+        current_liabilities = Account.objects.get(name='Current Liabilities')
+        for n in range(count):
+            to_account = Account.objects.create(
+                name='One-off cost {}'.format(n + 1),
+                code='2{}'.format(n + 1),
+                parent=current_liabilities,
+                currencies=[self.currency],
+            )
+            recurring_cost = RecurringCost.objects.create(
+                to_account=to_account,
+                type=RecurringCost.TYPES.normal,
+                fixed_amount=self.money(50, 2000).amount,
+                total_billing_cycles=self.random.randint(1, 6),
+                initial_billing_cycle=self.random.choice(billing_cycles[:-1] or billing_cycles),
+            )
+            self.create_splits(recurring_cost)
+
+    def random_date(self, start_date, stop_date):
+        return start_date + timedelta(days=self.random.randint(0, max((stop_date - start_date).days, 0)))
+
+    def create_statement_lines(self, billing_cycle, count, stop_date, reconcile):
+        """Import bank statement lines for the billing cycle
+
+        Housemates pay what they owe, and the remaining lines are spending. If `reconcile`
+        is set then a transaction is created for every line.
+        """
+        start_date = billing_cycle.date_range.lower
+        statement_import = StatementImport.objects.create(bank_account=self.bank)
+
+        payments = []
+        balances = AccountBalance.objects.balances([housemate.account for housemate in self.housemates])
+        for housemate in self.housemates[:count]:
+            owed = -balances[housemate.account.pk].monies()[0].amount
+            if owed > 0:
+                payments.append((housemate.account, Money(owed, self.currency)))
+
+        for n in range(count):
+            line_date = self.random_date(start_date, stop_date)
+            if n < len(payments):
+                account, amount = payments[n]
+                description = 'Payment from {}'.format(account.name)
+            else:
+                account, amount = self.random.choice(self.spend_accounts), -self.money(5, 200)
+                description = 'Card payment {}'.format(self.random.randint(1000, 9999))
+
+            line = StatementLine.objects.create(
+                statement_import=statement_import,
+                date=line_date,
+                amount=amount.amount,
+                description=description,
+            )
+            if reconcile:
+                if amount.amount > 0:
+                    line.transaction = account.transfer_to(self.bank, amount, date=line_date, description=description)
+                else:
+                    line.transaction = self.bank.transfer_to(account, -amount, date=line_date, description=description)
+                line.save()
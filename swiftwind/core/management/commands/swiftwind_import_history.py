@@ -0,0 +1,54 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from swiftwind.accounts.history import InvalidHistory, import_history
+from swiftwind.settings.models import Settings
+
+
+class Command(BaseCommand):
+    help = 'Import historical transactions from a CSV file with the columns ' \
+           'date, description, from_account, to_account, amount & currency. ' \
+           'Accounts may be given by account code, housemate username, or account name.'
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('file', help='CSV file to import, or - to read from stdin.')
+        parser.add_argument(
+            '--currency', dest='currency',
+            help='Currency of rows which do not specify one. Defaults to the default currency setting.',
+        )
+        parser.add_argument(
+            '--batch-size', dest='batch_size', type=int,
+            help='Rows to insert at a time. Defaults to the SWIFTWIND_HISTORY_IMPORT_BATCH_SIZE setting.',
+        )
+        parser.add_argument(
+            '--dry-run', dest='dry_run', default=False, action='store_true',
+            help='Only validate the file, do not import anything.',
+        )
+
+    def handle(self, *args, **options):
+        if options.get('currency'):
+            currency = options['currency'].upper()
+        else:
+            try:
+                currency = Settings.objects.get().default_currency
+            except Settings.DoesNotExist:
+                raise CommandError('No currency specified by either --currency or by the swiftwind settings.')
+
+        try:
+            if options['file'] == '-':
+                imported = self.import_history(sys.stdin, currency, options)
+            else:
+                with open(options['file'], newline='') as f:
+                    imported = self.import_history(f, currency, options)
+        except InvalidHistory as e:
+            raise CommandError('Nothing was imported, as {} row(s) are invalid:\n{}'.format(len(e.errors), e))
+
+        if options['dry_run']:
+            self.stdout.write('{} transactions would be imported'.format(imported))
+        else:
+            self.stdout.write('Imported {} transactions'.format(imported))
+
+    def import_history(self, lines, currency, options):
+        return import_history(lines, currency, batch_size=options['batch_size'], dry_run=options['dry_run'])
@@ -0,0 +1,73 @@
+import time
+
+from swiftwind.core.performance import QueryTimer, add_render_time, stats
+from swiftwind.utilities.routers import get_replica_alias, mark_written
+
+
+class ReadYourWritesMiddleware(object):
+    """Keep a user's reads on the primary database after they make a change
+
+    Any request which may write (i.e. anything other than GET, HEAD & OPTIONS)
+    marks the user's session, see :mod:`swiftwind.utilities.routers`.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if get_replica_alias() and request.method not in ('GET', 'HEAD', 'OPTIONS') and hasattr(request, 'session'):
+            mark_written(request)
+        return response
+
+
+class PerformanceMiddleware(object):
+    """Record the time spent handling each request
+
+    Records the wall time, number of database queries, database time and
+    template render time of each request. These are returned to the client
+    in a ``Server-Timing`` header, and added to the in-memory statistics
+    for the view (see :mod:`swiftwind.core.performance`).
+
+    This is opt-in, add it to your ``MIDDLEWARE`` setting to enable it.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with QueryTimer() as queries:
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+        render = getattr(request, '_swiftwind_render_time', 0)
+
+        response['Server-Timing'] = ', '.join([
+            'db;dur={:.1f};desc="{} queries"'.format(queries.time * 1000, queries.count),
+            'render;dur={:.1f}'.format(render * 1000),
+            'total;dur={:.1f}'.format(total * 1000),
+        ])
+
+        resolver_match = getattr(request, 'resolver_match', None)
+        if resolver_match:
+            stats.record(
+                resolver_match.view_name,
+                total=total,
+                db=queries.time,
+                queries=queries.count,
+                render=render,
+            )
+        return response
+
+    def process_template_response(self, request, response):
+        if response.is_rendered:
+            # Rendered within the view, see swiftwind.core.performance.render_timed()
+            return response
+
+        start = time.perf_counter()
+
+        def rendered(response):
+            add_render_time(request, time.perf_counter() - start)
+
+        response.add_post_render_callback(rendered)
+        return response
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduledJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('last_started', models.DateTimeField(blank=True, default=None, null=True)),
+                ('last_finished', models.DateTimeField(blank=True, default=None, null=True)),
+                ('last_duration', models.FloatField(blank=True, default=None, help_text='In seconds', null=True)),
+                ('last_succeeded', models.NullBooleanField(default=None)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('runs', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+    ]
@@ -0,0 +1,162 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.postgres.fields import ArrayField
+from django.core.mail import EmailMultiAlternatives
+from django.db import models, transaction
+from django.utils import timezone
+from model_utils import Choices
+
+
+class OutboxEmailQuerySet(models.QuerySet):
+
+    def due(self, as_of=None):
+        """Emails which should be sent now
+
+        This includes those awaiting a retry, and those claimed by a worker
+        which did not finish sending them within ``SWIFTWIND_EMAIL_SEND_TIMEOUT``.
+        """
+        return self.filter(
+            status__in=[OutboxEmail.STATUSES.pending, OutboxEmail.STATUSES.sending],
+            next_attempt__lte=as_of or timezone.now(),
+        )
+
+    def release(self):
+        """Return claimed emails to the outbox, without counting an attempt to send them"""
+        return self.filter(status=OutboxEmail.STATUSES.sending).update(
+            status=OutboxEmail.STATUSES.pending,
+            next_attempt=timezone.now(),
+        )
+
+    def claim(self, limit):
+        """Claim up to `limit` due emails for sending
+
+        The emails are marked as sending in a short transaction of their own,
+        so that they can then be sent without holding any locks. Emails locked
+        by other workers are skipped.
+
+        Returns:
+            list[OutboxEmail]:
+        """
+        with transaction.atomic():
+            emails = list(self.due().select_for_update(skip_locked=True)[:limit])
+            claimed_until = timezone.now() + timedelta(seconds=settings.SWIFTWIND_EMAIL_SEND_TIMEOUT)
+            self.filter(pk__in=[email.pk for email in emails]).update(
+                status=OutboxEmail.STATUSES.sending,
+                next_attempt=claimed_until,
+            )
+        for email in emails:
+            email.status = OutboxEmail.STATUSES.sending
+            email.next_attempt = claimed_until
+        return emails
+
+
+class OutboxEmailManager(models.Manager):
+
+    def queue(self, subject, message, recipient_list, html_message=None, from_email=None):
+        """Add an email to the outbox
+
+        Takes the same arguments as Django's ``send_mail()``. The email
+        will be sent by the ``send_outbox_emails`` task, normally once the
+        current database transaction has been committed.
+        """
+        return self.create(
+            subject=subject,
+            body=message,
+            html_body=html_message or '',
+            from_email=from_email or '',
+            recipients=list(recipient_list),
+        )
+
+
+class OutboxEmail(models.Model):
+    """An email waiting to be sent, or which has been sent
+
+    Emails are added to the outbox within the same database transaction as
+    the work which caused them, and are sent in batches over a single
+    connection by :func:`swiftwind.core.tasks.send_outbox_emails`.
+    """
+    STATUSES = Choices(
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    )
+
+    created = models.DateTimeField(default=timezone.now, editable=False)
+    subject = models.CharField(max_length=255)
+    body = models.TextField(default='', blank=True)
+    html_body = models.TextField(default='', blank=True)
+    from_email = models.CharField(max_length=255, default='', blank=True)
+    recipients = ArrayField(base_field=models.CharField(max_length=255))
+
+    status = models.CharField(max_length=10, choices=STATUSES, default=STATUSES.pending, db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone.now,
+                                        help_text='The email will not be sent before this time')
+    sent = models.DateTimeField(default=None, blank=True, null=True)
+    last_error = models.TextField(default='', blank=True)
+
+    objects = OutboxEmailManager.from_queryset(OutboxEmailQuerySet)()
+
+    class Meta:
+        ordering = ['created', 'pk']
+
+    def __str__(self):
+        return '{} to {}'.format(self.subject, ', '.join(self.recipients))
+
+    def as_message(self, connection=None, subject_prefix=''):
+        message = EmailMultiAlternatives(
+            subject='{}{}'.format(subject_prefix, self.subject),
+            body=self.body,
+            from_email=self.from_email or None,
+            to=self.recipients,
+            connection=connection,
+        )
+        if self.html_body:
+            message.attach_alternative(self.html_body, 'text/html')
+        return message
+
+    def mark_sent(self):
+        self.status = self.STATUSES.sent
+        self.attempts += 1
+        self.sent = timezone.now()
+        self.last_error = ''
+
+    def mark_failed(self, error):
+        """Record a failed attempt, and schedule a retry with exponential backoff"""
+        self.attempts += 1
+        self.last_error = str(error)
+        if self.attempts >= settings.SWIFTWIND_EMAIL_MAX_ATTEMPTS:
+            self.status = self.STATUSES.failed
+        else:
+            self.status = self.STATUSES.pending
+            delay = settings.SWIFTWIND_EMAIL_RETRY_DELAY * 2 ** (self.attempts - 1)
+            self.next_attempt = timezone.now() + timedelta(seconds=delay)
+
+
+class ScheduledJob(models.Model):
+    """The most recent run of each of the scheduler's jobs
+
+    See :mod:`swiftwind.core.scheduler`.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    last_started = models.DateTimeField(default=None, blank=True, null=True)
+    last_finished = models.DateTimeField(default=None, blank=True, null=True)
+    last_duration = models.FloatField(default=None, blank=True, null=True, help_text='In seconds')
+    last_succeeded = models.NullBooleanField(default=None)
+    last_error = models.TextField(default='', blank=True)
+    runs = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+    def mark_finished(self, duration, error=None):
+        self.last_finished = timezone.now()
+        self.last_duration = duration
+        self.last_succeeded = error is None
+        self.last_error = '' if error is None else repr(error)
+        self.runs += 1
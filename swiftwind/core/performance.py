@@ -0,0 +1,122 @@
+""" In-memory request performance statistics
+
+Populated by :class:`swiftwind.core.middleware.PerformanceMiddleware`, and
+readable by staff via :class:`swiftwind.core.views.PerformanceStatsView`.
+
+Statistics are held per-process, and only the most recent
+``SWIFTWIND_PERFORMANCE_SAMPLES`` requests for each view are kept.
+"""
+import threading
+import time
+from collections import deque, OrderedDict
+
+from django.conf import settings
+from django.db import connections
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(sorted_values, percent):
+    """Get the nearest-rank percentile of a sorted list of values"""
+    if not sorted_values:
+        return None
+    index = max(int(round(percent / 100 * len(sorted_values))) - 1, 0)
+    return sorted_values[index]
+
+
+def add_render_time(request, seconds):
+    """Record time spent rendering the response to `request`, for PerformanceMiddleware"""
+    request._swiftwind_render_time = getattr(request, '_swiftwind_render_time', 0) + seconds
+
+
+def render_timed(request, response):
+    """Render a template response, recording the time taken
+
+    For views which render their own responses (rather than leaving this to
+    Django), as the middleware cannot otherwise see when rendering begins.
+    """
+    start = time.perf_counter()
+    response.render()
+    add_render_time(request, time.perf_counter() - start)
+    return response
+
+
+class QueryTimer(object):
+    """Count the queries run within this block, and the time spent on them
+
+    Django 1.11 provides no way of wrapping query execution, so this enables
+    the debug cursor and reads the new queries from each connection's query
+    log. The log holds up to 9000 queries, so very large blocks will be undercounted.
+    """
+
+    def __enter__(self):
+        self.count = 0
+        self.time = 0.0
+        self._connections = []
+        for connection in connections.all():
+            # Remember the most recent query, as the log will discard
+            # older queries once it is full
+            marker = connection.queries_log[-1] if connection.queries_log else None
+            self._connections.append((connection, connection.force_debug_cursor, marker))
+            connection.force_debug_cursor = True
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        for connection, force_debug_cursor, marker in reversed(self._connections):
+            for query in reversed(connection.queries_log):
+                if query is marker:
+                    break
+                self.count += 1
+                self.time += float(query['time'])
+            connection.force_debug_cursor = force_debug_cursor
+
+
+class ViewStats(object):
+    """Rolling samples of request timings, for each view"""
+
+    metrics = ('total', 'db', 'queries', 'render')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._samples = {}
+            self._requests = {}
+
+    def record(self, view_name, **values):
+        with self._lock:
+            if view_name not in self._samples:
+                self._samples[view_name] = deque(maxlen=settings.SWIFTWIND_PERFORMANCE_SAMPLES)
+                self._requests[view_name] = 0
+            self._samples[view_name].append(tuple(values[metric] for metric in self.metrics))
+            self._requests[view_name] += 1
+
+    def summary(self):
+        """Get the percentiles of each metric for each view
+
+        Times are in milliseconds.
+
+        Returns:
+            dict: In the form ``{view_name: {'requests': int, 'total': {'p50': float, ...}, ...}}``
+        """
+        with self._lock:
+            samples = {view_name: list(view_samples) for view_name, view_samples in self._samples.items()}
+            requests = dict(self._requests)
+
+        summary = OrderedDict()
+        for view_name in sorted(samples):
+            view_summary = OrderedDict([('requests', requests[view_name]), ('samples', len(samples[view_name]))])
+            for i, metric in enumerate(self.metrics):
+                values = sorted(sample[i] for sample in samples[view_name])
+                if metric != 'queries':
+                    values = [value * 1000 for value in values]
+                view_summary[metric] = OrderedDict(
+                    ('p{}'.format(p), round(percentile(values, p), 1)) for p in PERCENTILES
+                )
+            summary[view_name] = view_summary
+        return summary
+
+
+stats = ViewStats()
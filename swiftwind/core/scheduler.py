@@ -0,0 +1,209 @@
+""" Runs swiftwind's periodic tasks
+
+Each periodic task is registered as a :class:`Job` with a default interval,
+which can be changed (or the job disabled) using the ``SWIFTWIND_SCHEDULE``
+setting::
+
+    SWIFTWIND_SCHEDULE = {
+        'import_tellerio': 15 * 60,  # Every 15 minutes
+        'disable_costs': None,  # Never
+    }
+
+The :class:`Scheduler` (started by the ``run_scheduler`` management command)
+sleeps until the next job is due, and then dispatches it either to a local
+thread pool or to Celery (see ``SWIFTWIND_SCHEDULER_DISPATCH``). Jobs are run
+by :func:`run_job()`, which holds a Postgres advisory lock for the job's
+duration so a job never overlaps with itself (even across multiple schedulers
+or workers), and records each run in :class:`swiftwind.core.models.ScheduledJob`.
+"""
+import logging
+import random
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+
+
+class Job(object):
+    """A task to be run periodically
+
+    Args:
+        name (str): Unique name of the job
+        task (str): Import path of the Celery task to run
+        interval (int): Default number of seconds between runs
+    """
+
+    def __init__(self, name, task, interval):
+        self.name = name
+        self.task = task
+        self.default_interval = interval
+
+    def __repr__(self):
+        return '<Job {}>'.format(self.name)
+
+    @property
+    def interval(self):
+        return settings.SWIFTWIND_SCHEDULE.get(self.name, self.default_interval)
+
+    @property
+    def enabled(self):
+        return bool(self.interval)
+
+    @property
+    def lock_id(self):
+        """Key of the advisory lock held while this job is running"""
+        return zlib.crc32('swiftwind.scheduler.{}'.format(self.name).encode('utf8'))
+
+    def get_task(self):
+        return import_string(self.task)
+
+    def next_run(self, after):
+        """Get the time (as a unix timestamp) the job should next run after `after`
+
+        Runs are spread by up to ``SWIFTWIND_SCHEDULER_JITTER`` of the interval,
+        so that jobs with the same interval do not all run at once.
+        """
+        jitter = self.interval * settings.SWIFTWIND_SCHEDULER_JITTER
+        return after + self.interval + random.uniform(0, jitter)
+
+
+jobs = OrderedDict()
+
+
+def register(name, task, interval):
+    jobs[name] = Job(name, task, interval)
+    return jobs[name]
+
+
+register('populate_billing_cycles', 'swiftwind.billing_cycle.tasks.populate_billing_cycles', DAY)
+register('enact_costs', 'swiftwind.costs.tasks.enact_costs', HOUR)
+register('disable_costs', 'swiftwind.costs.tasks.disable_costs', DAY)
+register('notify_housemates', 'swiftwind.accounts.tasks.notify_housemates', HOUR)
+register('import_tellerio', 'swiftwind.accounts.tasks.import_tellerio', HOUR)
+# Emails are normally sent immediately, this retries any which failed
+register('send_outbox_emails', 'swiftwind.core.tasks.send_outbox_emails', 5 * MINUTE)
+
+
+@contextmanager
+def job_lock(job):
+    """Try to take the job's lock, yielding True if it was acquired"""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_lock(%s)', [job.lock_id])
+        acquired = cursor.fetchone()[0]
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(%s)', [job.lock_id])
+
+
+def run_job(name):
+    """Run the named job now, unless it is already running elsewhere
+
+    Returns:
+        bool: False if the job was skipped because it was already running
+    """
+    from swiftwind.core.models import ScheduledJob
+
+    job = jobs[name]
+    with job_lock(job) as acquired:
+        if not acquired:
+            logger.warning('Skipping %s as it is already running', name)
+            return False
+
+        scheduled_job, _ = ScheduledJob.objects.get_or_create(name=name)
+        scheduled_job.last_started = timezone.now()
+        scheduled_job.save()
+
+        start = time.perf_counter()
+        try:
+            job.get_task()()
+        except Exception as e:
+            logger.exception('Job %s failed', name)
+            scheduled_job.mark_finished(time.perf_counter() - start, error=e)
+        else:
+            scheduled_job.mark_finished(time.perf_counter() - start)
+        scheduled_job.save()
+    return True
+
+
+def _run_job_in_thread(name):
+    try:
+        return run_job(name)
+    finally:
+        # Each thread has its own connection, which would otherwise be left open
+        connection.close()
+
+
+class Scheduler(object):
+    """Dispatches each enabled job whenever it is due
+
+    Args:
+        dispatch (str): 'threads' to run jobs within this process, or 'celery'
+                        to send them to a Celery worker
+        workers (int): Number of threads used to run jobs (when dispatching to threads)
+    """
+
+    def __init__(self, dispatch=None, workers=None):
+        self.dispatch = dispatch or settings.SWIFTWIND_SCHEDULER_DISPATCH
+        if self.dispatch == 'threads':
+            self.executor = ThreadPoolExecutor(max_workers=workers or settings.SWIFTWIND_SCHEDULER_WORKERS)
+        self.due = {}
+
+    def load(self, now=None):
+        """Schedule each enabled job, based upon when it last ran"""
+        from swiftwind.core.models import ScheduledJob
+
+        now = now or time.time()
+        last_started = dict(ScheduledJob.objects.values_list('name', 'last_started'))
+        self.due = {}
+        for job in jobs.values():
+            if not job.enabled:
+                continue
+            if last_started.get(job.name):
+                self.due[job.name] = max(job.next_run(last_started[job.name].timestamp()), now)
+            else:
+                self.due[job.name] = now
+
+    def run_pending(self, now=None):
+        """Dispatch all jobs which are due
+
+        Returns:
+            float: Unix timestamp of when the next job is due
+        """
+        now = now or time.time()
+        for name, due in sorted(self.due.items(), key=lambda item: item[1]):
+            if due <= now:
+                self.dispatch_job(jobs[name])
+                self.due[name] = jobs[name].next_run(now)
+        return min(self.due.values())
+
+    def dispatch_job(self, job):
+        logger.info('Dispatching %s', job.name)
+        if self.dispatch == 'celery':
+            from swiftwind.core.tasks import run_scheduled_job
+            run_scheduled_job.delay(job.name)
+        else:
+            self.executor.submit(_run_job_in_thread, job.name)
+
+    def run_forever(self):
+        self.load()
+        if not self.due:
+            logger.warning('No jobs are enabled')
+            return
+        while True:
+            next_due = self.run_pending()
+            time.sleep(max(next_due - time.time(), 0))
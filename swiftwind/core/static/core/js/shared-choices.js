@@ -0,0 +1,18 @@
+// Copy the options of each <select data-choices-from="..."> from the <select>
+// with the given id, keeping its current value. See swiftwind.accounts.forms
+document.addEventListener('DOMContentLoaded', function () {
+    var selects = document.querySelectorAll('select[data-choices-from]');
+    Array.prototype.forEach.call(selects, function (select) {
+        var source = document.getElementById(select.getAttribute('data-choices-from'));
+        if (!source) {
+            return;
+        }
+        var value = select.value;
+        select.innerHTML = source.innerHTML;
+        select.value = value;
+        if (select.selectedIndex >= 0) {
+            // So the select is not seen as having been changed
+            select.options[select.selectedIndex].defaultSelected = true;
+        }
+    });
+});
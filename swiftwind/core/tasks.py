@@ -0,0 +1,116 @@
+import logging
+import smtplib
+import time
+
+from celery import shared_task
+from django.conf import settings
+from django.db import transaction
+
+from swiftwind.core.models import OutboxEmail
+from swiftwind.settings.models import Settings
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def send_outbox_emails():
+    """Send all due emails in the outbox
+
+    Emails are sent in batches over a single connection (configured by the
+    SMTP settings). Each batch is claimed in a short transaction before
+    sending, so no transaction or lock is held while talking to the SMTP
+    server, and multiple workers may run this concurrently. Failed emails
+    are retried later with an exponential backoff.
+
+    If the connection is lost it is reopened once. Should that fail too, the
+    rest of the batch is released (without counting it as an attempt) for a
+    later run to send, and this run stops.
+
+    Returns:
+        int: The number of emails sent
+    """
+    swiftwind_settings = Settings.objects.get()
+    connection = swiftwind_settings.get_email_connection()
+    rate_limit = settings.SWIFTWIND_EMAIL_RATE_LIMIT
+    sent = 0
+    last_sent_at = None
+    reconnected = False
+
+    try:
+        connection.open()
+    except (smtplib.SMTPException, OSError):
+        # Nothing has been claimed, so the emails will be sent by a later run
+        logger.exception('Could not connect to the mail server')
+        return 0
+
+    try:
+        disconnected = False
+        while not disconnected:
+            batch = OutboxEmail.objects.claim(settings.SWIFTWIND_EMAIL_BATCH_SIZE)
+            if not batch:
+                break
+
+            for i, email in enumerate(batch):
+                if rate_limit and last_sent_at:
+                    time.sleep(max(0, last_sent_at + 1 / rate_limit - time.time()))
+                last_sent_at = time.time()
+
+                message = email.as_message(connection, subject_prefix=swiftwind_settings.smtp_subject_prefix)
+                try:
+                    connection.send_messages([message])
+                except (smtplib.SMTPException, OSError) as e:
+                    error = e
+                else:
+                    error = None
+
+                if is_disconnection(error) and not reconnected:
+                    reconnected = True
+                    logger.warning('Lost the connection to the mail server, reconnecting: %s', error)
+                    try:
+                        connection.close()
+                        connection.open()
+                        connection.send_messages([message])
+                    except (smtplib.SMTPException, OSError) as e:
+                        error = e
+                    else:
+                        error = None
+
+                if is_disconnection(error):
+                    # Not the fault of this email, so leave the rest for a later run
+                    logger.error('Lost the connection to the mail server: %s', error)
+                    OutboxEmail.objects.filter(pk__in=[unsent.pk for unsent in batch[i:]]).release()
+                    disconnected = True
+                    break
+
+                if error:
+                    email.mark_failed(error)
+                else:
+                    email.mark_sent()
+                    sent += 1
+                email.save()
+    finally:
+        connection.close()
+
+    return sent
+
+
+def is_disconnection(error):
+    """Was `error` caused by the connection to the mail server, rather than by the email being sent?
+
+    Note that all SMTP errors are also OSErrors.
+    """
+    return isinstance(error, smtplib.SMTPServerDisconnected) or (
+        isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+    )
+
+
+def send_outbox_emails_on_commit():
+    """Send the outbox once the current transaction has been committed"""
+    transaction.on_commit(send_outbox_emails.delay)
+
+
+@shared_task
+def run_scheduled_job(name):
+    """Run a job dispatched by the scheduler (see swiftwind.core.scheduler)"""
+    from swiftwind.core.scheduler import run_job
+    return run_job(name)
@@ -1,18 +1,25 @@
 from django import template
 from hordak.models import Account, StatementLine
 
+from swiftwind.accounts.models import AccountBalance
+from swiftwind.utilities.routers import replica_reads
+
 register = template.Library()
 
-@register.simple_tag
-def housemate_accounts():
-    return Account.objects.filter(children=None).filter(parent__name='Housemate Income')
+@register.simple_tag(takes_context=True)
+def housemate_accounts(context):
+    with replica_reads(context.get('request')):
+        accounts = Account.objects.filter(children=None).filter(parent__name='Housemate Income').select_related('housemate')
+        return AccountBalance.objects.attach(accounts)
 
 
-@register.simple_tag
-def other_accounts():
-    return Account.objects.filter(children=None).exclude(parent__name='Housemate Income')
+@register.simple_tag(takes_context=True)
+def other_accounts(context):
+    with replica_reads(context.get('request')):
+        return list(Account.objects.filter(children=None).exclude(parent__name='Housemate Income'))
 
 
-@register.simple_tag
-def total_unreconciled():
-    return StatementLine.objects.filter(transaction=None).count()
+@register.simple_tag(takes_context=True)
+def total_unreconciled(context):
+    with replica_reads(context.get('request')):
+        return StatementLine.objects.filter(transaction=None).count()
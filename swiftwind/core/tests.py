@@ -1,9 +1,34 @@
-from django.test.testcases import TestCase
+import json
+import smtplib
+from io import StringIO
+from unittest.mock import patch
 
+from django.core import mail
+from django.core.management import call_command
+from django.core.mail.backends import locmem, smtp
+from django.core.management.base import CommandError
+from django.db import transaction
+from django.urls import reverse
+from django.http.response import HttpResponse
+from django.test import RequestFactory, override_settings, modify_settings
+from django.test.testcases import SimpleTestCase, TestCase
+from django.utils import timezone
+from django.utils.timezone import datetime
+from freezegun import freeze_time
+from pytz import UTC
+
+from swiftwind.accounts.models import AccountBalance
 from swiftwind.core.exceptions import CannotCreateMultipleSettingsInstances
 from swiftwind.core.management.commands.swiftwind_create_accounts import Command as CreateChartOfAccountsCommand
-from hordak.models.core import Account
+from swiftwind.core.middleware import ReadYourWritesMiddleware
+from swiftwind.core.performance import stats
+from swiftwind.core.models import OutboxEmail, ScheduledJob
+from swiftwind.core.scheduler import Scheduler, jobs, run_job
+from swiftwind.core.tasks import send_outbox_emails
+from hordak.models.core import Account, StatementLine
+from swiftwind.housemates.models import Housemate
 from swiftwind.settings.models import Settings
+from swiftwind.utilities.routers import ReadReplicaRouter, replica_reads, primary_reads
 from swiftwind.utilities.testing import DataProvider
 
 
@@ -47,3 +72,309 @@ class SettingsTestCase(TestCase):
         Settings.objects.get()
         with self.assertRaises(CannotCreateMultipleSettingsInstances):
             Settings.objects.create()
+
+
+class OutboxEmailTestCase(TestCase):
+
+    def queue(self, n=1):
+        for i in range(n):
+            OutboxEmail.objects.queue(
+                subject='Subject {}'.format(i),
+                message='Body',
+                recipient_list=['user{}@example.com'.format(i)],
+                html_message='<html></html>',
+            )
+
+    def test_send(self):
+        self.queue(3)
+        self.assertEqual(len(mail.outbox), 0)
+
+        self.assertEqual(send_outbox_emails(), 3)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[0].subject, '[swiftwind] Subject 0')
+        self.assertEqual(mail.outbox[0].alternatives[0], ('<html></html>', 'text/html'))
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxEmail.STATUSES.sent).count(), 3)
+
+        # Already sent, so not sent again
+        self.assertEqual(send_outbox_emails(), 0)
+
+    def test_send_uses_one_connection(self):
+        self.queue(5)
+        with patch.object(locmem.EmailBackend, 'open') as mock_open:
+            send_outbox_emails()
+        self.assertEqual(mock_open.call_count, 1)
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_send_batches(self):
+        self.queue(5)
+        with self.settings(SWIFTWIND_EMAIL_BATCH_SIZE=2):
+            self.assertEqual(send_outbox_emails(), 5)
+
+    def test_failure_retried_with_backoff(self):
+        self.queue(1)
+        with patch.object(locmem.EmailBackend, 'send_messages', side_effect=smtplib.SMTPException('Nope')):
+            self.assertEqual(send_outbox_emails(), 0)
+
+        email = OutboxEmail.objects.get()
+        self.assertEqual(email.status, OutboxEmail.STATUSES.pending)
+        self.assertEqual(email.attempts, 1)
+        self.assertEqual(email.last_error, 'Nope')
+        self.assertGreater(email.next_attempt, timezone.now())
+
+        # Not due yet
+        self.assertEqual(send_outbox_emails(), 0)
+
+        OutboxEmail.objects.update(next_attempt=timezone.now())
+        self.assertEqual(send_outbox_emails(), 1)
+
+    def test_failure_gives_up(self):
+        self.queue(1)
+        with self.settings(SWIFTWIND_EMAIL_MAX_ATTEMPTS=1), \
+                patch.object(locmem.EmailBackend, 'send_messages', side_effect=smtplib.SMTPException('Nope')):
+            send_outbox_emails()
+
+        self.assertEqual(OutboxEmail.objects.get().status, OutboxEmail.STATUSES.failed)
+
+    def test_connection_failure(self):
+        self.queue(1)
+        with patch.object(locmem.EmailBackend, 'open', side_effect=OSError('Refused')):
+            self.assertEqual(send_outbox_emails(), 0)
+
+        email = OutboxEmail.objects.get()
+        self.assertEqual(email.status, OutboxEmail.STATUSES.pending)
+        self.assertEqual(email.attempts, 0)
+
+    def test_reconnects_once(self):
+        self.queue(3)
+        with patch.object(locmem.EmailBackend, 'open') as mock_open, \
+                patch.object(locmem.EmailBackend, 'send_messages',
+                             side_effect=[smtplib.SMTPServerDisconnected('Gone'), 1, 1, 1]):
+            self.assertEqual(send_outbox_emails(), 3)
+
+        self.assertEqual(mock_open.call_count, 2)
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxEmail.STATUSES.sent, attempts=1).count(), 3)
+
+    def test_disconnected_releases_batch(self):
+        self.queue(3)
+        with patch.object(locmem.EmailBackend, 'send_messages', side_effect=OSError('Reset')) as mock_send:
+            self.assertEqual(send_outbox_emails(), 0)
+
+        # Sent, and retried after reconnecting, then the run stops
+        self.assertEqual(mock_send.call_count, 2)
+        for email in OutboxEmail.objects.all():
+            self.assertEqual(email.status, OutboxEmail.STATUSES.pending)
+            self.assertEqual(email.attempts, 0)
+            self.assertLessEqual(email.next_attempt, timezone.now())
+
+        self.assertEqual(send_outbox_emails(), 3)
+
+    def test_claim(self):
+        self.queue(3)
+        self.assertEqual(len(OutboxEmail.objects.claim(2)), 2)
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxEmail.STATUSES.sending).count(), 2)
+
+        # Claimed emails are not sent by another worker...
+        self.assertEqual(send_outbox_emails(), 1)
+
+        # ...unless they were not sent in time
+        OutboxEmail.objects.filter(status=OutboxEmail.STATUSES.sending).update(next_attempt=timezone.now())
+        self.assertEqual(send_outbox_emails(), 2)
+
+    def test_smtp_connection_from_settings(self):
+        settings = Settings.objects.get()
+        settings.smtp_host = 'mail.example.com'
+        settings.smtp_port = 587
+        settings.smtp_user = 'user'
+        settings.smtp_use_tls = True
+
+        connection = settings.get_email_connection()
+        self.assertIsInstance(connection, smtp.EmailBackend)
+        self.assertEqual(connection.host, 'mail.example.com')
+        self.assertEqual(connection.port, 587)
+        self.assertEqual(connection.username, 'user')
+        self.assertTrue(connection.use_tls)
+
+
+@override_settings(SWIFTWIND_READ_REPLICA_ALIAS='replica')
+class ReadReplicaRouterTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.router = ReadReplicaRouter()
+        self.factory = RequestFactory()
+
+    def make_request(self, method='get'):
+        request = getattr(self.factory, method)('/')
+        request.session = {}
+        return request
+
+    def test_reads_use_primary_by_default(self):
+        self.assertEqual(self.router.db_for_read(Account), 'default')
+
+    def test_replica_reads(self):
+        with replica_reads(self.make_request()):
+            self.assertEqual(self.router.db_for_read(Account), 'replica')
+            self.assertEqual(self.router.db_for_write(Account), 'default')
+            with primary_reads():
+                self.assertEqual(self.router.db_for_read(Account), 'default')
+            self.assertEqual(self.router.db_for_read(Account), 'replica')
+        self.assertEqual(self.router.db_for_read(Account), 'default')
+
+    @override_settings(SWIFTWIND_READ_REPLICA_ALIAS=None)
+    def test_no_replica_configured(self):
+        with replica_reads(self.make_request()):
+            self.assertEqual(self.router.db_for_read(Account), 'default')
+
+    def test_read_your_writes(self):
+        middleware = ReadYourWritesMiddleware(lambda request: HttpResponse())
+        request = self.make_request('post')
+        middleware(request)
+
+        # Subsequent requests in the same session read from the primary
+        next_request = self.make_request()
+        next_request.session = request.session
+        with replica_reads(next_request):
+            self.assertEqual(self.router.db_for_read(Account), 'default')
+
+    def test_no_migrations_on_replica(self):
+        self.assertFalse(self.router.allow_migrate('replica', 'hordak'))
+        self.assertIsNone(self.router.allow_migrate('default', 'hordak'))
+
+
+class GenerateDataAndBenchmarkTestCase(TestCase):
+
+    def generate(self, seed=1):
+        call_command(
+            'swiftwind_generate_data', seed=seed, housemates=3, recurring_costs=3, one_off_costs=2,
+            years=1, statement_lines=5, as_of='2000-06-15', stdout=StringIO(),
+        )
+
+    def test_generate_data(self):
+        self.generate()
+        self.assertEqual(Housemate.objects.count(), 3)
+        self.assertTrue(StatementLine.objects.filter(transaction=None).exists())
+        self.assertTrue(StatementLine.objects.exclude(transaction=None).exists())
+        for account in Account.objects.all():
+            self.assertEqual(AccountBalance.objects.balance_of(account), account.balance())
+
+    def test_generate_data_is_reproducible(self):
+        with self.assertRaises(CommandError):
+            with transaction.atomic():
+                self.generate()
+                amounts = list(StatementLine.objects.order_by('pk').values_list('date', 'amount'))
+                # Generating into a non-empty database fails, rolling back the above
+                self.generate()
+
+        self.generate()
+        self.assertEqual(list(StatementLine.objects.order_by('pk').values_list('date', 'amount')), amounts)
+
+    def test_benchmark(self):
+        self.generate()
+        out = StringIO()
+        with freeze_time('2000-06-15'):
+            call_command('swiftwind_benchmark', repeat=1, scenario=['enact', 'dashboard', 'statement'], stdout=out)
+
+        results = json.loads(out.getvalue())
+        self.assertEqual(results['dataset']['housemates'], 3)
+        self.assertEqual(set(results['scenarios']), {'enact', 'dashboard', 'statement'})
+        self.assertGreater(results['scenarios']['dashboard']['queries'], 0)
+
+    def test_benchmark_import_history(self):
+        self.generate()
+        out = StringIO()
+        with freeze_time('2000-06-15'):
+            call_command('swiftwind_benchmark', repeat=1, scenario=['import_history'], import_rows=50, stdout=out)
+
+        # Set-based, so the query count does not depend upon the number of rows
+        self.assertLess(json.loads(out.getvalue())['scenarios']['import_history']['queries'], 50)
+
+
+@modify_settings(MIDDLEWARE={'append': 'swiftwind.core.middleware.PerformanceMiddleware'})
+class PerformanceMiddlewareTestCase(DataProvider, TestCase):
+
+    def setUp(self):
+        stats.reset()
+        CreateChartOfAccountsCommand().handle(currency='GBP')
+        self.user = self.login()
+
+    def test_server_timing(self):
+        response = self.client.get(reverse('dashboard:dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('render;dur=', response['Server-Timing'])
+        self.assertIn('total;dur=', response['Server-Timing'])
+
+        summary = stats.summary()
+        self.assertEqual(summary['dashboard:dashboard']['requests'], 1)
+        self.assertGreater(summary['dashboard:dashboard']['queries']['p50'], 0)
+
+    def test_render_time_of_view_rendered_response(self):
+        # The dashboard renders its own response (see ReplicaReadMixin), before the middleware sees it
+        self.client.get(reverse('dashboard:dashboard'))
+        self.assertGreater(stats.summary()['dashboard:dashboard']['render']['p50'], 0)
+
+    def test_stats_view_staff_only(self):
+        response = self.client.get(reverse('core:performance'))
+        self.assertNotEqual(response.status_code, 200)
+
+        self.user.is_staff = True
+        self.user.save()
+        self.client.get(reverse('dashboard:dashboard'))
+        response = self.client.get(reverse('core:performance'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('dashboard:dashboard', response.json())
+
+
+class SchedulerTestCase(TestCase):
+
+    @patch('swiftwind.costs.tasks.disable_costs')
+    def test_run_job(self, task):
+        self.assertTrue(run_job('disable_costs'))
+        self.assertEqual(task.call_count, 1)
+
+        scheduled_job = ScheduledJob.objects.get(name='disable_costs')
+        self.assertEqual(scheduled_job.runs, 1)
+        self.assertEqual(scheduled_job.last_succeeded, True)
+        self.assertIsNotNone(scheduled_job.last_started)
+        self.assertIsNotNone(scheduled_job.last_duration)
+
+    @patch('swiftwind.costs.tasks.disable_costs', side_effect=ValueError('Oh no'))
+    def test_run_job_failed(self, task):
+        run_job('disable_costs')
+        scheduled_job = ScheduledJob.objects.get(name='disable_costs')
+        self.assertEqual(scheduled_job.last_succeeded, False)
+        self.assertIn('Oh no', scheduled_job.last_error)
+
+    @override_settings(SWIFTWIND_SCHEDULE={name: None for name in jobs}, SWIFTWIND_SCHEDULER_JITTER=0)
+    def test_disabled(self):
+        scheduler = Scheduler()
+        scheduler.load()
+        self.assertEqual(scheduler.due, {})
+
+    @override_settings(SWIFTWIND_SCHEDULE=dict(disable_costs=None), SWIFTWIND_SCHEDULER_JITTER=0)
+    def test_run_pending(self):
+        ScheduledJob.objects.create(name='enact_costs', last_started=datetime(2000, 1, 1, 11, 30, tzinfo=UTC))
+        now = datetime(2000, 1, 1, 12, 0, tzinfo=UTC).timestamp()
+
+        scheduler = Scheduler()
+        scheduler.load(now=now)
+        self.assertNotIn('disable_costs', scheduler.due)
+        # Last ran half an hour ago, so due in half an hour
+        self.assertEqual(scheduler.due['enact_costs'], now + 30 * 60)
+        # Never run, so due immediately
+        self.assertEqual(scheduler.due['populate_billing_cycles'], now)
+
+        with patch.object(scheduler, 'dispatch_job') as dispatch_job:
+            next_due = scheduler.run_pending(now=now)
+
+        dispatched = [call[0][0].name for call in dispatch_job.call_args_list]
+        self.assertNotIn('enact_costs', dispatched)
+        self.assertIn('populate_billing_cycles', dispatched)
+        self.assertEqual(next_due, now + 5 * 60)  # send_outbox_emails
+        self.assertEqual(scheduler.due['populate_billing_cycles'], now + 24 * 60 * 60)
+
+    @override_settings(SWIFTWIND_SCHEDULER_JITTER=0.5)
+    def test_jitter(self):
+        next_runs = {jobs['enact_costs'].next_run(0) for _ in range(10)}
+        self.assertGreater(len(next_runs), 1)
+        for next_run in next_runs:
+            self.assertTrue(60 * 60 <= next_run <= 90 * 60)
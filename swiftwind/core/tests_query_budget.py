@@ -0,0 +1,332 @@
+""" Query budgets for swiftwind's views and tasks
+
+Each view is loaded against a generated dataset, and must execute no more
+than its budgeted number of queries. More housemates, costs and billing
+cycles are then added, and the view must execute no more queries than it
+did before. This catches queries being run for each row displayed, which
+small test datasets would otherwise hide.
+
+Tasks necessarily insert rows for each housemate & cost, so may only make
+the additional queries for those inserts (see PER_HOUSEMATE_BUDGET etc).
+
+Not covered here:
+
+  - Views provided by hordak
+  - ``billing_cycles:enact``, ``billing_cycles:reenact`` & ``billing_cycles:send``, which
+    only call the enact_all_costs(), reenact_all_costs() & send_statements() tasks below
+  - ``setup:index``, which redirects once swiftwind has been set up, and so is only
+    ever used with an empty database
+  - ``transactions:auto_reconcile``, whose queries scale with the number of unreconciled
+    statement lines rather than housemates & costs. See the ``match_payments`` scenario
+    of the ``swiftwind_benchmark`` command
+"""
+import json
+import re
+from collections import Counter
+from unittest import expectedFailure
+from decimal import Decimal
+from io import StringIO
+
+from dateutil.relativedelta import relativedelta
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from freezegun import freeze_time
+from hordak.models import Account
+
+from swiftwind.billing_cycle.models import BillingCycle
+from swiftwind.costs.models import RecurringCost, RecurringCostSplit
+from swiftwind.housemates.models import Housemate
+from swiftwind.utilities.testing import DataProvider
+
+# Maximum queries for any view not listed in VIEW_BUDGETS
+DEFAULT_VIEW_BUDGET = 50
+
+VIEW_BUDGETS = {}
+
+# The additional queries a task may make for each row added by grow(). These are the inserts
+# which cannot be avoided without inserting in bulk:
+#   - Sending statements queues an OutboxEmail for each housemate
+#   - Enacting a cost inserts its Transaction & RecurredCost...
+#   - ...and a Leg for the cost's account and each of its splits
+PER_HOUSEMATE_BUDGET = 1
+PER_COST_BUDGET = 2
+PER_LEG_BUDGET = 1
+
+# Number of each added by grow()
+GROW_BY = 3
+
+
+class Rollback(Exception):
+    pass
+
+
+def format_duplicate_queries(queries):
+    """List the queries which were run more than once, ignoring their parameters"""
+    normalised = Counter(
+        re.sub(r"'[^']*'|\b\d+(\.\d+)?\b", '?', query['sql'])
+        for query in queries
+    )
+    duplicates = [(count, sql) for sql, count in normalised.items() if count > 1]
+    if not duplicates:
+        return 'No duplicated queries'
+    return 'Duplicated queries:\n\n' + '\n\n'.join(
+        '{}x {}'.format(count, sql) for count, sql in sorted(duplicates, reverse=True)
+    )
+
+
+class QueryBudgetTestCase(DataProvider, TestCase):
+
+    def setUp(self):
+        freezer = freeze_time('2000-06-15')
+        freezer.start()
+        self.addCleanup(freezer.stop)
+
+        call_command(
+            'swiftwind_generate_data', housemates=5, recurring_costs=6, one_off_costs=3,
+            years=1, statement_lines=10, as_of='2000-06-15', stdout=StringIO(),
+        )
+        self.login()
+        self.current_billing_cycle = BillingCycle.objects.filter(transactions_created=True).last()
+        self.statement_housemate = Housemate.objects.first()
+
+    def grow(self):
+        """Add housemates, costs & billing cycles, with every housemate paying a share of every cost"""
+        # Explicit codes, as the generated accounts do not use DataProvider's numbering
+        for n in range(GROW_BY):
+            self.housemate(account_kwargs=dict(currencies=['GBP'], code='9{}'.format(n)))
+        current_liabilities = Account.objects.get(name='Current Liabilities')
+        for n in range(GROW_BY):
+            RecurringCost.objects.create(
+                to_account=self.account(parent=current_liabilities, currencies=['GBP'], code='9{}'.format(n)),
+                fixed_amount=Decimal('100'),
+                initial_billing_cycle=BillingCycle.objects.first(),
+            )
+
+        for recurring_cost in RecurringCost.objects.all():
+            for housemate in Housemate.objects.all():
+                RecurringCostSplit.objects.get_or_create(recurring_cost=recurring_cost, from_account=housemate.account)
+
+        # Earlier billing cycles, so that lists of cycles grow too
+        first_billing_cycle = BillingCycle.objects.first()
+        for n in range(1, GROW_BY + 1):
+            BillingCycle.objects.create(date_range=(
+                first_billing_cycle.date_range.lower - relativedelta(months=n),
+                first_billing_cycle.date_range.lower - relativedelta(months=n - 1),
+            ))
+
+    def create_deletable_cost(self, **kwargs):
+        """Create a cost with no transactions, as costs with transactions cannot be deleted"""
+        recurring_cost = RecurringCost.objects.create(
+            to_account=self.account(
+                parent=Account.objects.get(name='Current Liabilities'), currencies=['GBP'], code='80',
+            ),
+            fixed_amount=Decimal('100'),
+            initial_billing_cycle=BillingCycle.objects.last(),
+            **kwargs
+        )
+        RecurringCostSplit.objects.create(recurring_cost=recurring_cost, from_account=self.statement_housemate.account)
+        return recurring_cost
+
+    def count_queries(self, fn, rollback=False):
+        """Run `fn` once to warm any caches, then again counting its queries"""
+        for _ in range(2):
+            try:
+                with transaction.atomic(), CaptureQueriesContext(connection) as queries:
+                    fn()
+                    if rollback:
+                        raise Rollback()
+            except Rollback:
+                pass
+        return queries.captured_queries
+
+    def assertQueriesWithin(self, queries, budget, description):
+        self.assertLessEqual(
+            len(queries), budget,
+            '{} ran {} queries, budget is {}. {}'.format(
+                description, len(queries), budget, format_duplicate_queries(queries)
+            )
+        )
+
+    def request(self, name, *args, method='get', status_code=200, **kwargs):
+        response = getattr(self.client, method)(
+            reverse(name, args=[arg() if callable(arg) else arg for arg in args]), **kwargs
+        )
+        self.assertEqual(response.status_code, status_code)
+        if response.streaming:
+            # Streamed responses only query as their content is consumed
+            b''.join(response.streaming_content)
+        return response
+
+    def assertViewBudget(self, name, *args, method='get', status_code=200, **kwargs):
+        def request():
+            self.request(name, *args, method=method, status_code=status_code, **kwargs)
+
+        rollback = method != 'get'
+        queries = self.count_queries(request, rollback=rollback)
+        self.assertQueriesWithin(queries, VIEW_BUDGETS.get(name, DEFAULT_VIEW_BUDGET), name)
+
+        self.grow()
+        self.assertQueriesWithin(
+            self.count_queries(request, rollback=rollback), len(queries),
+            '{} (with more housemates, costs & billing cycles)'.format(name)
+        )
+
+    def count_rows(self):
+        return dict(
+            housemates=Housemate.objects.count(),
+            costs=RecurringCost.objects.count(),
+            splits=RecurringCostSplit.objects.count(),
+        )
+
+    def assertTaskBudget(self, description, fn):
+        queries = self.count_queries(fn, rollback=True)
+        before = self.count_rows()
+        self.grow()
+        after = self.count_rows()
+
+        added = {key: after[key] - before[key] for key in after}
+        self.assertQueriesWithin(
+            self.count_queries(fn, rollback=True),
+            len(queries) +
+            added['housemates'] * PER_HOUSEMATE_BUDGET +
+            added['costs'] * PER_COST_BUDGET +
+            (added['costs'] + added['splits']) * PER_LEG_BUDGET,
+            '{} (with more housemates & costs)'.format(description),
+        )
+
+    # Views
+
+    def test_dashboard(self):
+        self.assertViewBudget('dashboard:dashboard')
+
+    def test_accounts_overview(self):
+        self.assertViewBudget('accounts:overview')
+
+    def test_housemate_statement(self):
+        self.assertViewBudget('accounts:housemate_statement', lambda: self.statement_housemate.uuid)
+
+    def test_housemate_statement_historical(self):
+        self.assertViewBudget(
+            'accounts:housemate_statement_historical',
+            lambda: self.statement_housemate.uuid, str(self.current_billing_cycle.date_range.lower),
+        )
+
+    def test_housemate_statement_email(self):
+        self.assertViewBudget(
+            'accounts:housemate_statement_email',
+            lambda: self.statement_housemate.uuid, str(self.current_billing_cycle.date_range.lower),
+        )
+
+    def test_reconciliation_required_email(self):
+        self.assertViewBudget('accounts:housemate_reconciliation_required_email')
+
+    def test_billing_cycles(self):
+        self.assertViewBudget('billing_cycles:list')
+
+    def test_recurring_costs(self):
+        self.assertViewBudget('costs:recurring')
+
+    def test_one_off_costs(self):
+        self.assertViewBudget('costs:one_off')
+
+    def test_create_recurring_cost(self):
+        self.assertViewBudget('costs:create_recurring')
+
+    def test_create_one_off_cost(self):
+        self.assertViewBudget('costs:create_one_off')
+
+    def test_create_housemate(self):
+        self.assertViewBudget('housemates:create')
+
+    def test_delete_recurring_cost(self):
+        self.assertViewBudget('costs:delete_recurring', self.create_deletable_cost().uuid)
+
+    def test_delete_one_off_cost(self):
+        self.assertViewBudget('costs:delete_one_off', self.create_deletable_cost(total_billing_cycles=1).uuid)
+
+    def test_archive_recurring_cost(self):
+        cost = RecurringCost.objects.recurring().first()
+        self.assertViewBudget('costs:archive_recurring', cost.uuid, method='post', status_code=302)
+
+    def test_unarchive_recurring_cost(self):
+        cost = RecurringCost.objects.recurring().first()
+        self.assertViewBudget('costs:unarchive_recurring', cost.uuid, method='post', status_code=302)
+
+    def test_archive_one_off_cost(self):
+        cost = RecurringCost.objects.one_off().first()
+        self.assertViewBudget('costs:archive_one_off', cost.uuid, method='post', status_code=302)
+
+    def test_unarchive_one_off_cost(self):
+        cost = RecurringCost.objects.one_off().first()
+        self.assertViewBudget('costs:unarchive_one_off', cost.uuid, method='post', status_code=302)
+
+    def assertUpdateCostBudget(self, name, cost):
+        split = cost.splits.first()
+        self.assertViewBudget(
+            name, cost.uuid, method='post', content_type='application/json',
+            data=json.dumps({'splits': {str(split.pk): str(split.portion + 1)}}),
+        )
+
+    def test_update_recurring_cost(self):
+        self.assertUpdateCostBudget('costs:update_recurring', RecurringCost.objects.recurring().first())
+
+    def test_update_one_off_cost(self):
+        self.assertUpdateCostBudget('costs:update_one_off', RecurringCost.objects.one_off().first())
+
+    def test_export_ledger(self):
+        self.assertViewBudget('accounts:export_ledger', 'csv')
+
+    def test_housemate_export(self):
+        self.assertViewBudget('accounts:housemate_export', lambda: self.statement_housemate.uuid, 'jsonl')
+
+    def test_performance(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.assertViewBudget('core:performance')
+
+    def test_housemates(self):
+        self.assertViewBudget('housemates:list')
+
+    def test_update_housemate(self):
+        self.assertViewBudget('housemates:update', lambda: self.statement_housemate.uuid)
+
+    def test_settings(self):
+        for name in ('settings:general', 'settings:technical', 'settings:teller', 'settings:email'):
+            queries = self.count_queries(lambda: self.client.get(reverse(name)))
+            self.assertQueriesWithin(queries, DEFAULT_VIEW_BUDGET, name)
+
+    # Tasks
+
+    # Each cost is checked & enacted individually (has_enacted(), its to_account & splits, each
+    # split's from_account, and an UPDATE by transaction.legs.add() for each leg), and each
+    # housemate's statement is built for the snapshots
+    @expectedFailure
+    def test_enact_all_costs(self):
+        self.assertTaskBudget('enact_all_costs()', lambda: self.current_billing_cycle.get_next().enact_all_costs())
+
+    # As enact_all_costs(), plus each cost is saved as it is re-enabled
+    @expectedFailure
+    def test_reenact_all_costs(self):
+        self.assertTaskBudget('reenact_all_costs()', lambda: self.current_billing_cycle.reenact_all_costs())
+
+    # Each cost is saved as it is re-enabled, and each housemate's statement is built for the snapshots
+    @expectedFailure
+    def test_unenact_all_costs(self):
+        self.assertTaskBudget('unenact_all_costs()', lambda: self.current_billing_cycle.unenact_all_costs())
+
+    # Each housemate's statement is fetched for rendering
+    @expectedFailure
+    def test_send_statements(self):
+        self.assertTaskBudget('send_statements()', lambda: self.current_billing_cycle.send_statements(force=True))
+
+    def test_populate(self):
+        queries = self.count_queries(lambda: BillingCycle.populate(), rollback=True)
+        self.grow()
+        self.assertQueriesWithin(
+            self.count_queries(lambda: BillingCycle.populate(), rollback=True),
+            len(queries),
+            'BillingCycle.populate() (with more housemates & costs)',
+        )
@@ -0,0 +1,15 @@
+from django.contrib.auth.mixins import UserPassesTestMixin
+from django.http import JsonResponse
+from django.views import View
+
+from swiftwind.core.performance import stats
+
+
+class PerformanceStatsView(UserPassesTestMixin, View):
+    """Request timing percentiles for each view, as recorded by PerformanceMiddleware"""
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request):
+        return JsonResponse(stats.summary())
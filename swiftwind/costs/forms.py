@@ -1,31 +1,40 @@
 from datetime import timedelta, date
 from django import forms
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import transaction
 from django.utils.datetime_safe import datetime
+from django.utils.functional import cached_property
 from hordak.models import Account
-from mptt.forms import TreeNodeChoiceField
 
 from hordak.utilities.currency import Balance
+from swiftwind.accounts.forms import AccountChoiceField
 from swiftwind.billing_cycle.models import BillingCycle
 from .models import RecurringCost, RecurringCostSplit
-from swiftwind.utilities.formsets import nested_model_formset_factory
+from swiftwind.utilities.formsets import nested_model_formset_factory, BasePrefetchedInlineFormSet, \
+    BaseNestedModelFormSet
 
 
 class AbstractCostForm(forms.ModelForm):
-    to_account = TreeNodeChoiceField(queryset=Account.objects.all(), to_field_name='uuid')
+    to_account = AccountChoiceField()
 
     class Meta:
         model = RecurringCost
         fields = []
 
     def __init__(self, *args, **kwargs):
+        # See BaseCostFormSet
+        account_choices = kwargs.pop('account_choices', None)
+        account_choices_source_id = kwargs.pop('account_choices_source_id', None)
+
         kwargs.setdefault('initial', {})
         instance = kwargs.get('instance')
         if instance:
             kwargs['initial'].update(to_account=instance.to_account.uuid)
 
         super(AbstractCostForm, self).__init__(*args, **kwargs)
+        if account_choices is not None:
+            self.fields['to_account'].share_choices(account_choices, source_id=account_choices_source_id)
 
     @transaction.atomic()
     def save(self, commit=True):
@@ -125,15 +134,43 @@ class RecurringCostSplitForm(forms.ModelForm):
         fields = ('portion', )
 
 
+class BaseCostFormSet(BaseNestedModelFormSet):
+    """Calculates the account choices once, and shares them between all the cost forms
+
+    When ``SWIFTWIND_SHARE_ACCOUNT_SELECTS`` is enabled the choices are also
+    only rendered once, by ``account_choices_source()``.
+    """
+    account_choices_source_id = 'id_account_choices'
+
+    @cached_property
+    def account_choices(self):
+        return self.form.base_fields['to_account'].get_choices()
+
+    def get_form_kwargs(self, index):
+        kwargs = super(BaseCostFormSet, self).get_form_kwargs(index)
+        kwargs['account_choices'] = self.account_choices
+        if settings.SWIFTWIND_SHARE_ACCOUNT_SELECTS:
+            kwargs['account_choices_source_id'] = self.account_choices_source_id
+        return kwargs
+
+    def account_choices_source(self):
+        if not settings.SWIFTWIND_SHARE_ACCOUNT_SELECTS or not self.forms:
+            return ''
+        field = self.forms[0].fields['to_account']
+        return field.render_source(self.account_choices_source_id)
+
+
 RecurringCostFormSet = nested_model_formset_factory(
     model=RecurringCost,
     form=RecurringCostForm,
+    formset=BaseCostFormSet,
     extra=0,
     can_delete=False,
     nested_formset=forms.inlineformset_factory(
         parent_model=RecurringCost,
         model=RecurringCostSplit,
         form=RecurringCostSplitForm,
+        formset=BasePrefetchedInlineFormSet,
         extra=0,
         can_delete=False,
     )
@@ -143,12 +180,14 @@ RecurringCostFormSet = nested_model_formset_factory(
 OneOffCostFormSet = nested_model_formset_factory(
     model=RecurringCost,
     form=OneOffCostForm,
+    formset=BaseCostFormSet,
     extra=0,
     can_delete=False,
     nested_formset=forms.inlineformset_factory(
         parent_model=RecurringCost,
         model=RecurringCostSplit,
         form=RecurringCostSplitForm,
+        formset=BasePrefetchedInlineFormSet,
         extra=0,
         can_delete=False,
     )
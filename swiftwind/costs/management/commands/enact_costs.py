@@ -3,6 +3,7 @@ from datetime import date
 from django.core.management.base import BaseCommand
 
 from swiftwind.billing_cycle.models import BillingCycle
+from swiftwind.utilities.tracing import trace
 
 
 class Command(BaseCommand):
@@ -23,5 +24,8 @@ class Command(BaseCommand):
             as_of = date(*map(int, options['as_of'].split('-')))
         else:
             as_of = date.today()
-        for billing_cycle in BillingCycle.objects.filter(start_date__lt=as_of, transactions_created=False):
-            billing_cycle.enact_all_costs()
+        with trace() as summary:
+            for billing_cycle in BillingCycle.objects.filter(start_date__lt=as_of, transactions_created=False):
+                billing_cycle.enact_all_costs()
+        if summary:
+            self.stdout.write(str(summary))
@@ -1,8 +1,9 @@
 from decimal import Decimal
 
-from django.db import models
+from django.db import connection, models
 from django.db import transaction as db_transaction
-from django.db.models import QuerySet
+from django.db.models import Count, Exists, OuterRef, Prefetch, QuerySet, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django_smalluuid.models import SmallUUIDField
 from django_smalluuid.models import uuid_default
@@ -13,13 +14,24 @@ from hordak.utilities.currency import Balance
 from model_utils import Choices
 from psycopg2._range import DateRange
 
+from swiftwind.accounts.models import AccountBalance
 from swiftwind.billing_cycle.models import BillingCycle
+from swiftwind.utilities.tracing import traced
 from .exceptions import CannotEnactUnenactableRecurringCostError, CannotRecreateTransactionOnRecurredCost, \
     NoSplitsFoundForRecurringCost, ProvidedBillingCycleBeginsBeforeInitialBillingCycle, \
     RecurringCostAlreadyEnactedForBillingCycle
 from hordak.utilities.money import ratio_split
 
 
+def _cost_tags(recurring_cost, billing_cycle=None, *args, **kwargs):
+    """Tracing tags for a recurring cost, grouped by the type of cost"""
+    return dict(
+        group='one_off' if recurring_cost.is_one_off() else recurring_cost.type,
+        recurring_cost=recurring_cost.pk,
+        billing_cycle=getattr(billing_cycle, 'pk', None),
+    )
+
+
 class RecurringCostQuerySet(models.QuerySet):
 
     def disable_if_done(self):
@@ -35,6 +47,41 @@ class RecurringCostQuerySet(models.QuerySet):
         """Filter for recurring costs"""
         return self.filter(total_billing_cycles__isnull=True)
 
+    def with_details(self):
+        """Fetch everything needed to display & edit the costs, in a fixed number of queries
+
+        The accounts, initial billing cycle, and splits are fetched along with
+        each cost. The amount billed so far, the number of recurrences, and
+        whether the cost has any transactions are annotated (as ``billed_total``,
+        ``recurrence_count``, and ``has_transactions``), and are then used
+        by ``get_billed_amount()`` & ``can_delete()``.
+        """
+        billed_total = Leg.objects.filter(
+            transaction__recurred_cost__recurring_cost=OuterRef('pk'),
+            amount__gt=0,
+        ).order_by().values('transaction__recurred_cost__recurring_cost').annotate(total=Sum('amount'))
+        recurrence_count = RecurredCost.objects.filter(
+            recurring_cost=OuterRef('pk'),
+        ).order_by().values('recurring_cost').annotate(count=Count('pk'))
+        transactions = RecurredCost.objects.filter(recurring_cost=OuterRef('pk'), transaction__isnull=False)
+
+        return self.select_related(
+            'to_account',
+            'initial_billing_cycle',
+        ).prefetch_related(
+            Prefetch('splits', queryset=RecurringCostSplit.objects.select_related('from_account').order_by('pk')),
+        ).annotate(
+            billed_total=Subquery(
+                billed_total.values('total'),
+                output_field=models.DecimalField(max_digits=13, decimal_places=2),
+            ),
+            recurrence_count=Coalesce(
+                Subquery(recurrence_count.values('count'), output_field=models.IntegerField()),
+                0,
+            ),
+            has_transactions=Exists(transactions),
+        )
+
 
 class RecurringCost(models.Model):
     """ Represents recurring costs and one-off costs
@@ -103,6 +150,7 @@ class RecurringCost(models.Model):
         # need to deal with multiple currencies given its target audience
         return self.to_account.currencies[0]
 
+    @traced('recurring_cost.get_amount', tags=_cost_tags)
     def get_amount(self, billing_cycle):
         amount = {
             RecurringCost.TYPES.normal: self.get_amount_normal,
@@ -145,9 +193,7 @@ class RecurringCost(models.Model):
 
     def get_amount_arrears_balance(self, billing_cycle):
         """Get the balance of to_account at the end of billing_cycle"""
-        return self.to_account.balance(
-            transaction__date__lt=billing_cycle.date_range.lower,
-        )
+        return AccountBalance.objects.balance_of(self.to_account, before=billing_cycle.date_range.lower)
 
     def get_amount_arrears_transactions(self, billing_cycle):
         """Get the sum of all transaction legs in to_account during given billing cycle"""
@@ -161,8 +207,13 @@ class RecurringCost(models.Model):
 
     def get_billed_amount(self):
         """Get the total amount billed so far"""
+        if hasattr(self, 'billed_total'):
+            # Annotated by RecurringCostQuerySet.with_details(). Costs are
+            # only ever billed in their own currency (see RecurredCost.make_transaction())
+            return Balance(self.billed_total, self.currency) if self.billed_total else Balance()
         return Leg.objects.filter(transaction__recurred_cost__recurring_cost=self, amount__gt=0).sum_to_balance()
 
+    @traced('recurring_cost.enact', tags=_cost_tags)
     def enact(self, billing_cycle, disable_if_done=True):
         """Enact this RecurringCost for the given billing cycle
 
@@ -193,6 +244,7 @@ class RecurringCost(models.Model):
         if disable_if_done:
             self.disable_if_done(billing_cycle)
 
+    @traced('recurring_cost.disable_if_done', tags=lambda self, *args, **kwargs: _cost_tags(self))
     def disable_if_done(self, commit=True):
         """Set disabled=True if we have billed all we need to
 
@@ -291,7 +343,38 @@ class RecurringCost(models.Model):
             start_date__gte=self.initial_billing_cycle.date_range.lower
         )[:self.total_billing_cycles]
 
+    def update_split_portions(self, portions):
+        """Set the portions of many of this cost's splits with a single query
+
+        Django 1.11 has no ``bulk_update()``, so the new portions are
+        joined in as a VALUES list.
+
+        Args:
+            portions (dict): Mapping of RecurringCostSplit primary keys to portions.
+                             Splits of other costs are ignored.
+
+        Returns:
+            int: The number of splits updated
+        """
+        if not portions:
+            return 0
+        table = RecurringCostSplit._meta.db_table
+        with db_transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE {table} SET portion = v.portion "
+                "FROM (VALUES {values}) AS v (id, portion) "
+                "WHERE {table}.id = v.id AND {table}.recurring_cost_id = %s".format(
+                    table=table,
+                    values=', '.join(['(%s, %s)'] * len(portions)),
+                ),
+                [value for pk, portion in portions.items() for value in (pk, portion)] + [self.pk]
+            )
+            return cursor.rowcount
+
     def can_delete(self):
+        if hasattr(self, 'has_transactions'):
+            # Annotated by RecurringCostQuerySet.with_details()
+            return not self.has_transactions
         return not self.transactions.exists()
 
 
@@ -354,6 +437,7 @@ class RecurredCost(models.Model):
             ('recurring_cost', 'billing_cycle'),
         )
 
+    @traced('recurred_cost.make_transaction', tags=lambda self: _cost_tags(self.recurring_cost, self.billing_cycle))
     def make_transaction(self):
         """Create the transaction for this RecurredCost
 
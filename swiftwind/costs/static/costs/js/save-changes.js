@@ -0,0 +1,113 @@
+// Save only the costs which have changed, with one request to each cost's
+// update endpoint, rather than posting every cost on the page.
+// See swiftwind.costs.views.UpdateRecurringCostView
+document.addEventListener('DOMContentLoaded', function () {
+    var form = document.querySelector('form.costs-form');
+    var button = form && form.querySelector('[data-save-changes]');
+    if (!button || !window.fetch || !window.Promise) {
+        // Fall back to posting the entire formset
+        return;
+    }
+    var forEach = Array.prototype.forEach;
+    var some = Array.prototype.some;
+
+    function isChanged(input) {
+        if (input.type === 'checkbox' || input.type === 'radio') {
+            return input.checked !== input.defaultChecked;
+        } else if (input.tagName === 'SELECT') {
+            return some.call(input.options, function (option) {
+                return option.selected !== option.defaultSelected;
+            });
+        } else {
+            return input.value !== input.defaultValue;
+        }
+    }
+
+    function getData(section) {
+        var prefix = section.getAttribute('data-prefix') + '-';
+        var splitsPrefix = prefix + 'splits-';
+        var data = {splits: {}};
+        forEach.call(section.querySelectorAll('input, select, textarea'), function (input) {
+            if (!input.name || input.name.indexOf(prefix) !== 0 || input.disabled) {
+                return;
+            }
+            var name = input.name.substring(prefix.length);
+            if (input.name.indexOf(splitsPrefix) === 0) {
+                // Only send the portions which have changed
+                var match = input.name.substring(splitsPrefix.length).match(/^(\d+)-portion$/);
+                if (match && isChanged(input)) {
+                    var id = section.querySelector('[name="' + splitsPrefix + match[1] + '-id"]').value;
+                    data.splits[id] = input.value;
+                }
+            } else if (input.type === 'radio') {
+                if (input.checked) {
+                    data[name] = input.value;
+                }
+            } else if (input.type === 'checkbox') {
+                data[name] = input.checked;
+            } else {
+                data[name] = input.value;
+            }
+        });
+        return data;
+    }
+
+    function showErrors(section, errors) {
+        var container = section.querySelector('.cost-errors');
+        if (!container) {
+            var body = section.querySelector('.panel-body');
+            container = document.createElement('div');
+            container.className = 'cost-errors alert alert-danger';
+            body.insertBefore(container, body.firstChild);
+        }
+        container.innerHTML = '';
+        Object.keys(errors).forEach(function (field) {
+            errors[field].forEach(function (message) {
+                var p = document.createElement('p');
+                p.textContent = (field === '__all__' ? '' : field + ': ') + message;
+                container.appendChild(p);
+            });
+        });
+    }
+
+    function save(section) {
+        return fetch(section.getAttribute('data-update-url'), {
+            method: 'POST',
+            credentials: 'same-origin',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': form.querySelector('[name=csrfmiddlewaretoken]').value
+            },
+            body: JSON.stringify(getData(section))
+        }).then(function (response) {
+            return response.json().then(function (result) {
+                if (!response.ok) {
+                    showErrors(section, result.errors || {'__all__': ['Could not save this cost']});
+                }
+                return response.ok;
+            });
+        });
+    }
+
+    button.addEventListener('click', function (event) {
+        event.preventDefault();
+        var changed = [];
+        forEach.call(form.querySelectorAll('[data-update-url]'), function (section) {
+            if (some.call(section.querySelectorAll('input, select, textarea'), isChanged)) {
+                changed.push(section);
+            }
+        });
+
+        button.disabled = true;
+        Promise.all(changed.map(save)).then(function (results) {
+            if (results.every(Boolean)) {
+                window.location.assign(form.action);
+            } else {
+                button.disabled = false;
+            }
+        }, function () {
+            // Network error, so try posting the entire formset instead
+            form.submit();
+        });
+    });
+});
@@ -1,3 +1,4 @@
+import logging
 from datetime import date
 
 from celery import shared_task
@@ -5,6 +6,9 @@ from django.db import transaction
 
 from swiftwind.billing_cycle.models import BillingCycle
 from swiftwind.costs.models import RecurringCost
+from swiftwind.utilities.tracing import trace
+
+logger = logging.getLogger(__name__)
 
 
 @shared_task
@@ -12,8 +16,11 @@ from swiftwind.costs.models import RecurringCost
 def enact_costs(as_of=None):
     if as_of is None:
         as_of = date.today()
-    for billing_cycle in BillingCycle.objects.filter(start_date__lt=as_of, transactions_created=False):
-        billing_cycle.enact_all_costs()
+    with trace() as summary:
+        for billing_cycle in BillingCycle.objects.filter(start_date__lt=as_of, transactions_created=False):
+            billing_cycle.enact_all_costs()
+    if summary:
+        logger.info('Enacted costs\n%s', summary)
 
 
 @shared_task
@@ -1,9 +1,11 @@
+import json
 from decimal import Decimal
 
 from datetime import date
 from django.db.utils import IntegrityError
-from django.db import transaction as db_transaction, transaction
-from django.test import TestCase
+from django.db import connection, transaction as db_transaction, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.test.testcases import TransactionTestCase
 from django.urls.base import reverse
 from hordak.models import Account
@@ -352,6 +354,38 @@ class RecurringCostModelTestCase(DataProvider, BalanceUtils, TestCase):
         recurred_cost.save()
         self.assertEqual(recurring_cost.get_billed_amount(), Balance(100, 'EUR'))
 
+    def test_with_details(self):
+        """with_details() annotates the billed amount, recurrences & transactions, and prefetches the splits"""
+        from_account = self.account(type=Account.TYPES.expense)
+        transaction = from_account.transfer_to(self.to_account, Money(100, 'EUR'))
+        billed = RecurringCost.objects.create(
+            to_account=self.to_account,
+            fixed_amount=100,
+            initial_billing_cycle=self.billing_cycle_1,
+        )
+        self.add_split(billed)
+        RecurredCost.objects.create(recurring_cost=billed, billing_cycle=self.billing_cycle_1, transaction=transaction)
+        unbilled = RecurringCost.objects.create(
+            to_account=self.to_account,
+            fixed_amount=100,
+            initial_billing_cycle=self.billing_cycle_1,
+        )
+        self.add_split(unbilled)
+
+        with self.assertNumQueries(2):
+            costs = {cost.pk: cost for cost in RecurringCost.objects.with_details()}
+        with self.assertNumQueries(0):
+            billed = costs[billed.pk]
+            self.assertEqual(billed.get_billed_amount(), Balance(100, 'EUR'))
+            self.assertEqual(billed.recurrence_count, 1)
+            self.assertFalse(billed.can_delete())
+            self.assertEqual(len([split.from_account.name for split in billed.splits.all()]), 1)
+
+            unbilled = costs[unbilled.pk]
+            self.assertFalse(unbilled.get_billed_amount())
+            self.assertEqual(unbilled.recurrence_count, 0)
+            self.assertTrue(unbilled.can_delete())
+
 
 class RecurringCostModelTransactionTestCase(DataProvider, BalanceUtils, TransactionTestCase):
     # Test the enact() method which requires transactions
@@ -790,6 +824,47 @@ class RecurringCostsViewTestCase(DataProvider, TestCase):
 
         self.assertIn('formset', context)
 
+    def test_get_uses_prefetched_splits(self):
+        self.housemate()  # Keeps HousematesRequiredMixin happy
+
+        response = self.client.get(self.view_url)
+        form = response.context['formset'].forms[0]
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                [split_form.instance for split_form in form.nested.forms],
+                [self.split1, self.split2, self.split3],
+            )
+            self.assertTrue(form.nested.forms[0].instance.from_account.name)
+            self.assertTrue(form.instance.can_delete())
+
+    def test_get_account_choices_shared(self):
+        self.housemate()  # Keeps HousematesRequiredMixin happy
+        self.client.get(self.view_url)
+        with CaptureQueriesContext(connection) as initial_queries:
+            self.client.get(self.view_url)
+
+        with db_transaction.atomic():
+            recurring_cost_2 = RecurringCost.objects.create(
+                to_account=self.expense_account, fixed_amount=50, initial_billing_cycle=self.first_billing_cycle
+            )
+            RecurringCostSplit.objects.create(recurring_cost=recurring_cost_2, from_account=self.housemate_1)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.view_url)
+        self.assertEqual(len(response.context['formset'].forms), 2)
+        # The accounts are queried once for all forms, not once for each
+        self.assertEqual(len(queries), len(initial_queries))
+        self.assertNotIn('data-choices-from', response.content.decode('utf8'))
+
+    @override_settings(SWIFTWIND_SHARE_ACCOUNT_SELECTS=True)
+    def test_get_shared_account_select(self):
+        self.housemate()  # Keeps HousematesRequiredMixin happy
+
+        response = self.client.get(self.view_url)
+        content = response.content.decode('utf8')
+        self.assertEqual(content.count('id="id_account_choices"'), 1)
+        self.assertIn('data-choices-from="id_account_choices"', content)
+
     def test_post_valid(self):
         self.housemate()  # Keeps HousematesRequiredMixin happy
 
@@ -827,6 +902,99 @@ class RecurringCostsViewTestCase(DataProvider, TestCase):
         self.assertEqual(self.split3.portion, 4)
 
 
+class UpdateRecurringCostViewTestCase(DataProvider, TestCase):
+
+    def setUp(self):
+        self.login()
+        self.housemate()  # Keeps HousematesRequiredMixin happy
+
+        BillingCycle.populate()
+        first_billing_cycle = BillingCycle.objects.first()
+        self.expense_account = self.account(type=Account.TYPES.expense)
+        housemate_parent_account = self.account(name='Housemate Income', type=Account.TYPES.income)
+        self.housemate_1 = self.account(parent=housemate_parent_account)
+        self.housemate_2 = self.account(parent=housemate_parent_account)
+
+        with db_transaction.atomic():
+            self.recurring_cost = RecurringCost.objects.create(
+                to_account=self.expense_account, fixed_amount=100, initial_billing_cycle=first_billing_cycle
+            )
+            self.split1 = RecurringCostSplit.objects.create(recurring_cost=self.recurring_cost,
+                                                            from_account=self.housemate_1)
+            self.split2 = RecurringCostSplit.objects.create(recurring_cost=self.recurring_cost,
+                                                            from_account=self.housemate_2)
+            self.other_cost = RecurringCost.objects.create(
+                to_account=self.expense_account, fixed_amount=50, initial_billing_cycle=first_billing_cycle
+            )
+            self.other_split = RecurringCostSplit.objects.create(recurring_cost=self.other_cost,
+                                                                 from_account=self.housemate_1)
+
+        self.view_url = reverse('costs:update_recurring', args=[self.recurring_cost.uuid])
+
+    def post(self, data, url=None):
+        return self.client.post(url or self.view_url, data=json.dumps(data), content_type='application/json')
+
+    def test_post_valid(self):
+        response = self.post({'fixed_amount': '200', 'splits': {str(self.split1.pk): '3', str(self.split2.pk): '1'}})
+        self.assertEqual(response.status_code, 200)
+        # Split 2 is unchanged, so is not written
+        self.assertEqual(response.json()['splits'], {str(self.split1.pk): '3'})
+        self.assertEqual(response.json()['changed'], ['fixed_amount'])
+
+        self.recurring_cost.refresh_from_db()
+        self.split1.refresh_from_db()
+        self.assertEqual(self.recurring_cost.fixed_amount, 200)
+        self.assertEqual(self.recurring_cost.to_account, self.expense_account)
+        self.assertEqual(self.split1.portion, 3)
+
+    def test_post_splits_only(self):
+        response = self.post({'splits': {str(self.split2.pk): '0'}})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['changed'], [])
+        self.split2.refresh_from_db()
+        self.assertEqual(self.split2.portion, 0)
+
+    def test_post_other_costs_split(self):
+        response = self.post({'splits': {str(self.other_split.pk): '5'}})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('splits', response.json()['errors'])
+        self.other_split.refresh_from_db()
+        self.assertEqual(self.other_split.portion, 1)
+
+    def test_post_invalid(self):
+        response = self.post({
+            'type': RecurringCost.TYPES.arrears_balance,
+            'splits': {str(self.split1.pk): 'abc'},
+        })
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()['errors']
+        self.assertIn('fixed_amount', errors)
+        self.assertIn('splits-{}-portion'.format(self.split1.pk), errors)
+
+        self.recurring_cost.refresh_from_db()
+        self.assertEqual(self.recurring_cost.type, RecurringCost.TYPES.normal)
+
+    def test_post_invalid_json(self):
+        response = self.client.post(self.view_url, data='[', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_one_off_url_for_recurring_cost(self):
+        response = self.post({}, url=reverse('costs:update_one_off', args=[self.recurring_cost.uuid]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_update_split_portions(self):
+        updated = self.recurring_cost.update_split_portions({
+            self.split1.pk: Decimal('2'),
+            self.split2.pk: Decimal('3'),
+            self.other_split.pk: Decimal('4'),
+        })
+        self.assertEqual(updated, 2)
+        self.assertEqual(
+            list(RecurringCostSplit.objects.order_by('pk').values_list('portion', flat=True)),
+            [2, 3, 1],
+        )
+
+
 class CreateRecurringCostViewTestCase(DataProvider, TestCase):
 
     def setUp(self):
@@ -7,6 +7,8 @@ urlpatterns = [
     url(r'^oneoff/$', views.OneOffCostsView.as_view(), name='one_off'),
     url(r'^recurring/create/$', views.CreateRecurringCostView.as_view(), name='create_recurring'),
     url(r'^oneoff/create/$', views.CreateOneOffCostView.as_view(), name='create_one_off'),
+    url(r'^recurring/update/(?P<uuid>.+)/$', views.UpdateRecurringCostView.as_view(), name='update_recurring'),
+    url(r'^oneoff/update/(?P<uuid>.+)/$', views.UpdateOneOffCostView.as_view(), name='update_one_off'),
     url(r'^recurring/delete/(?P<uuid>.+)/$', views.DeleteRecurringCostView.as_view(), name='delete_recurring'),
     url(r'^oneoff/delete/(?P<uuid>.+)/$', views.DeleteOneOffCostView.as_view(), name='delete_one_off'),
     url(r'^recurring/archive/(?P<uuid>.+)/$', views.ArchiveRecurringCostView.as_view(), name='archive_recurring'),
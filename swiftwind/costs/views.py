@@ -1,13 +1,17 @@
+import json
+
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.exceptions import ValidationError
 from django.db import transaction
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseRedirect, JsonResponse
 from django.urls import reverse, reverse_lazy
-from django.views.generic import DetailView
+from django.views.generic import DetailView, View
+from django.views.generic.detail import SingleObjectMixin
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
 
 from swiftwind.housemates.views import HousematesRequiredMixin
 from .forms import RecurringCostFormSet, OneOffCostFormSet, CreateOneOffCostForm, \
-    CreateRecurringCostForm
+    CreateRecurringCostForm, RecurringCostForm, OneOffCostForm, RecurringCostSplitForm
 from .models import RecurringCost
 
 
@@ -24,12 +28,14 @@ class RecurringCostsView(LoginRequiredMixin, HousematesRequiredMixin, UpdateView
         context = super(RecurringCostsView, self).get_context_data(**kwargs)
         context['formset'] = context['form']
         context['form_action'] = self.get_success_url()
-        context['disabled_costs'] = RecurringCost.objects.filter(disabled=True).recurring()
-        context['archived_costs'] = RecurringCost.objects.filter(archived=True, disabled=False).recurring()
+        context['disabled_costs'] = RecurringCost.objects.filter(disabled=True).recurring().with_details()
+        context['archived_costs'] = RecurringCost.objects.filter(
+            archived=True, disabled=False
+        ).recurring().with_details()
         return context
 
     def get_queryset(self):
-        return RecurringCost.objects.filter(disabled=False, archived=False).recurring()
+        return RecurringCost.objects.filter(disabled=False, archived=False).recurring().with_details()
 
     def get_form_kwargs(self):
         kwargs = super(RecurringCostsView, self).get_form_kwargs()
@@ -54,18 +60,107 @@ class OneOffCostsView(RecurringCostsView):
     form_class = OneOffCostFormSet
 
     def get_queryset(self):
-        return RecurringCost.objects.filter(disabled=False, archived=False).one_off()
+        return RecurringCost.objects.filter(disabled=False, archived=False).one_off().with_details()
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['disabled_costs'] = RecurringCost.objects.filter(disabled=True).one_off()
-        context['archived_costs'] = RecurringCost.objects.filter(archived=True, disabled=False).one_off()
+        context['disabled_costs'] = RecurringCost.objects.filter(disabled=True).one_off().with_details()
+        context['archived_costs'] = RecurringCost.objects.filter(
+            archived=True, disabled=False
+        ).one_off().with_details()
         return context
 
     def get_success_url(self):
         return reverse('costs:one_off')
 
 
+class UpdateRecurringCostView(LoginRequiredMixin, HousematesRequiredMixin, SingleObjectMixin, View):
+    """Update a single cost, and the portions of its splits, from a JSON request body
+
+    The body contains the cost form's fields (any omitted keep their current
+    value), plus a mapping of split IDs to portions. For example::
+
+        {"fixed_amount": "120.00", "splits": {"12": "2", "13": "1"}}
+
+    Only this cost is validated & saved, rather than every cost on the page.
+    Responds with ``{"errors": {...}}`` and a 400 status if invalid.
+    """
+    model = RecurringCost
+    slug_field = 'uuid'
+    slug_url_kwarg = 'uuid'
+    queryset = RecurringCost.objects.recurring()
+    form_class = RecurringCostForm
+
+    def get_queryset(self):
+        return super(UpdateRecurringCostView, self).get_queryset().with_details()
+
+    def post(self, request, *args, **kwargs):
+        cost = self.get_object()
+        try:
+            data = json.loads(request.body.decode('utf8'))
+            if not isinstance(data, dict):
+                raise ValueError()
+        except ValueError:
+            return JsonResponse({'errors': {'__all__': ['Request body must be a JSON object']}}, status=400)
+
+        split_data = data.pop('splits', None) or {}
+        unbound_form = self.form_class(instance=cost)
+        form_data = {name: unbound_form[name].value() for name in unbound_form.fields}
+        form_data.update(data)
+        form = self.form_class(data=form_data, instance=cost)
+
+        errors = {}
+        if not form.is_valid():
+            errors.update({field: list(field_errors) for field, field_errors in form.errors.items()})
+        portions, split_errors = self.clean_splits(cost, split_data)
+        errors.update(split_errors)
+        if errors:
+            return JsonResponse({'errors': errors}, status=400)
+
+        with transaction.atomic():
+            if form.has_changed():
+                form.save()
+            cost.update_split_portions(portions)
+
+        return JsonResponse({
+            'uuid': str(cost.uuid),
+            'changed': form.changed_data,
+            'splits': {str(pk): str(portion) for pk, portion in portions.items()},
+        })
+
+    def clean_splits(self, cost, split_data):
+        """Validate the new portions, ignoring any which are unchanged
+
+        Returns:
+            (dict, dict): Mapping of split IDs to new portions, and any errors
+        """
+        splits = {str(split.pk): split for split in cost.splits.all()}
+        portion_field = RecurringCostSplitForm.base_fields['portion']
+        portions = {}
+        errors = {}
+        if not isinstance(split_data, dict):
+            return portions, {'splits': ['Must be a mapping of split IDs to portions']}
+
+        for split_id, portion in split_data.items():
+            split = splits.get(str(split_id))
+            if not split:
+                errors.setdefault('splits', []).append('Unknown split {}'.format(split_id))
+                continue
+            try:
+                portion = portion_field.clean(portion)
+            except ValidationError as e:
+                errors['splits-{}-portion'.format(split_id)] = e.messages
+                continue
+            if portion != split.portion:
+                portions[split.pk] = portion
+        return portions, errors
+
+
+class UpdateOneOffCostView(UpdateRecurringCostView):
+    queryset = RecurringCost.objects.one_off()
+    form_class = OneOffCostForm
+
+
 class CreateOneOffCostView(LoginRequiredMixin, HousematesRequiredMixin, CreateView):
     form_class = CreateOneOffCostForm
     template_name = 'costs/create_one_off.html'
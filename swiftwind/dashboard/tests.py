@@ -1,17 +1,91 @@
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from hordak.models import Account
+from hordak.tests.utils import BalanceUtils
+from moneyed import Money
 
 from swiftwind.core.management.commands.swiftwind_create_accounts import Command
+from swiftwind.settings.models import Settings
 from swiftwind.utilities.testing import DataProvider
 
 
-class DashboardViewTestCase(DataProvider, TestCase):
+class DashboardViewTestCase(DataProvider, BalanceUtils, TestCase):
 
     def setUp(self):
         self.url = reverse('dashboard:dashboard')
         Command().handle(currency='GBP')
+        # Create the settings now, rather than upon the first request (which would change the ETag)
+        Settings.objects.get()
 
     def test_get(self):
         self.login()
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, 200)
+
+    def test_query_count_independent_of_accounts(self):
+        self.login()
+        self.client.get(self.url)
+
+        with CaptureQueriesContext(connection) as initial_queries:
+            self.client.get(self.url)
+
+        bank = Account.objects.get(name='Bank')
+        expenses = Account.objects.get(name='Expenses')
+        for code in range(5, 10):
+            bank.transfer_to(self.account(parent=expenses, code=str(code), currencies=['GBP']), Money(10, 'GBP'))
+        self.housemate()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), len(initial_queries))
+
+    def test_expense_total_counts_nested_accounts_once(self):
+        self.login()
+        bank = Account.objects.get(name='Bank')
+        expenses = Account.objects.get(name='Expenses')
+        parent = self.account(parent=expenses, code='5', currencies=['GBP'])
+        bank.transfer_to(self.account(parent=parent, currencies=['GBP']), Money(10, 'GBP'))
+
+        response = self.client.get(self.url)
+        self.assertBalanceEqual(response.context['expense_total'], 10)
+
+    def test_not_modified(self):
+        self.login()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertLess(len(queries), 5)
+
+    def test_modified_after_transaction(self):
+        self.login()
+        etag = self.client.get(self.url)['ETag']
+
+        bank = Account.objects.get(name='Bank')
+        expense = self.account(parent=Account.objects.get(name='Expenses'), code='5', currencies=['GBP'])
+        bank.transfer_to(expense, Money(10, 'GBP'))
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_modified_after_transaction_edited(self):
+        self.login()
+        bank = Account.objects.get(name='Bank')
+        expense = self.account(parent=Account.objects.get(name='Expenses'), code='5', currencies=['GBP'])
+        bank.transfer_to(expense, Money(10, 'GBP'))
+        etag = self.client.get(self.url)['ETag']
+
+        transaction = bank.legs.get().transaction
+        transaction.description = 'Changed'
+        transaction.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
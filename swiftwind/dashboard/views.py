@@ -1,46 +1,99 @@
 from datetime import date
 
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db.models import Q
 from django.views.generic import TemplateView
 from django.conf import settings
 from hordak.models import Account
 from hordak.utilities.currency import Balance
+from swiftwind.accounts.models import AccountBalance
 from swiftwind.billing_cycle.models import BillingCycle
+from swiftwind.costs.models import RecurringCost
+from swiftwind.utilities.conditional import ConditionalGetMixin
+from swiftwind.utilities.routers import ReplicaReadMixin
 
 
-class DashboardView(LoginRequiredMixin, TemplateView):
+class DashboardView(LoginRequiredMixin, ReplicaReadMixin, ConditionalGetMixin, TemplateView):
     template_name = 'dashboard/dashboard.html'
 
-    def get_balance_context(self):
+    def get_accounts(self):
+        """Get all accounts, each with its balance & inbound cost status attached
+
+        The balance of each account includes that of its child accounts. This
+        is done in a fixed number of queries, regardless of the number of accounts.
+        """
+        accounts = list(Account.objects.order_by('tree_id', 'lft'))
+        balances = AccountBalance.objects.balances(accounts)
+        inbound_cost_account_ids = set(RecurringCost.objects.values_list('to_account_id', flat=True))
+
+        for account in accounts:
+            account.current_balance = balances[account.pk]
+            account.has_inbound_costs = account.pk in inbound_cost_account_ids
+        return accounts
+
+    def get_balance_context(self, accounts):
         """Get the high level balances"""
-        bank_account = Account.objects.get(name='Bank')
+        retained_earnings = self.get_named(accounts, 'Retained Earnings')
+        retained_earnings_accounts = self.get_children(accounts, retained_earnings)
 
         return dict(
-            bank=bank_account,
-            retained_earnings_accounts=Account.objects.filter(parent__name='Retained Earnings'),
+            bank=self.get_named(accounts, 'Bank'),
+            retained_earnings_accounts=retained_earnings_accounts,
+            retained_earnings_total=self.get_total(retained_earnings_accounts, retained_earnings),
         )
 
-    def get_accounts_context(self):
+    def get_accounts_context(self, accounts):
         """Get the accounts we may want to display"""
-        income_parent = Account.objects.get(name='Income')
-        housemate_parent = Account.objects.get(name='Housemate Income')
-        expense_parent = Account.objects.get(name='Expenses')
-        current_liabilities_parent = Account.objects.get(name='Current Liabilities')
-        long_term_liabilities_parent = Account.objects.get(name='Long Term Liabilities')
+        income_parent = self.get_named(accounts, 'Income')
+        housemate_parent = self.get_named(accounts, 'Housemate Income')
+        expense_parent = self.get_named(accounts, 'Expenses')
+        current_liabilities_parent = self.get_named(accounts, 'Current Liabilities')
+        long_term_liabilities_parent = self.get_named(accounts, 'Long Term Liabilities')
 
-        return dict(
-            housemate_accounts=Account.objects.filter(parent=housemate_parent),
-            expense_accounts=expense_parent.get_descendants(),
-            current_liability_accounts=Account.objects.filter(parent=current_liabilities_parent),
-            long_term_liability_accounts=Account.objects.filter(parent=long_term_liabilities_parent),
-            other_income_accounts=Account.objects.filter(~Q(pk=housemate_parent.pk), parent=income_parent)
+        sections = dict(
+            housemate=(self.get_children(accounts, housemate_parent), housemate_parent),
+            expense=(self.get_descendants(accounts, expense_parent), expense_parent),
+            current_liability=(self.get_children(accounts, current_liabilities_parent), current_liabilities_parent),
+            long_term_liability=(self.get_children(accounts, long_term_liabilities_parent), long_term_liabilities_parent),
+            other_income=(
+                [a for a in self.get_children(accounts, income_parent) if a.pk != housemate_parent.pk],
+                income_parent,
+            ),
         )
 
+        context = {}
+        for name, (section_accounts, parent) in sections.items():
+            context['{}_accounts'.format(name)] = section_accounts
+            context['{}_total'.format(name)] = self.get_total(section_accounts, parent)
+        return context
+
+    def get_named(self, accounts, name):
+        for account in accounts:
+            if account.name == name:
+                return account
+        raise Account.DoesNotExist('No account named {}'.format(name))
+
+    def get_children(self, accounts, parent):
+        return [account for account in accounts if account.parent_id == parent.pk]
+
+    def get_descendants(self, accounts, parent):
+        return [
+            account for account in accounts
+            if account.tree_id == parent.tree_id and parent.lft < account.lft < parent.rght
+        ]
+
+    def get_total(self, accounts, parent):
+        """Sum the balances of the accounts directly beneath `parent`
+
+        Balances already include child accounts, so summing any deeper
+        accounts would count their balances twice
+        """
+        return sum((account.current_balance for account in accounts if account.parent_id == parent.pk), Balance())
+
     def get_context_data(self, **kwargs):
         context = super(DashboardView, self).get_context_data()
 
-        context.update(**self.get_balance_context())
-        context.update(**self.get_accounts_context())
+        accounts = self.get_accounts()
+        context.update(**self.get_balance_context(accounts))
+        context.update(**self.get_accounts_context(accounts))
 
         return context
@@ -8,3 +8,46 @@ def set_default(setting, value):
 
 set_default('SWIFTWIND_BILLING_CYCLE', 'swiftwind.billing_cycle.cycles.Monthly')
 set_default('SWIFTWIND_BILLING_CYCLE_YEARS', 1)
+
+# Outbox email delivery
+set_default('SWIFTWIND_EMAIL_BATCH_SIZE', 50)
+set_default('SWIFTWIND_EMAIL_MAX_ATTEMPTS', 5)
+set_default('SWIFTWIND_EMAIL_RETRY_DELAY', 60)  # Seconds, doubled after each failed attempt
+set_default('SWIFTWIND_EMAIL_RATE_LIMIT', None)  # Maximum emails per second, or None for no limit
+# Seconds after which emails claimed by a worker, but not sent, are sent by another. Should exceed the time to send a batch
+set_default('SWIFTWIND_EMAIL_SEND_TIMEOUT', 15 * 60)
+
+# Number of threads with which to render statement emails (None to render serially)
+set_default('SWIFTWIND_EMAIL_RENDER_THREADS', None)
+
+# Number of recent requests to keep timings for, per view (see swiftwind.core.middleware.PerformanceMiddleware)
+set_default('SWIFTWIND_PERFORMANCE_SAMPLES', 1000)
+
+# Database alias of a read replica to use for read-only views (None to use the primary only)
+set_default('SWIFTWIND_READ_REPLICA_ALIAS', None)
+set_default('SWIFTWIND_READ_REPLICA_LAG', 10)  # Seconds a user's reads stay on the primary after they write
+
+# Periodic tasks (see swiftwind.core.scheduler)
+set_default('SWIFTWIND_SCHEDULE', {})  # Job name to interval in seconds (or None to disable), overriding the defaults
+set_default('SWIFTWIND_SCHEDULER_DISPATCH', 'threads')  # 'threads' to run jobs in the scheduler process, or 'celery'
+set_default('SWIFTWIND_SCHEDULER_WORKERS', 2)
+set_default('SWIFTWIND_SCHEDULER_JITTER', 0.1)  # Fraction of each job's interval by which to randomly delay it
+
+# teller.io imports (see swiftwind.accounts.tellerio)
+set_default('SWIFTWIND_TELLERIO_PAGE_SIZE', 250)
+set_default('SWIFTWIND_TELLERIO_OVERLAP_DAYS', 7)  # Re-fetch this many days before the last import, for late postings
+set_default('SWIFTWIND_TELLERIO_API_URL', 'https://api.teller.io')  # See swiftwind.accounts.fake_teller for a local fake
+set_default('SWIFTWIND_TELLERIO_TIMEOUT', 30)  # Seconds to wait for each teller.io response
+
+# Days either side of the billing cycle in which to expect housemates to pay what they owe (see swiftwind.transactions.matching)
+set_default('SWIFTWIND_MATCHING_WINDOW_DAYS', 7)
+
+# Rows fetched from the database at a time when streaming exports (see swiftwind.accounts.exports)
+set_default('SWIFTWIND_EXPORT_CHUNK_SIZE', 2000)
+
+# Rows copied into the database at a time when importing history (see swiftwind.accounts.history)
+set_default('SWIFTWIND_HISTORY_IMPORT_BATCH_SIZE', 10000)
+
+# Render the account choices of the costs formsets only once, and copy them into
+# each cost's <select> client-side (see swiftwind.accounts.forms)
+set_default('SWIFTWIND_SHARE_ACCOUNT_SELECTS', False)
@@ -3,8 +3,8 @@ from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from hordak.models import Account
-from mptt.forms import TreeNodeChoiceField
 
+from swiftwind.accounts.forms import AccountChoiceField
 from .models import Housemate
 
 
@@ -16,8 +16,7 @@ class HousemateCreateForm(forms.ModelForm):
     new_email = forms.EmailField(required=False)
     new_first_name = forms.CharField(required=False)
     new_last_name = forms.CharField(required=False)
-    account = TreeNodeChoiceField(Account.objects.all(), required=False, to_field_name='uuid',
-                                  empty_label='-- Create new account for user --')
+    account = AccountChoiceField(required=False, empty_label='-- Create new account for user --')
 
     class Meta:
         model = Housemate
@@ -1,4 +1,5 @@
 from django.contrib.postgres.fields import ArrayField
+from django.core.mail import get_connection
 from django.db import models
 
 # Create your models here.
@@ -49,6 +50,8 @@ class Settings(models.Model):
     smtp_use_ssl = models.BooleanField(default=False)
     smtp_subject_prefix = models.CharField(max_length=100, default='[swiftwind] ', blank=True)
 
+    modified = models.DateTimeField(auto_now=True)
+
     objects = SettingsManager()
 
     class Meta:
@@ -60,6 +63,25 @@ class Settings(models.Model):
         super(Settings, self).save(*args, **kwargs)
         # TODO: Push changes into cache (possibly following a refresh_from_db() call)
 
+    def get_email_connection(self):
+        """Get an email connection using the SMTP settings
+
+        Falls back to Django's configured email backend if no SMTP host has been set.
+        """
+        if not self.smtp_host:
+            return get_connection(fail_silently=False)
+
+        return get_connection(
+            backend='django.core.mail.backends.smtp.EmailBackend',
+            host=self.smtp_host,
+            port=self.smtp_port or 25,
+            username=self.smtp_user,
+            password=self.smtp_password,
+            use_tls=self.smtp_use_tls,
+            use_ssl=self.smtp_use_ssl,
+            fail_silently=False,
+        )
+
     @property
     def currencies(self):
         return sorted({self.default_currency} | set(self.additional_currencies))
@@ -1,3 +1,10 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import CategorisationRule
+
+
+@admin.register(CategorisationRule)
+class CategorisationRuleAdmin(admin.ModelAdmin):
+    list_display = ('pattern', 'account', 'min_amount', 'max_amount', 'priority', 'enabled')
+    list_editable = ('priority', 'enabled')
+    list_filter = ('enabled',)
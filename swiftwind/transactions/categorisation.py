@@ -0,0 +1,99 @@
+""" Rule-based reconciliation of repeat statement lines (rent, utilities, etc)
+
+The patterns of all enabled :class:`CategorisationRule` instances are
+combined into a single regular expression, so each line's description is
+only scanned once. Each rule's pattern is wrapped in a lookahead followed
+by an empty named group::
+
+    ^(?:(?=.*?(?:rent))(?P<r1>)|(?=.*?(?:tesco|sainsbury))(?P<r2>)|...)
+
+Alternatives are tried in order, so the group which matched identifies the
+highest priority rule whose pattern matches. Should that rule's amount range
+exclude the line then the lower priority rules are tried individually.
+
+Patterns using named groups or backreferences cannot be combined (and are
+rejected by ``CategorisationRule.clean()``). Should any such rule exist
+regardless, every rule is instead tried individually.
+"""
+import re
+
+from django.db import transaction
+
+from hordak.models import StatementLine
+from swiftwind.transactions.models import CategorisationRule, UNSUPPORTED_PATTERN
+from swiftwind.transactions.reconciliation import reconcile
+
+
+class RuleMatcher(object):
+
+    def __init__(self, rules=None):
+        if rules is None:
+            rules = CategorisationRule.objects.enabled().select_related('account')
+        self.rules = list(rules)
+        self.positions = {'r{}'.format(rule.pk): i for i, rule in enumerate(self.rules)}
+        self.patterns = [re.compile(rule.pattern, re.IGNORECASE) for rule in self.rules]
+        self.combined = self.combine() if self.rules else None
+
+    def combine(self):
+        if any(UNSUPPORTED_PATTERN.search(rule.pattern) for rule in self.rules):
+            # Each rule will have to be tried individually. A backreference
+            # would otherwise refer to another rule's group, rather than fail
+            return None
+        try:
+            return re.compile(
+                '^(?:{})'.format('|'.join(
+                    '(?=.*?(?:{}))(?P<r{}>)'.format(rule.pattern, rule.pk) for rule in self.rules
+                )),
+                re.IGNORECASE | re.DOTALL,
+            )
+        except re.error:
+            return None
+
+    def match(self, line):
+        """Get the first rule which matches the statement line, or None"""
+        start = 0
+        if self.combined:
+            match = self.combined.match(line.description)
+            if not match:
+                return None
+
+            position = self.positions[match.lastgroup]
+            if self.rules[position].matches_amount(line.amount):
+                return self.rules[position]
+            start = position + 1
+
+        for rule, pattern in zip(self.rules[start:], self.patterns[start:]):
+            if rule.matches_amount(line.amount) and pattern.search(line.description):
+                return rule
+        return None
+
+
+@transaction.atomic()
+def categorise(lines=None, rules=None):
+    """Reconcile unreconciled statement lines using the categorisation rules
+
+    Args:
+        lines (QuerySet): Statement lines to categorise. Defaults to all unreconciled lines
+        rules (list[CategorisationRule]): Defaults to all enabled rules
+
+    Returns:
+        list: (StatementLine, CategorisationRule) tuples for each line reconciled
+    """
+    matcher = RuleMatcher(rules)
+    if not matcher.rules:
+        return []
+
+    if lines is None:
+        lines = StatementLine.objects.all()
+    # Lock just the lines, so they cannot be reconciled by anyone else meanwhile
+    line_ids = list(lines.filter(transaction__isnull=True).select_for_update().values_list('pk', flat=True))
+    lines = StatementLine.objects.filter(pk__in=line_ids).select_related('statement_import__bank_account')
+
+    matches = []
+    for line in lines:
+        rule = matcher.match(line)
+        if rule:
+            matches.append((line, rule))
+
+    reconcile([(line, rule.account) for line, rule in matches])
+    return matches
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from swiftwind.transactions.categorisation import categorise
+
+
+class Command(BaseCommand):
+    help = 'Reconcile unreconciled statement lines using the categorisation rules (see the admin)'
+
+    def handle(self, *args, **options):
+        matches = categorise()
+        for line, rule in matches:
+            self.stdout.write('{} {} "{}" -> {}'.format(line.date, line.amount, line.description, rule.account.name))
+        self.stdout.write('Reconciled {} lines'.format(len(matches)))
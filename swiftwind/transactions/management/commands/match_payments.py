@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from hordak.models import StatementLine
+from swiftwind.transactions.matching import PaymentMatcher, match_payments
+
+
+class Command(BaseCommand):
+    help = 'Reconcile unreconciled statement lines which can be matched to a housemate\'s payment'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', dest='dry_run', action='store_true',
+                            help='List the matches without reconciling them.')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            lines = StatementLine.objects.filter(
+                transaction__isnull=True, amount__gt=0
+            ).select_related('statement_import__bank_account')
+            matches = PaymentMatcher().match_lines(lines)
+        else:
+            with transaction.atomic():
+                matches = match_payments()
+
+        for line, housemate in matches:
+            self.stdout.write('{} {} "{}" -> {}'.format(line.date, line.amount, line.description, housemate.account.name))
+        self.stdout.write('{} {} lines'.format('Would reconcile' if options['dry_run'] else 'Reconciled', len(matches)))
@@ -0,0 +1,195 @@
+""" Automatic reconciliation of housemate payments
+
+Unreconciled statement lines which pay money into the bank are matched
+against the housemates who owe money. Each line is scored against each
+candidate housemate:
+
+* How much of the housemate's name appears in the line's description
+  (allowing for small misspellings)
+* Whether the line's amount is exactly what the housemate owes, and is
+  dated within the most recent billing cycle (see
+  ``SWIFTWIND_MATCHING_WINDOW_DAYS``)
+
+A line is only matched when one housemate clearly scores highest. The name
+alone may be enough to match, but the amount alone never is.
+
+Candidates are found by hash lookups (on amount, and on each word of the
+description) rather than comparing every line with every housemate. The
+reconciling transactions are then created in bulk (see
+:func:`swiftwind.transactions.reconciliation.reconcile()`).
+"""
+import difflib
+import re
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from moneyed import Money
+
+from hordak.models import StatementLine
+from swiftwind.accounts.models import AccountBalance
+from swiftwind.billing_cycle.models import BillingCycle
+from swiftwind.housemates.models import Housemate
+from swiftwind.transactions.reconciliation import reconcile
+
+# Score required to match a line to a housemate
+MATCH_THRESHOLD = Decimal('1')
+# Added to the name score when the amount is exactly what the housemate owes
+AMOUNT_SCORE = Decimal('0.5')
+# Words shorter than this are only matched exactly
+FUZZY_MIN_LENGTH = 4
+FUZZY_CUTOFF = 0.8
+
+
+def tokenize(text):
+    return re.findall(r'[a-z0-9]+', (text or '').lower())
+
+
+class ExpectedPayment(object):
+    """A payment we expect a housemate to make"""
+
+    def __init__(self, housemate, amount, start_date, end_date):
+        self.housemate = housemate
+        self.amount = amount
+        self.start_date = start_date
+        self.end_date = end_date
+
+    def is_due(self, date):
+        return self.start_date <= date < self.end_date
+
+
+class PaymentMatcher(object):
+    """Matches statement lines to the housemates who made them
+
+    Args:
+        housemates (list[Housemate]): Defaults to all housemates
+        billing_cycle (BillingCycle): Payments of the amounts owed are expected
+                                      during this cycle. Defaults to the most
+                                      recently enacted billing cycle.
+    """
+
+    def __init__(self, housemates=None, billing_cycle=None):
+        if housemates is None:
+            housemates = Housemate.objects.select_related('user', 'account')
+        self.housemates = {housemate.pk: housemate for housemate in housemates}
+        if billing_cycle is None:
+            billing_cycle = BillingCycle.objects.filter(transactions_created=True).last()
+
+        self.name_tokens = {}
+        self.token_index = defaultdict(set)
+        for housemate in self.housemates.values():
+            self.name_tokens[housemate.pk] = self.get_name_tokens(housemate)
+            for token in self.name_tokens[housemate.pk]:
+                self.token_index[token].add(housemate.pk)
+        self.vocabulary = [token for token in self.token_index if len(token) >= FUZZY_MIN_LENGTH]
+        self._fuzzy_cache = {}
+
+        self.expected = defaultdict(list)
+        if billing_cycle:
+            window = timedelta(days=settings.SWIFTWIND_MATCHING_WINDOW_DAYS)
+            start_date = billing_cycle.date_range.lower - window
+            end_date = billing_cycle.date_range.upper + window
+            balances = AccountBalance.objects.balances(housemate.account for housemate in self.housemates.values())
+            for housemate in self.housemates.values():
+                for money in balances[housemate.account_id].monies():
+                    owed = -money.amount
+                    if owed > 0:
+                        expected = ExpectedPayment(housemate, Money(owed, money.currency), start_date, end_date)
+                        self.expected[expected.amount].append(expected)
+
+    def get_name_tokens(self, housemate):
+        if housemate.user and housemate.user.get_full_name():
+            return set(tokenize(housemate.user.get_full_name()))
+        elif housemate.user:
+            return set(tokenize(housemate.user.username))
+        else:
+            return set(tokenize(housemate.account.name))
+
+    def fuzzy_tokens(self, token):
+        """Get the housemate name tokens which `token` could be a misspelling of"""
+        if token not in self._fuzzy_cache:
+            if len(token) < FUZZY_MIN_LENGTH:
+                self._fuzzy_cache[token] = []
+            else:
+                self._fuzzy_cache[token] = difflib.get_close_matches(token, self.vocabulary, n=3, cutoff=FUZZY_CUTOFF)
+        return self._fuzzy_cache[token]
+
+    def match(self, line, currency):
+        """Get the housemate who made the payment in `line`
+
+        Returns:
+            (Housemate, ExpectedPayment): The matched housemate (or None), and
+                                          the expected payment it fulfilled (if any)
+        """
+        if line.amount <= 0:
+            return None, None
+
+        line_tokens = set()
+        for token in tokenize(line.description):
+            line_tokens.add(token)
+            line_tokens.update(self.fuzzy_tokens(token))
+
+        scores = defaultdict(Decimal)
+        for token in line_tokens:
+            for housemate_id in self.token_index.get(token, ()):
+                scores[housemate_id] += Decimal(1) / len(self.name_tokens[housemate_id])
+
+        expected_payments = {}
+        for expected in self.expected.get(Money(line.amount, currency), ()):
+            housemate_id = expected.housemate.pk
+            if expected.is_due(line.date) and housemate_id not in expected_payments:
+                expected_payments[housemate_id] = expected
+                scores[housemate_id] += AMOUNT_SCORE
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        if not ranked or ranked[0][1] < MATCH_THRESHOLD:
+            return None, None
+        if len(ranked) > 1 and ranked[1][1] == ranked[0][1]:
+            # Ambiguous
+            return None, None
+
+        housemate_id = ranked[0][0]
+        return self.housemates[housemate_id], expected_payments.get(housemate_id)
+
+    def match_lines(self, lines):
+        """Match each line, in date order
+
+        Once a payment has been matched to a line, it is not expected again.
+
+        Returns:
+            list: (StatementLine, Housemate) tuples
+        """
+        matches = []
+        for line in sorted(lines, key=lambda line: (line.date, line.pk)):
+            bank_account = line.statement_import.bank_account
+            housemate, expected = self.match(line, bank_account.currencies[0])
+            if housemate:
+                matches.append((line, housemate))
+            if expected:
+                self.expected[expected.amount].remove(expected)
+        return matches
+
+
+@transaction.atomic()
+def match_payments(lines=None, billing_cycle=None):
+    """Reconcile any unreconciled statement lines which can be matched to a housemate's payment
+
+    Args:
+        lines (QuerySet): Statement lines to match. Defaults to all unreconciled lines
+        billing_cycle (BillingCycle): See :class:`PaymentMatcher`
+
+    Returns:
+        list: (StatementLine, Housemate) tuples for each line reconciled
+    """
+    if lines is None:
+        lines = StatementLine.objects.all()
+    # Lock just the lines, so they cannot be reconciled by anyone else meanwhile
+    line_ids = list(
+        lines.filter(transaction__isnull=True, amount__gt=0).select_for_update().values_list('pk', flat=True)
+    )
+    lines = StatementLine.objects.filter(pk__in=line_ids).select_related('statement_import__bank_account')
+    matches = PaymentMatcher(billing_cycle=billing_cycle).match_lines(lines)
+    reconcile([(line, housemate.account) for line, housemate in matches])
+    return matches
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('hordak', '0020_auto_20171205_1424'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategorisationRule',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('priority', models.PositiveIntegerField(default=100, help_text='Rules with lower numbers are tried first')),
+                ('pattern', models.CharField(help_text="Regular expression matched (case-insensitively) against the statement line's description", max_length=255)),
+                ('min_amount', models.DecimalField(blank=True, decimal_places=2, help_text='Outgoing statement lines have negative amounts', max_digits=13, null=True)),
+                ('max_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=13, null=True)),
+                ('enabled', models.BooleanField(default=True)),
+                ('account', models.ForeignKey(help_text='Matching lines will be reconciled to this account', on_delete=django.db.models.deletion.CASCADE, related_name='categorisation_rules', to='hordak.Account')),
+            ],
+            options={
+                'ordering': ['priority', 'pk'],
+            },
+        ),
+    ]
@@ -1,3 +1,58 @@
+import re
+
+from django.core.exceptions import ValidationError
 from django.db import models
 
-# Create your models here.
+# Named groups, backreferences and conditional groups. These cannot be used within the
+# combined pattern of all rules (see swiftwind.transactions.categorisation), as there
+# the group names & numbers of each rule's pattern are no longer its own
+UNSUPPORTED_PATTERN = re.compile(r'\(\?P[<=]|\(\?\(|(?<!\\)(?:\\\\)*\\[1-9]')
+
+
+class CategorisationRuleQuerySet(models.QuerySet):
+
+    def enabled(self):
+        return self.filter(enabled=True)
+
+
+class CategorisationRule(models.Model):
+    """Reconcile statement lines matching a pattern to an account
+
+    Rules are applied in order of priority by
+    :func:`swiftwind.transactions.categorisation.categorise()`, and the
+    first matching rule is used.
+    """
+    priority = models.PositiveIntegerField(default=100, help_text='Rules with lower numbers are tried first')
+    pattern = models.CharField(max_length=255,
+                               help_text='Regular expression matched (case-insensitively) against the '
+                                         'statement line\'s description')
+    min_amount = models.DecimalField(max_digits=13, decimal_places=2, blank=True, null=True,
+                                     help_text='Outgoing statement lines have negative amounts')
+    max_amount = models.DecimalField(max_digits=13, decimal_places=2, blank=True, null=True)
+    account = models.ForeignKey('hordak.Account', related_name='categorisation_rules', on_delete=models.CASCADE,
+                                help_text='Matching lines will be reconciled to this account')
+    enabled = models.BooleanField(default=True)
+
+    objects = CategorisationRuleQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['priority', 'pk']
+
+    def __str__(self):
+        return '{} -> {}'.format(self.pattern, self.account.name)
+
+    def clean(self):
+        try:
+            re.compile(self.pattern)
+        except re.error as e:
+            raise ValidationError({'pattern': 'Invalid regular expression: {}'.format(e)})
+        if UNSUPPORTED_PATTERN.search(self.pattern):
+            raise ValidationError({'pattern': 'Named groups, backreferences and conditional groups are not supported'})
+        if self.min_amount is not None and self.max_amount is not None and self.min_amount > self.max_amount:
+            raise ValidationError({'max_amount': 'Must be greater than the minimum amount'})
+
+    def matches_amount(self, amount):
+        return (
+            (self.min_amount is None or amount >= self.min_amount) and
+            (self.max_amount is None or amount <= self.max_amount)
+        )
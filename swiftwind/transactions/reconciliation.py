@@ -0,0 +1,46 @@
+from django.db import connection, transaction
+from moneyed import Money
+
+from hordak.models import Leg, Transaction
+
+
+@transaction.atomic()
+def reconcile(lines_and_accounts):
+    """Reconcile many statement lines at once
+
+    Equivalent to calling ``StatementLine.create_transaction(account)`` for
+    each line, but the transactions and legs are created in bulk, and the
+    lines are updated with a single query.
+
+    Args:
+        lines_and_accounts (list): (StatementLine, Account) tuples. Each line's
+                                   statement import & bank account should be
+                                   selected already.
+    """
+    if not lines_and_accounts:
+        return
+
+    transactions = Transaction.objects.bulk_create([
+        Transaction(date=line.date, description=line.description)
+        for line, account in lines_and_accounts
+    ])
+
+    legs = []
+    for (line, account), transaction_ in zip(lines_and_accounts, transactions):
+        bank_account = line.statement_import.bank_account
+        amount = Money(line.amount, bank_account.currencies[0])
+        # As per StatementLine.create_transaction()
+        legs.append(Leg(transaction=transaction_, account=bank_account, amount=-amount))
+        legs.append(Leg(transaction=transaction_, account=account, amount=amount))
+    Leg.objects.bulk_create(legs)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "UPDATE hordak_statementline SET transaction_id = v.transaction_id "
+            "FROM (VALUES {}) AS v (id, transaction_id) "
+            "WHERE hordak_statementline.id = v.id".format(', '.join(['(%s, %s)'] * len(lines_and_accounts))),
+            [value for (line, account), transaction_ in zip(lines_and_accounts, transactions)
+             for value in (line.pk, transaction_.pk)]
+        )
+    for (line, account), transaction_ in zip(lines_and_accounts, transactions):
+        line.transaction = transaction_
@@ -1,3 +1,191 @@
+from datetime import date
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
 from django.test import TestCase
+from django.urls import reverse
+from hordak.models import Account, StatementImport, StatementLine
+from hordak.tests.utils import BalanceUtils
+from moneyed import Money
+
+from swiftwind.billing_cycle.models import BillingCycle
+from swiftwind.transactions.categorisation import RuleMatcher, categorise
+from swiftwind.transactions.matching import PaymentMatcher, match_payments
+from swiftwind.transactions.models import CategorisationRule
+from swiftwind.utilities.testing import DataProvider
+
+
+class PaymentMatchingTestCase(DataProvider, BalanceUtils, TestCase):
+
+    def setUp(self):
+        self.bank = self.account(name='Bank', type=Account.TYPES.asset, is_bank_account=True, currencies=['GBP'])
+        self.rent = self.account(name='Rent', type=Account.TYPES.liability, currencies=['GBP'])
+        self.alice = self.housemate(
+            user_kwargs=dict(first_name='Alice', last_name='Smith'), account_kwargs=dict(currencies=['GBP'])
+        )
+        self.bob = self.housemate(
+            user_kwargs=dict(first_name='Bob', last_name='Jones'), account_kwargs=dict(currencies=['GBP'])
+        )
+        self.billing_cycle = BillingCycle.objects.create(
+            date_range=(date(2000, 1, 1), date(2000, 2, 1)), transactions_created=True
+        )
+        self.billing_cycle.refresh_from_db()
+
+        # Both housemates owe money
+        self.alice.account.transfer_to(self.rent, Money(100, 'GBP'))
+        self.bob.account.transfer_to(self.rent, Money('50.50', 'GBP'))
+        self.statement_import = StatementImport.objects.create(bank_account=self.bank)
+
+    def line(self, amount, description, line_date=date(2000, 1, 10)):
+        return StatementLine.objects.create(
+            statement_import=self.statement_import,
+            date=line_date,
+            amount=Decimal(amount),
+            description=description,
+        )
+
+    def match(self, line):
+        line = StatementLine.objects.select_related('statement_import__bank_account').get(pk=line.pk)
+        housemate, _ = PaymentMatcher().match(line, 'GBP')
+        return housemate
+
+    def test_name_and_amount(self):
+        self.assertEqual(self.match(self.line('100', 'FASTER PAYMENT A SMITH')), self.alice)
+
+    def test_full_name(self):
+        self.assertEqual(self.match(self.line('12.34', 'BOB JONES rent')), self.bob)
+
+    def test_misspelt_name(self):
+        self.assertEqual(self.match(self.line('12.34', 'Alise Smyth')), self.alice)
+
+    def test_amount_only(self):
+        self.assertIsNone(self.match(self.line('100', 'FASTER PAYMENT')))
+
+    def test_amount_outside_window(self):
+        self.assertIsNone(self.match(self.line('100', 'A SMITH', line_date=date(2000, 6, 1))))
+
+    def test_outgoing(self):
+        self.assertIsNone(self.match(self.line('-100', 'Alice Smith')))
+
+    def test_ambiguous(self):
+        self.housemate(user_kwargs=dict(first_name='Alice', last_name='Smith'), account_kwargs=dict(currencies=['GBP']))
+        self.assertIsNone(self.match(self.line('12.34', 'Alice Smith')))
+
+    def test_amount_only_expected_once(self):
+        self.line('100', 'A SMITH', line_date=date(2000, 1, 10))
+        self.line('100', 'A SMITH', line_date=date(2000, 1, 11))
+        matches = match_payments()
+        self.assertEqual(len(matches), 1)
+        self.assertEqual(matches[0][0].date, date(2000, 1, 10))
+
+    def test_match_payments(self):
+        alice_line = self.line('100', 'Alice Smith')
+        bob_line = self.line('50.50', 'B JONES')
+        unmatched = self.line('20', 'Interest')
+
+        matches = match_payments()
+        self.assertEqual(len(matches), 2)
+
+        alice_line.refresh_from_db()
+        bob_line.refresh_from_db()
+        unmatched.refresh_from_db()
+        self.assertIsNotNone(alice_line.transaction)
+        self.assertIsNotNone(bob_line.transaction)
+        self.assertIsNone(unmatched.transaction)
+        self.assertEqual(alice_line.transaction.date, date(2000, 1, 10))
+
+        self.assertBalanceEqual(self.alice.account.balance(), 0)
+        self.assertBalanceEqual(self.bob.account.balance(), 0)
+        self.assertBalanceEqual(self.bank.balance(), Decimal('150.50'))
+
+        # Nothing left to match
+        self.assertEqual(match_payments(), [])
+
+
+class CategorisationTestCase(DataProvider, BalanceUtils, TestCase):
+
+    def setUp(self):
+        self.bank = self.account(name='Bank', type=Account.TYPES.asset, is_bank_account=True, currencies=['GBP'])
+        self.rent = self.account(name='Rent', type=Account.TYPES.expense, currencies=['GBP'])
+        self.food = self.account(name='Food', type=Account.TYPES.expense, currencies=['GBP'])
+        self.treats = self.account(name='Treats', type=Account.TYPES.expense, currencies=['GBP'])
+        self.statement_import = StatementImport.objects.create(bank_account=self.bank)
+
+        self.rent_rule = CategorisationRule.objects.create(pattern=r'\blandlord\b', account=self.rent, priority=1)
+        # Big shops are food, small ones are treats
+        self.food_rule = CategorisationRule.objects.create(
+            pattern='tesco|sainsbury', max_amount=Decimal('-20'), account=self.food, priority=2
+        )
+        self.treats_rule = CategorisationRule.objects.create(pattern='tesco', account=self.treats, priority=3)
+
+    def line(self, amount, description):
+        return StatementLine.objects.create(
+            statement_import=self.statement_import,
+            date=date(2000, 1, 10),
+            amount=Decimal(amount),
+            description=description,
+        )
+
+    def test_match(self):
+        matcher = RuleMatcher()
+        self.assertEqual(matcher.match(self.line('-500', 'STO LANDLORD LTD')), self.rent_rule)
+        self.assertEqual(matcher.match(self.line('-50', 'Card payment Sainsbury\'s')), self.food_rule)
+        self.assertEqual(matcher.match(self.line('-50', 'TESCO STORES')), self.food_rule)
+        self.assertIsNone(matcher.match(self.line('-50', 'Landlords Arms')))
+        self.assertIsNone(matcher.match(self.line('-5', 'Sainsburys')))
+
+    def test_match_falls_back_to_lower_priority(self):
+        self.assertEqual(RuleMatcher().match(self.line('-5', 'TESCO EXPRESS')), self.treats_rule)
+
+    def test_match_uncombinable_patterns(self):
+        # Saved without clean(), which would reject them
+        CategorisationRule.objects.create(pattern=r'(?P<r1>ref)', account=self.food, priority=4)
+        double_rule = CategorisationRule.objects.create(pattern=r'(\d)\1', account=self.treats, priority=5)
+
+        matcher = RuleMatcher()
+        self.assertIsNone(matcher.combined)
+        self.assertEqual(matcher.match(self.line('-500', 'STO LANDLORD LTD')), self.rent_rule)
+        self.assertEqual(matcher.match(self.line('-5', 'Shop 1223')), double_rule)
+        self.assertIsNone(matcher.match(self.line('-5', 'Shop 123')))
+
+    def test_clean_pattern(self):
+        for pattern in (r'(?P<name>rent)', r'(a)\1', r'(?P<a>x)(?P=a)', r'(a)?(?(1)b|c)', '(rent'):
+            with self.assertRaises(ValidationError):
+                CategorisationRule(pattern=pattern, account=self.rent).clean()
+        CategorisationRule(pattern=r'(?:rent|\\1)', account=self.rent).clean()
+
+    def test_disabled(self):
+        self.rent_rule.enabled = False
+        self.rent_rule.save()
+        self.assertIsNone(RuleMatcher().match(self.line('-500', 'STO LANDLORD LTD')))
+
+    def test_no_rules(self):
+        CategorisationRule.objects.all().delete()
+        self.line('-500', 'STO LANDLORD LTD')
+        self.assertEqual(categorise(), [])
+
+    def test_categorise(self):
+        rent_line = self.line('-500', 'STO LANDLORD LTD')
+        self.line('-50', 'TESCO STORES')
+        self.line('-5', 'TESCO EXPRESS')
+        unmatched = self.line('-10', 'Something else')
+
+        matches = categorise()
+        self.assertEqual(len(matches), 3)
+
+        rent_line.refresh_from_db()
+        unmatched.refresh_from_db()
+        self.assertIsNotNone(rent_line.transaction)
+        self.assertIsNone(unmatched.transaction)
+        self.assertBalanceEqual(self.rent.balance(), 500)
+        self.assertBalanceEqual(self.food.balance(), 50)
+        self.assertBalanceEqual(self.treats.balance(), 5)
+        self.assertBalanceEqual(self.bank.balance(), -555)
 
-# Create your tests here.
+    def test_auto_reconcile_view(self):
+        self.login()
+        line = self.line('-500', 'STO LANDLORD LTD')
+        response = self.client.post(reverse('transactions:auto_reconcile'))
+        self.assertEqual(response.status_code, 302)
+        line.refresh_from_db()
+        self.assertIsNotNone(line.transaction)
@@ -0,0 +1,7 @@
+from django.conf.urls import url
+
+from . import views
+
+urlpatterns = [
+    url(r'^auto-reconcile/$', views.AutoReconcileView.as_view(), name='auto_reconcile'),
+]
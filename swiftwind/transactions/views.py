@@ -1,3 +1,20 @@
-from django.shortcuts import render
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http.response import HttpResponseRedirect
+from django.urls import reverse
+from django.views import View
 
-# Create your views here.
+from swiftwind.transactions.categorisation import categorise
+from swiftwind.transactions.matching import match_payments
+
+
+class AutoReconcileView(LoginRequiredMixin, View):
+    """Reconcile whatever statement lines we can automatically
+
+    Housemate payments are matched first, then the categorisation
+    rules are applied to the remaining lines.
+    """
+
+    def post(self, request):
+        match_payments()
+        categorise()
+        return HttpResponseRedirect(reverse('hordak:transactions_reconcile'))
@@ -43,6 +43,8 @@ urlpatterns = [
     url(r'^billing-cycles/', include('swiftwind.billing_cycle.urls', namespace='billing_cycles')),
     url(r'^setup/', include('swiftwind.system_setup.urls', namespace='setup')),
     url(r'^settings/', include('swiftwind.settings.urls', namespace='settings')),
+    url(r'^core/', include('swiftwind.core.urls', namespace='core')),
+    url(r'^transactions/', include('swiftwind.transactions.urls', namespace='transactions')),
     url(r'^', include('swiftwind.dashboard.urls', namespace='dashboard')),
 
     url(r'^', include(hordak_urls, namespace='hordak', app_name='hordak')),
@@ -0,0 +1,99 @@
+import hashlib
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.contrib.messages import get_messages
+from django.db import connections, router
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+
+
+def get_data_version():
+    """Get a value which changes whenever any data displayed by swiftwind changes
+
+    This is a single query over small tables (the materialized balances
+    rather than the transaction legs), so it is cheap to run upon every request.
+    The unreconciled statement lines are counted using a partial index (see
+    accounts migration 0011).
+
+    Returns:
+        tuple
+    """
+    from hordak.models import Account, StatementLine
+    from swiftwind.accounts.models import AccountBalance
+    from swiftwind.billing_cycle.models import BillingCycle
+    from swiftwind.costs.models import RecurringCost
+    from swiftwind.housemates.models import Housemate
+    from swiftwind.settings.models import Settings
+
+    with connections[router.db_for_read(AccountBalance)].cursor() as cursor:
+        cursor.execute("""
+            SELECT
+                (SELECT ROW(MAX(id), COUNT(*), SUM(version))::text FROM {balance_table}),
+                (SELECT COUNT(*) FROM {statement_line_table} WHERE transaction_id IS NULL),
+                (SELECT md5(string_agg(ROW(id, name, parent_id, lft, rght)::text, ',' ORDER BY id)) FROM {account_table}),
+                (SELECT md5(string_agg(ROW(id, date_range, transactions_created, statements_sent)::text, ',' ORDER BY id))
+                    FROM {billing_cycle_table}),
+                (SELECT md5(string_agg(ROW(id, account_id, user_id)::text, ',' ORDER BY id)) FROM {housemate_table}),
+                (SELECT md5(string_agg(ROW(id, username, first_name, last_name)::text, ',' ORDER BY id)) FROM {user_table}),
+                (SELECT md5(string_agg(DISTINCT to_account_id::text, ',' ORDER BY to_account_id::text)) FROM {cost_table}),
+                (SELECT MAX(modified) FROM {settings_table})
+        """.format(
+            balance_table=AccountBalance._meta.db_table,
+            statement_line_table=StatementLine._meta.db_table,
+            account_table=Account._meta.db_table,
+            billing_cycle_table=BillingCycle._meta.db_table,
+            housemate_table=Housemate._meta.db_table,
+            user_table=get_user_model()._meta.db_table,
+            cost_table=RecurringCost._meta.db_table,
+            settings_table=Settings._meta.db_table,
+        ))
+        return cursor.fetchone()
+
+
+class ConditionalGetMixin(object):
+    """Respond with 304 Not Modified if the page has not changed
+
+    An ETag is calculated from :func:`get_data_version()` (along with anything
+    else the page depends upon) before the view does any other work. If it
+    matches the ETag the client already holds then the page is not rendered.
+
+    Pages are not cached when there are pending messages, as these would
+    otherwise never be displayed.
+    """
+
+    def get_etag_parts(self):
+        return [
+            self.request.get_full_path(),
+            self.request.user.pk,
+            self.request.META.get('CSRF_COOKIE'),
+            date.today(),
+            self.get_data_version(),
+        ]
+
+    def get_data_version(self):
+        """Get a value which changes whenever the data displayed by this page changes
+
+        Defaults to the site-wide :func:`get_data_version()`. Pages which display
+        less should override this to avoid being invalidated by unrelated changes.
+        """
+        return get_data_version()
+
+    def get_etag(self):
+        parts = '|'.join(map(str, self.get_etag_parts()))
+        return quote_etag(hashlib.md5(parts.encode('utf8')).hexdigest())
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or len(get_messages(request)):
+            return super(ConditionalGetMixin, self).dispatch(request, *args, **kwargs)
+
+        etag = self.get_etag()
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = super(ConditionalGetMixin, self).dispatch(request, *args, **kwargs)
+            if response.status_code == 200:
+                response['ETag'] = etag
+
+        # Browsers must check with us before reusing the page
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
@@ -69,6 +69,21 @@ class NestedMixin(object):
         return self.empty_form.media + self.empty_form.nested.media
 
 
+class BasePrefetchedInlineFormSet(BaseInlineFormSet):
+    """An inline formset which uses the instance's prefetched related objects
+
+    When a formset is created for each of many instances (as by NestedMixin),
+    this avoids a query per instance, so long as the related objects were
+    fetched using ``prefetch_related()``. Otherwise they are queried as normal.
+    """
+
+    def get_queryset(self):
+        accessor_name = self.fk.remote_field.get_accessor_name()
+        if accessor_name in getattr(self.instance, '_prefetched_objects_cache', {}):
+            return getattr(self.instance, accessor_name).all()
+        return super(BasePrefetchedInlineFormSet, self).get_queryset()
+
+
 class BaseNestedFormset(NestedMixin, BaseInlineFormSet):
     pass
 
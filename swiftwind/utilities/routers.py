@@ -0,0 +1,110 @@
+""" Send read-only queries to a database replica
+
+Reads only go to the replica (configured by ``SWIFTWIND_READ_REPLICA_ALIAS``)
+within a :func:`replica_reads()` block, which is used by
+:class:`ReplicaReadMixin` and the sidebar template tags. Everything else,
+including all writes and anything within ``transaction.atomic()``,
+uses the primary database.
+
+A user who has just written data may not yet see it upon the replica, so
+:class:`swiftwind.core.middleware.ReadYourWritesMiddleware` marks their
+session, and their reads stay upon the primary for a short period afterwards.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from swiftwind.core.performance import render_timed
+
+SESSION_KEY = 'swiftwind_primary_reads_until'
+
+_state = threading.local()
+
+
+def get_replica_alias():
+    return settings.SWIFTWIND_READ_REPLICA_ALIAS
+
+
+def should_use_replica(request=None):
+    """Can reads for this request be sent to the replica?
+
+    Returns false if no replica is configured, or if the request's user
+    has recently written to the primary.
+    """
+    if not get_replica_alias():
+        return False
+    session = getattr(request, 'session', None)
+    return session is None or session.get(SESSION_KEY, 0) < time.time()
+
+
+def mark_written(request):
+    """Keep the reads for this user's session on the primary for a short period"""
+    request.session[SESSION_KEY] = time.time() + settings.SWIFTWIND_READ_REPLICA_LAG
+
+
+@contextmanager
+def _reads_from(use_replica):
+    previous = getattr(_state, 'use_replica', False)
+    _state.use_replica = use_replica
+    try:
+        yield
+    finally:
+        _state.use_replica = previous
+
+
+def replica_reads(request=None):
+    """Send reads within this block to the replica (if one is available for `request`)"""
+    return _reads_from(should_use_replica(request))
+
+
+def primary_reads():
+    """Send reads within this block to the primary
+
+    Use this where data is read in order to be written, as the replica may lag behind.
+    """
+    return _reads_from(False)
+
+
+class ReadReplicaRouter(object):
+
+    def db_for_read(self, model, **hints):
+        alias = get_replica_alias()
+        if not alias or not getattr(_state, 'use_replica', False):
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # Reads within a transaction must see the transaction's writes
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica receives its schema via replication
+        if db == get_replica_alias():
+            return False
+        return None
+
+
+class ReplicaReadMixin(object):
+    """Send the view's reads to the replica
+
+    The response is rendered within the view so that the queries made
+    during rendering (such as by template tags) also use the replica.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super(ReplicaReadMixin, self).dispatch(request, *args, **kwargs)
+
+        with replica_reads(request):
+            response = super(ReplicaReadMixin, self).dispatch(request, *args, **kwargs)
+            if hasattr(response, 'render') and not response.is_rendered:
+                render_timed(request, response)
+        return response
@@ -0,0 +1,120 @@
+""" Lightweight timing of the steps within long-running operations
+
+Wrap a step in :func:`span()` to log its duration and query count to the
+``swiftwind.tracing`` logger (at debug level). For example::
+
+    with span('recurring_cost.enact', group=self.type, recurring_cost=self.pk):
+        ...
+
+Within a :func:`trace()` block all spans are also aggregated by name and
+group, giving a summary of where the time went::
+
+    with trace() as summary:
+        billing_cycle.enact_all_costs()
+    print(summary)
+
+If neither debug logging nor a trace is active then spans do nothing.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+
+from swiftwind.core.performance import QueryTimer
+
+logger = logging.getLogger('swiftwind.tracing')
+
+_state = threading.local()
+
+
+class TraceSummary(object):
+    """The total count, time & queries of each span within a trace"""
+
+    def __init__(self):
+        self.totals = OrderedDict()
+
+    def add(self, name, group, duration, queries):
+        key = (name, group)
+        count, total_duration, total_queries = self.totals.get(key, (0, 0.0, 0))
+        self.totals[key] = (count + 1, total_duration + duration, total_queries + queries)
+
+    def __bool__(self):
+        return bool(self.totals)
+
+    def as_dict(self):
+        return OrderedDict(
+            ('{}[{}]'.format(name, group) if group else name, OrderedDict([
+                ('count', count),
+                ('duration_ms', round(duration * 1000, 1)),
+                ('queries', queries),
+            ]))
+            for (name, group), (count, duration, queries) in self.totals.items()
+        )
+
+    def __str__(self):
+        lines = ['{:<60} {:>6} {:>12} {:>8}'.format('Span', 'Count', 'Time (ms)', 'Queries')]
+        for name, totals in self.as_dict().items():
+            lines.append('{:<60} {:>6} {:>12.1f} {:>8}'.format(
+                name, totals['count'], totals['duration_ms'], totals['queries']
+            ))
+        return '\n'.join(lines)
+
+
+@contextmanager
+def trace():
+    """Aggregate all spans within this block into a summary"""
+    previous = getattr(_state, 'summary', None)
+    _state.summary = summary = TraceSummary()
+    try:
+        yield summary
+    finally:
+        _state.summary = previous
+
+
+@contextmanager
+def span(name, group=None, **tags):
+    """Time the enclosed block
+
+    Args:
+        name (str): Name of this step
+        group (str): Spans are aggregated by name & group, so use this to
+                     distinguish between (for example) different types of cost
+        tags: Included in the log record, such as the ids of the objects involved
+    """
+    summary = getattr(_state, 'summary', None)
+    if summary is None and not logger.isEnabledFor(logging.DEBUG):
+        yield
+        return
+
+    start = time.perf_counter()
+    with QueryTimer() as queries:
+        yield
+    duration = time.perf_counter() - start
+
+    if summary is not None:
+        summary.add(name, group, duration, queries.count)
+    logger.debug(
+        '%s took %.1fms (%s queries)', name, duration * 1000, queries.count,
+        extra=dict(span=name, group=group, duration=duration, queries=queries.count, tags=tags),
+    )
+
+
+def traced(name, tags=None):
+    """Decorator which runs the function within a span
+
+    Args:
+        name (str): Name of the span
+        tags (callable): Called with the function's arguments, should return a
+                         dict of keyword arguments for span() (i.e. the group & tags)
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapped(*args, **kwargs):
+            if getattr(_state, 'summary', None) is None and not logger.isEnabledFor(logging.DEBUG):
+                return fn(*args, **kwargs)
+            with span(name, **(tags(*args, **kwargs) if tags else {})):
+                return fn(*args, **kwargs)
+        return wrapped
+    return decorator